@@ -18,6 +18,7 @@ from . import utilities
 from . import stores
 from .utilities import show_versions, clear_cache
 from .options import set_options
+from .prefetcher import prefetch
 from .plotters import open_dashboard as dashboard
 
 #
@@ -31,6 +32,7 @@ __all__ = (
     "show_versions",
     "dashboard",
     "clear_cache",
+    "prefetch",
     # Sub-packages,
     "utilities",
     "errors",
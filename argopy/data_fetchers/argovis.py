@@ -115,8 +115,7 @@ class ArgovisDataFetcher(ArgoDataFetcherProto):
         urls = self.url
         if isinstance(urls, str):
             urls = [urls]  # Make sure we deal with a list
-        for url in urls:
-            js = self.fs.open_json(url)
+        for js in self.fs.open_many(urls, method='json'):
             if isinstance(js, str):
                 continue
             df = self.json2dataframe(js)
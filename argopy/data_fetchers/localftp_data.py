@@ -28,7 +28,6 @@ When a request is done, we
 
 """
 import os
-from glob import glob
 import numpy as np
 import pandas as pd
 import xarray as xr
@@ -37,13 +36,16 @@ import warnings
 import getpass
 
 import multiprocessing as mp
+from functools import partial
 import distributed
 
 from .proto import ArgoDataFetcherProto
-from argopy.errors import NetCDF4FileNotFoundError
-from argopy.utilities import list_standard_variables, load_dict, mapp_dict
+from argopy.errors import NetCDF4FileNotFoundError, DataNotFound
+from argopy.utilities import list_standard_variables, list_multiprofile_file_variables, load_dict, mapp_dict
 from argopy.options import OPTIONS
 from argopy.stores import filestore, indexstore, indexfilter_wmo, indexfilter_box
+from argopy.stores.argo_gdac_catalog import get_catalog
+from argopy.stores.argo_shared_memory import with_shared_memory, start_tracker, share_dataset, attach_dataset
 
 access_points = ['wmo', 'box']
 exit_formats = ['xarray']
@@ -88,6 +90,7 @@ class LocalFTPArgoDataFetcher(ArgoDataFetcherProto):
                  cache: bool = False,
                  cachedir: str = "",
                  dimension: str = 'point',
+                 mode: str = "",
                  **kwargs):
         """ Init fetcher
 
@@ -105,6 +108,9 @@ class LocalFTPArgoDataFetcher(ArgoDataFetcherProto):
                 Main dimension of the output dataset. This can be "profile" to retrieve a collection of
                 profiles, or "point" (default) to have data as a collection of measurements.
                 This can be used to optimise performances
+            mode : str
+                User mode the data are loaded for. Use the global OPTIONS['mode'] by default.
+                Variables not used in this mode are not loaded from netcdf files.
 
         """
         self.cache = cache
@@ -113,6 +119,8 @@ class LocalFTPArgoDataFetcher(ArgoDataFetcherProto):
         self.definition = 'Local ftp Argo data fetcher'
         self.dataset_id = OPTIONS['dataset'] if ds == '' else ds
         self.local_ftp = OPTIONS['local_ftp'] if local_ftp == '' else local_ftp
+        self.mode = OPTIONS['mode'] if mode == '' else mode
+        self.PRES = None  # Pressure range [pres_min, pres_max] of the request, if any
         self.init(**kwargs)
 
     def __repr__(self):
@@ -121,12 +129,18 @@ class LocalFTPArgoDataFetcher(ArgoDataFetcherProto):
         summary.append("Domain: %s" % self.cname())
         return '\n'.join(summary)
 
+    @property
+    def catalog(self):
+        """ Catalog of the local ftp copy, saved in the cache folder with cache """
+        return get_catalog(self.local_ftp, self.fs.cachedir if self.cache else None)
+
     def _absfilepath(self, wmo: int, cyc: int = None, errors: str = 'raise') -> str:
         """ Return the absolute netcdf file path to load for a given wmo/cyc pair
 
         Based on the dataset, the wmo and the cycle requested, return the absolute path toward the file to load.
 
-        The file is searched using its expected file name pattern (following GDAC conventions).
+        The file is searched in the catalog of the local ftp, using its expected file name pattern (following GDAC
+        conventions).
 
         If more than one file are found to match the pattern, the first 1 (alphabeticaly) is returned.
 
@@ -174,8 +188,10 @@ class LocalFTPArgoDataFetcher(ArgoDataFetcherProto):
                     return os.path.sep.join([self.local_ftp, "dac", "*", str(wmo), "profiles", "*%i_%0.4d*.nc" % (wmo, cyc)])
 
         pattern = _filepathpattern(wmo, cyc)
-        lst = sorted(glob(pattern))
-        # lst = sorted(self.fs.glob(pattern))  # Much slower than the regular glob !
+        if cyc is None:
+            lst = [f for f in self.catalog.files(wmo) if os.path.basename(f) == os.path.basename(pattern)]
+        else:
+            lst = self.catalog.files(wmo, cyc)
         if len(lst) == 1:
             return lst[0]
         elif len(lst) == 0:
@@ -217,20 +233,74 @@ class LocalFTPArgoDataFetcher(ArgoDataFetcherProto):
         """ Return path to cache file for this request """
         return [self.fs.cachepath(file) for file in self.files]
 
-    def xload_multiprof(self, ncfile: str):
-        """Load one Argo multi-profile file as a collection of points
+    def _unused_variables(self):
+        """ Return the list of variables of multi-profile files that are not used by the request
+
+            These variables are excluded when files are open, so that they are never decoded nor cast.
+            In standard mode, only standard variables are used. In expert mode, variables without a profile or a
+            profile and level dimensions, like history and calibration variables, are not used.
+        """
+        if self.mode == 'standard':
+            return [v for v in list_multiprofile_file_variables() if v not in list_standard_variables()]
+        return [v for v in list_multiprofile_file_variables()
+                if v.startswith(('HISTORY_', 'SCIENTIFIC_CALIB_'))
+                or v in ['PARAMETER', 'STATION_PARAMETERS', 'DATA_TYPE', 'FORMAT_VERSION', 'HANDBOOK_VERSION',
+                         'REFERENCE_DATE_TIME', 'DATE_CREATION', 'DATE_UPDATE']]
+
+    @staticmethod
+    def _pressure_selection(ds, pres_min: float, pres_max: float):
+        """ Return the indices of profiles and the slice of levels with data in a pressure range
+
+        Only the pressure variable is read.
 
         Parameters
         ----------
+        ds: :class:`xarray.Dataset`
+            Lazily loaded collection of profiles
+        pres_min, pres_max: float
+            Pressure range
+
+        Returns
+        -------
+        tuple(np.array, slice) or None
+            Profile indices and levels slice, or None if no data are in the pressure range
+        """
+        pres = np.round(ds['PRES'].values, 1)  # Same resolution as loaded data
+        with np.errstate(invalid='ignore'):
+            inside = (pres >= pres_min) & (pres <= pres_max)
+        profiles = np.flatnonzero(inside.any(axis=1))
+        levels = np.flatnonzero(inside.any(axis=0))
+        if len(profiles) == 0:
+            return None
+        return profiles, slice(levels[0], levels[-1] + 1)
+
+    @staticmethod
+    def _load_points(fs, ncfile: str, drop_variables: list, pres: list = None):
+        """ Load one Argo multi-profile file as a collection of points, without argopy attributes
+
+        Parameters
+        ----------
+        fs: :class:`argopy.stores.filestore`
+            File store to open the file with
         ncfile: str
             Absolute path to a netcdf file to load
+        drop_variables: list(str)
+            Variables not to load
+        pres: list(float), optional
+            Pressure range [pres_min, pres_max] of the data to load
 
         Returns
         -------
-        :class:`xarray.Dataset`
-
+        :class:`xarray.Dataset` or None if no data are in the pressure range
         """
-        ds = self.fs.open_dataset(ncfile, decode_cf=1, use_cftime=0, mask_and_scale=1, engine='h5netcdf')
+        ds = fs.open_dataset(ncfile, decode_cf=1, use_cftime=0, mask_and_scale=1, engine='h5netcdf',
+                             drop_variables=drop_variables)
+
+        if pres is not None:
+            selection = LocalFTPArgoDataFetcher._pressure_selection(ds, *pres)
+            if selection is None:
+                return None
+            ds = ds.isel(N_PROF=selection[0], N_LEVELS=selection[1])  # Lazy, other variables are read once selected
 
         # Replace JULD and JULD_QC by TIME and TIME_QC
         ds = ds.rename({'JULD': 'TIME', 'JULD_QC': 'TIME_QC'})
@@ -252,26 +322,96 @@ class LocalFTPArgoDataFetcher(ArgoDataFetcherProto):
 
         ds = ds.argo.profile2point()  # Default output is a collection of points
 
+        if pres is not None:
+            with np.errstate(invalid='ignore'):
+                inside = (ds['PRES'].values >= pres[0]) & (ds['PRES'].values <= pres[1])
+            ds = ds.isel(N_POINTS=np.flatnonzero(inside))
+            ds['N_POINTS'] = np.arange(0, len(ds['N_POINTS']))
+
+        return ds[np.sort(ds.data_vars)]
+
+    def xload_multiprof(self, ncfile: str):
+        """Load one Argo multi-profile file as a collection of points
+
+        Variables not used in the user mode are not loaded. With a pressure range, only profiles and levels with data
+        in the range are read, and only points in the range are returned.
+
+        Parameters
+        ----------
+        ncfile: str
+            Absolute path to a netcdf file to load
+
+        Returns
+        -------
+        :class:`xarray.Dataset` or None if no data are in the pressure range
+
+        """
+        ds = self._load_points(self.fs, ncfile, self._unused_variables(), self.PRES)
+        if ds is None:
+            return None
         # Remove netcdf file attributes and replace them with argopy ones:
-        ds.attrs = {}
-        if self.dataset_id == 'phy':
-            ds.attrs['DATA_ID'] = 'ARGO'
-        if self.dataset_id == 'bgc':
-            ds.attrs['DATA_ID'] = 'ARGO-BGC'
-        ds.attrs['DOI'] = 'http://doi.org/10.17882/42182'
-        ds.attrs['Fetched_from'] = self.local_ftp
-        ds.attrs['Fetched_by'] = getpass.getuser()
-        ds.attrs['Fetched_date'] = pd.to_datetime('now').strftime('%Y/%m/%d')
-        ds.attrs['Fetched_constraints'] = self.cname()
-        ds.attrs['Fetched_uri'] = ncfile
-        ds = ds[np.sort(ds.data_vars)]
+        return self._add_attrs(ds, [ncfile])
 
-        return ds
+    @staticmethod
+    def _xload_shared(files: list, options: dict):
+        """ Load multi-profile files in a worker process, and return their points in shared memory
+
+        Parameters
+        ----------
+        files: list(str)
+            Absolute paths to netcdf files to load
+        options: dict
+            File store options (``cache`` and ``cachedir``), ``drop_variables`` and ``pres`` range
+
+        Returns
+        -------
+        dict or None if no data are in the pressure range
+            Description of the dataset, see :func:`argopy.stores.argo_shared_memory.share_dataset`. Without shared
+            memory (python < 3.8), the :class:`xarray.Dataset` itself.
+        """
+        fs = filestore(cache=options['cache'], cachedir=options['cachedir'])
+        results = [LocalFTPArgoDataFetcher._load_points(fs, f, options['drop_variables'], options['pres'])
+                   for f in files]
+        results = [r for r in results if r is not None]
+        if len(results) == 0:
+            return None
+        ds = results[0] if len(results) == 1 else LocalFTPArgoDataFetcher._concat(results)
+        return share_dataset(ds) if with_shared_memory else ds
+
+    def _pool_load(self, processes: int = None):
+        """ Load files with a pool of processes
+
+        Workers receive file paths and options only, not the fetcher. Each worker loads a chunk of files and returns
+        its points in a shared memory block, copied by the parent process without any serialisation. Without shared
+        memory (python < 3.8), points are pickled.
+
+        Returns
+        -------
+        list(:class:`xarray.Dataset`)
+        """
+        processes = mp.cpu_count() if processes is None else processes
+        options = {'cache': self.cache, 'cachedir': self.fs.cachedir,
+                   'drop_variables': self._unused_variables(), 'pres': self.PRES}
+        size = max(1, -(-len(self.files) // (4 * processes)))  # About 4 chunks per worker, to balance the load
+        chunks = [self.files[i:i + size] for i in range(0, len(self.files), size)]
+
+        if with_shared_memory:
+            # Workers share the resource tracker of this process, that releases blocks when they are unlinked here:
+            start_tracker()
+        results = []
+        with mp.Pool(processes) as pool:
+            for shared in pool.imap(partial(self._xload_shared, options=options), chunks):
+                if shared is not None:
+                    results.append(attach_dataset(shared) if with_shared_memory else shared)
+        for f in self.files:
+            self.fs.register(f)
+        return results
 
     def open_mfdataset(self, **kwargs):
         """ Load data as efficiently as possible
 
         This allows to manage parallel retrieval of multiple files with a Dask client or a Multiprocessing pool.
+        With a Multiprocessing pool, data are returned by workers through shared memory.
 
         Returns
         -------
@@ -280,7 +420,10 @@ class LocalFTPArgoDataFetcher(ArgoDataFetcherProto):
         client = None if 'client' not in kwargs else kwargs['client']
 
         if len(self.files) == 1:
-            return self.xload_multiprof(self.files[0])
+            ds = self.xload_multiprof(self.files[0])
+            if ds is None:
+                raise DataNotFound("No data found in the pressure range %s" % self.PRES)
+            return ds
 
         else:
             warnings.warn("Fetching more than one file in a single request is not yet fully reliable. "
@@ -293,8 +436,7 @@ class LocalFTPArgoDataFetcher(ArgoDataFetcherProto):
                     results = client.gather(futures)
                 else:
                     # Use multiprocessing Pool
-                    with mp.Pool() as pool:
-                        results = pool.map(self.xload_multiprof, self.files)
+                    results = self._pool_load()
             else:
                 results = []
                 for f in self.files:
@@ -302,15 +444,91 @@ class LocalFTPArgoDataFetcher(ArgoDataFetcherProto):
 
         results = [r for r in results if r is not None]  # Only keep non-empty results
         if len(results) > 0:
-            # ds = xr.concat(results, dim='N_POINTS', data_vars='all', coords='all', compat='equals')
-            ds = xr.concat(results, dim='N_POINTS', data_vars='all', coords='all', compat='override')
-            ds['N_POINTS'] = np.arange(0, len(ds['N_POINTS']))  # Re-index to avoid duplicate values
-            ds = ds.set_coords('N_POINTS')
-            ds = ds.sortby('TIME')
-            return ds
+            return self._concat(results)
+        elif self.PRES is not None:
+            raise DataNotFound("No data found in the pressure range %s" % self.PRES)
         else:
             raise ValueError("CAN'T FETCH ANY DATA !")
 
+    @staticmethod
+    def _concat(results: list):
+        """ Concatenate collections of points, sorted by time """
+        # ds = xr.concat(results, dim='N_POINTS', data_vars='all', coords='all', compat='equals')
+        ds = xr.concat(results, dim='N_POINTS', data_vars='all', coords='all', compat='override')
+        ds['N_POINTS'] = np.arange(0, len(ds['N_POINTS']))  # Re-index to avoid duplicate values
+        ds = ds.set_coords('N_POINTS')
+        ds = ds.sortby('TIME')
+        return ds
+
+    def _add_attrs(self, ds, files: list):
+        """ Remove netcdf file attributes and replace them with argopy ones """
+        ds.attrs = {}
+        if self.dataset_id == 'phy':
+            ds.attrs['DATA_ID'] = 'ARGO'
+        if self.dataset_id == 'bgc':
+            ds.attrs['DATA_ID'] = 'ARGO-BGC'
+        ds.attrs['DOI'] = 'http://doi.org/10.17882/42182'
+        ds.attrs['Fetched_from'] = self.local_ftp
+        ds.attrs['Fetched_by'] = getpass.getuser()
+        ds.attrs['Fetched_date'] = pd.to_datetime('now').strftime('%Y/%m/%d')
+        ds.attrs['Fetched_constraints'] = self.cname()
+        if len(files) == 1:
+            ds.attrs['Fetched_uri'] = files[0]
+        return ds
+
+    def file_batches(self, batch_size: int = 1):
+        """ Return the list of files to load, grouped by batches of floats
+
+        Parameters
+        ----------
+        batch_size: int
+            Number of floats in a batch
+
+        Returns
+        -------
+        list(list(str))
+        """
+        floats = {}
+        for file in self.files:
+            folder = os.path.dirname(file)
+            if os.path.basename(folder) == 'profiles':
+                folder = os.path.dirname(folder)
+            floats.setdefault(os.path.basename(folder), []).append(file)  # Float folders are named after the WMO
+        floats = list(floats.values())
+        return [sum(floats[i:i + batch_size], []) for i in range(0, len(floats), batch_size)]
+
+    def iter_xarray(self, batch_size: int = 1, errors: str = 'raise'):
+        """ Load Argo data by batches of floats, and yield a xarray.Dataset for each batch
+
+        Only the data of one batch are in memory at a time. Each dataset is sorted by time, and batches are in the
+        order floats are requested, or found in the index for a region. Batches without data are skipped.
+
+        Parameters
+        ----------
+        batch_size: int (1)
+            Number of floats in a batch
+        errors: {'raise','ignore'}, optional
+            If 'raise' (default), raises a NetCDF4FileNotFoundError error if any of the requested
+            files cannot be found. If 'ignore', file not found is skipped when fetching data.
+
+        Returns
+        -------
+        generator of :class:`xarray.Dataset`
+        """
+        if not isinstance(batch_size, int) or batch_size < 1:
+            raise ValueError("batch_size must be a positive integer")
+        self.list_argo_files(errors=errors)
+        return self._iter_batches(batch_size)
+
+    def _iter_batches(self, batch_size):
+        for files in self.file_batches(batch_size):
+            results = [r for r in map(self.xload_multiprof, files) if r is not None]
+            if len(results) == 0:
+                continue
+            ds = results[0] if len(results) == 1 else self._concat(results)
+            del results  # Only keep the batch dataset in memory while it is used
+            yield self._add_attrs(ds, files)
+
     def to_xarray(self, errors: str = 'raise', client=None):
         """ Load Argo data and return a xarray.Dataset
 
@@ -333,19 +551,7 @@ class LocalFTPArgoDataFetcher(ArgoDataFetcherProto):
         ds = self.open_mfdataset(client=client)
 
         # Remove netcdf file attributes and replace them with argopy ones:
-        ds.attrs = {}
-        if self.dataset_id == 'phy':
-            ds.attrs['DATA_ID'] = 'ARGO'
-        if self.dataset_id == 'bgc':
-            ds.attrs['DATA_ID'] = 'ARGO-BGC'
-        ds.attrs['DOI'] = 'http://doi.org/10.17882/42182'
-        ds.attrs['Fetched_from'] = self.local_ftp
-        ds.attrs['Fetched_by'] = getpass.getuser()
-        ds.attrs['Fetched_date'] = pd.to_datetime('now').strftime('%Y/%m/%d')
-        ds.attrs['Fetched_constraints'] = self.cname()
-        if len(self.files) == 1:
-            ds.attrs['Fetched_uri'] = self.files[0]
-        return ds
+        return self._add_attrs(ds, self.files)
 
     def filter_data_mode(self, ds, **kwargs):
         ds = ds.argo.filter_data_mode(errors='ignore', **kwargs)
@@ -419,12 +625,14 @@ class Fetch_wmo(LocalFTPArgoDataFetcher):
         """
         if not hasattr(self, '_list_of_argo_files'):
             self._list_of_argo_files = []
+            self.catalog.refresh()
             for wmo in self.WMO:
                 if self.CYC is None:
                     self._list_of_argo_files.append(self._absfilepath(wmo, errors=errors))
                 else:
                     for cyc in self.CYC:
                         self._list_of_argo_files.append(self._absfilepath(wmo, cyc, errors=errors))
+            self.catalog.save()
         return self
 
 
@@ -440,10 +648,11 @@ class Fetch_box(LocalFTPArgoDataFetcher):
                 The box domain to load all Argo data for:
                 box = [lon_min, lon_max, lat_min, lat_max, pres_min, pres_max, datim_min, datim_max]
         """
-        # We use a full domain definition (x, y, z, t) as argument for compatibility with the other fetchers
-        # but we work only with x, y and t.
+        # We use a full domain definition (x, y, z, t) as argument for compatibility with the other fetchers.
+        # The index is searched with x, y and t, and the pressure range is applied when loading profiles.
         if len(box) not in [6, 8]:
             raise ValueError('Box must be 6 or 8 length')
+        self.PRES = [box[4], box[5]]
 
         if len(box) == 6:
             self.BOX = [box[ii] for ii in [0, 1, 2, 3]]
@@ -464,11 +673,11 @@ class Fetch_box(LocalFTPArgoDataFetcher):
         """ Return a unique string defining the constraints """
         BOX = self.BOX
         if len(self.BOX) == 4:
-            boxname = ("[x=%0.2f/%0.2f; y=%0.2f/%0.2f]") % \
-                      (BOX[0], BOX[1], BOX[2], BOX[3])
+            boxname = ("[x=%0.2f/%0.2f; y=%0.2f/%0.2f; z=%0.1f/%0.1f]") % \
+                      (BOX[0], BOX[1], BOX[2], BOX[3], self.PRES[0], self.PRES[1])
         elif len(self.BOX) == 6:
-            boxname = ("[x=%0.2f/%0.2f; y=%0.2f/%0.2f; t=%s/%s]") % \
-                      (BOX[0], BOX[1], BOX[2], BOX[3],
+            boxname = ("[x=%0.2f/%0.2f; y=%0.2f/%0.2f; z=%0.1f/%0.1f; t=%s/%s]") % \
+                      (BOX[0], BOX[1], BOX[2], BOX[3], self.PRES[0], self.PRES[1],
                        self._format(BOX[4], 'tim'), self._format(BOX[5], 'tim'))
         boxname = self.dataset_id + "_" + boxname
         return boxname
@@ -491,9 +700,10 @@ class Fetch_box(LocalFTPArgoDataFetcher):
                 # Ok, we found profiles in the index file,
                 # so now we can make sure these files exist:
                 lst = list(df_index['file'])
+                catalog = self.catalog.refresh()
                 for file in lst:
                     abs_file = os.path.sep.join([self.local_ftp, "dac", file])
-                    if self.fs.exists(abs_file):
+                    if catalog.exists(file):
                         self._list_of_argo_files.append(abs_file)
                     elif errors == 'raise':
                         raise NetCDF4FileNotFoundError(abs_file)
@@ -501,4 +711,5 @@ class Fetch_box(LocalFTPArgoDataFetcher):
                         # Otherwise remain silent/ignore
                         # todo should raise a warning instead ?
                         return None
+                catalog.save()
         return self
\ No newline at end of file
@@ -50,6 +50,14 @@ exit_formats = ['xarray', 'dataframe']
 dataset_ids = ['phy', 'bgc']  # First is default
 
 
+def profiler_code(x):
+    """ Return the integer code of a profiler type from the index, or '?' if it is missing or not a number """
+    try:
+        return int(x)
+    except (TypeError, ValueError):
+        return "?"
+
+
 class LocalFTPArgoIndexFetcher(ABC):
     """ Manage access to Argo index from a local copy of GDAC ftp
 
@@ -126,7 +134,7 @@ class LocalFTPArgoIndexFetcher(ABC):
         df = df.rename(columns={"institution": "institution_code", "tmp1": "institution"})
 
         profiler_dictionnary = load_dict('profilers')
-        df['profiler'] = df.profiler_type.apply(lambda x: mapp_dict(profiler_dictionnary, int(x)))
+        df['profiler'] = df.profiler_type.apply(lambda x: mapp_dict(profiler_dictionnary, profiler_code(x)))
         df = df.rename(columns={"profiler_type": "profiler_code"})
 
         return df
@@ -135,6 +143,31 @@ class LocalFTPArgoIndexFetcher(ABC):
         """ Load Argo index and return a xarray Dataset """
         return self.to_dataframe().to_xarray()
 
+    def aggregate(self, by: str):
+        """ Return the number of profiles in the full index per: 'dac', 'institution', 'profiler', 'ocean', 'month'
+            or 'wmo'
+
+            Counts are precomputed with the index, so this does not search the index.
+
+            Returns
+            -------
+            :class:`pandas.Series` with the number of profiles. For 'wmo', a :class:`pandas.DataFrame` with the number
+            of profiles and the first and last profile dates of each float.
+        """
+        if by == 'institution':
+            counts = self.fs.aggregate('institution')
+            institution_dictionnary = load_dict('institutions')
+            names = [mapp_dict(institution_dictionnary, x) for x in counts.index]
+            counts = counts.groupby(pd.Index(names, name='institution')).sum()
+        elif by == 'profiler':
+            counts = self.fs.aggregate('profiler_type')
+            profiler_dictionnary = load_dict('profilers')
+            names = [mapp_dict(profiler_dictionnary, profiler_code(x)) for x in counts.index]
+            counts = counts.groupby(pd.Index(names, name='profiler')).sum()
+        else:
+            counts = self.fs.aggregate(by)
+        return counts
+
     def clear_cache(self):
         """ Remove cache files and entries from resources open with this fetcher """
         return self.fs.clear_cache()
@@ -27,6 +27,11 @@ class CacheFileNotFound(FileNotFoundError):
     pass
 
 
+class OfflineCacheMiss(CacheFileNotFound):
+    """ Raise when a remote file is requested in offline mode and is not in cache """
+    pass
+
+
 class FileSystemHasNoCache(ValueError):
     """ Raise when trying to access a cache system not implemented """
     pass
@@ -79,6 +84,13 @@ class ErddapServerError(ValueError):
     pass
 
 
+class ServerUnavailable(ConnectionError):
+    """
+    Raise this when requests to a server are suspended after too many failures
+    """
+    pass
+
+
 class InvalidDashboard(ValueError):
     """
     Raise this when trying to work with a 3rd party online service to display float information
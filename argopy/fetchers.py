@@ -7,12 +7,14 @@ The facade should be able to work with all available data access point,
 
 """
 
+import inspect
 import warnings
 
 from argopy.options import OPTIONS, _VALIDATORS
 from .errors import InvalidFetcherAccessPoint, InvalidFetcher
 from .utilities import list_available_data_src, list_available_index_src
 from .plotters import plot_trajectory, plot_dac, plot_profilerType
+from .stores import resultcache
 AVAILABLE_DATA_SOURCES = list_available_data_src()
 AVAILABLE_INDEX_SOURCES = list_available_index_src()
 
@@ -94,9 +96,17 @@ class ArgoDataFetcher(object):
         if ds is None:
             ds = Fetchers.dataset_ids[0]
         self.fetcher_options = {**{'ds': ds}, **fetcher_kwargs}
+        if self._src == 'localftp':
+            self.fetcher_options['mode'] = self._mode  # Variables not used in this mode are not loaded
         self.postproccessor = self.__empty_processor
         self._AccessPoint = None
 
+        # With cache, post-processed datasets are cached too:
+        self._results = None
+        self._result_keys = []  # Will hold keys of datasets cached by this fetcher
+        if fetcher_kwargs.get('cache', False):
+            self._results = resultcache(fetcher_kwargs.get('cachedir', ''))
+
         # Dev warnings
         # Todo Clean-up before each release
         if self._dataset_id == 'bgc' and self._mode == 'standard':
@@ -213,10 +223,61 @@ class ArgoDataFetcher(object):
         #                          ",".join(self.Fetchers.keys()))
         if self._AccessPoint not in self.valid_access_points:
             raise InvalidFetcherAccessPoint(" Initialize an access point (%s) first." % ",".join(self.Fetchers.keys()))
+        if self._results is not None:
+            key = self._result_key(**kwargs)
+            self._result_keys.append(key)
+            xds = self._results.get(key)
+            if xds is not None:
+                return xds
         xds = self.fetcher.to_xarray(**kwargs)
         xds = self.postproccessor(xds)
+        if self._results is not None:
+            self._results.put(key, xds)
         return xds
 
+    def iter_xarray(self, batch_size: int = 1, **kwargs):
+        """ Fetch data by batches of floats, and yield a post-processed xarray.DataSet for each batch
+
+            Only the data of one batch are in memory at a time, so that large requests can be processed as a stream.
+
+            Parameters
+            ----------
+            batch_size: int (1)
+                Number of floats in a batch
+
+            Returns
+            -------
+            generator of :class:`xarray.DataSet`
+        """
+        if self._AccessPoint not in self.valid_access_points:
+            raise InvalidFetcherAccessPoint(" Initialize an access point (%s) first." % ",".join(self.Fetchers.keys()))
+        if not hasattr(self.fetcher, 'iter_xarray'):
+            raise InvalidFetcher("Fetching data by batches is not available with '%s' src" % self._src)
+        batches = self.fetcher.iter_xarray(batch_size=batch_size, **kwargs)
+        return (self.postproccessor(xds) for xds in batches)
+
+    _volatile_kwargs = ['client']
+    """ Arguments of the fetcher to_xarray method that don't change the data it returns """
+
+    def _result_key(self, **kwargs):
+        """ Return the key of the post-processed dataset of the request in the cache
+
+            Only fetcher options and to_xarray arguments changing the data are used, with default values for missing
+            arguments, so that the same data always have the same key.
+        """
+        options = {k: v for k, v in self.fetcher_options.items() if k not in ['cache', 'cachedir']}
+        if self._src == 'localftp' and not options.get('local_ftp', ''):
+            options['local_ftp'] = OPTIONS['local_ftp']
+        try:
+            arguments = inspect.signature(self.fetcher.to_xarray).bind(**kwargs)
+            arguments.apply_defaults()
+            kwargs = arguments.arguments
+        except TypeError:  # Invalid arguments, to be reported by the fetcher
+            pass
+        kwargs = {k: v for k, v in kwargs.items() if k not in self._volatile_kwargs}
+        return resultcache.key(self._src, self._dataset_id, self._mode, self._AccessPoint, self.fetcher.cname(),
+                               **{**options, **kwargs})
+
     def to_dataframe(self, **kwargs):
         """  Fetch and return data as pandas.Dataframe """
         if self._AccessPoint not in self.valid_access_points:
@@ -225,6 +286,13 @@ class ArgoDataFetcher(object):
 
     def clear_cache(self):
         """ Clear fetcher cached data """
+        if self._results is not None:
+            keys = self._result_keys
+            if self._AccessPoint in self.valid_access_points:
+                keys = keys + [self._result_key()]
+            for key in keys:
+                self._results.remove(key)
+            self._result_keys = []
         return self.fetcher.clear_cache()
 
 
@@ -360,6 +428,28 @@ class ArgoIndexFetcher(object):
             raise InvalidFetcherAccessPoint(" Initialize an access point (%s) first." % ",".join(self.Fetchers.keys()))
         return self.to_dataframe().to_csv(file)
 
+    def aggregate(self, by: str):
+        """ Return the number of profiles in the full index, per DAC, institution, profiler, ocean, month or float
+
+            Counts are precomputed with the index, so no index search is needed. An access point is not required.
+
+            Parameters
+            ----------
+            by: str
+                This can be: 'dac', 'institution', 'profiler', 'ocean', 'month' or 'wmo'
+
+            Returns
+            -------
+            :class:`pandas.Series` with the number of profiles. For 'wmo', a :class:`pandas.DataFrame` with the number
+            of profiles and the first and last profile dates of each float.
+        """
+        fetcher = self.fetcher
+        if fetcher is None:  # Any access point gives access to the full index
+            fetcher = self.Fetchers['float'](WMO=[], **self.fetcher_options)
+        if not hasattr(fetcher, 'aggregate'):
+            raise InvalidFetcherAccessPoint("'aggregate' not available with '%s' src" % self._src)
+        return fetcher.aggregate(by)
+
     def plot(self, ptype='trajectory'):
         """ Create custom plots from index
 
@@ -367,12 +457,17 @@ class ArgoIndexFetcher(object):
             ----------
             ptype: str
                 Type of plot to generate. This can be: 'trajectory',' profiler', 'dac'.
+                Without an access point, 'profiler' and 'dac' plots are made for the full index, from precomputed
+                counts.
 
             Returns
             -------
             fig : :class:`matplotlib.pyplot.figure.Figure`
                 Figure instance
         """
+        if not self.fetcher and ptype in ['dac', 'profiler']:
+            return plot_dac(self.aggregate('institution')) if ptype == 'dac' \
+                else plot_profilerType(self.aggregate('profiler'))
         idx = self.to_dataframe()
         if ptype == 'dac':
             return plot_dac(idx)
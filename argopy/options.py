@@ -10,6 +10,7 @@ This module manage options of the package
 # https://github.com/pydata/xarray/blob/cafab46aac8f7a073a32ec5aa47e213a9810ed54/xarray/core/options.py
 """
 import os
+import importlib.util
 
 # Define option names as seen by users:
 DATA_SOURCE = 'src'
@@ -17,18 +18,39 @@ LOCAL_FTP = 'local_ftp'
 DATASET = 'dataset'
 DATA_CACHE = 'cachedir'
 USER_LEVEL = 'mode'
+INDEX_ENGINE = 'index_engine'
+INDEX_WORKERS = 'index_workers'
+CACHE_POLICY = 'cache_policy'
+CACHE_MAX_BYTES = 'cache_max_bytes'
+CACHE_MAX_AGE = 'cache_max_age'
+HTTP_CONCURRENCY = 'http_concurrency'
+CACHE_COMPRESSION = 'cache_compression'
+OFFLINE = 'offline'
+HTTP_RETRIES = 'http_retries'
 
 # Define the list of available options and default values:
 OPTIONS = {DATA_SOURCE: 'erddap',
            LOCAL_FTP: '.',
            DATASET: 'phy',
            DATA_CACHE: os.path.expanduser(os.path.sep.join(["~", ".cache", "argopy"])),
-           USER_LEVEL: 'standard'}
+           USER_LEVEL: 'standard',
+           INDEX_ENGINE: 'numpy',
+           INDEX_WORKERS: 1,
+           CACHE_POLICY: 'lru',
+           CACHE_MAX_BYTES: 0,
+           CACHE_MAX_AGE: 86400,
+           HTTP_CONCURRENCY: 10,
+           CACHE_COMPRESSION: None,
+           OFFLINE: False,
+           HTTP_RETRIES: 3}
 
 # Define the list of possible values
 _DATA_SOURCE_LIST = frozenset(["erddap", "localftp", "argovis"])
 _DATASET_LIST = frozenset(["phy", "bgc", "ref"])
 _USER_LEVEL_LIST = frozenset(["standard", "expert"])
+_INDEX_ENGINE_LIST = frozenset(["text", "numpy"])
+_CACHE_POLICY_LIST = frozenset(["lru", "lfu"])
+_CACHE_COMPRESSION_MODULES = {"gzip": "gzip", "bz2": "bz2", "lzma": "lzma", "zstd": "zstandard", "lz4": "lz4"}
 
 
 # Define how to validate options:
@@ -36,11 +58,40 @@ def _positive_integer(value):
     return isinstance(value, int) and value > 0
 
 
+def _non_negative_integer(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def _non_negative_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0
+
+
+def _boolean(value):
+    return isinstance(value, bool)
+
+
+def _cache_compression(value):
+    if value is None:
+        return True
+    if value not in _CACHE_COMPRESSION_MODULES:
+        return False
+    return importlib.util.find_spec(_CACHE_COMPRESSION_MODULES[value]) is not None  # Codec package is installed
+
+
 _VALIDATORS = {
     DATA_SOURCE: _DATA_SOURCE_LIST.__contains__,
     LOCAL_FTP: os.path.exists,
     DATASET: _DATASET_LIST.__contains__,
-    USER_LEVEL: _USER_LEVEL_LIST.__contains__
+    USER_LEVEL: _USER_LEVEL_LIST.__contains__,
+    INDEX_ENGINE: _INDEX_ENGINE_LIST.__contains__,
+    INDEX_WORKERS: _positive_integer,
+    CACHE_POLICY: _CACHE_POLICY_LIST.__contains__,
+    CACHE_MAX_BYTES: _non_negative_number,
+    CACHE_MAX_AGE: _non_negative_number,
+    HTTP_CONCURRENCY: _positive_integer,
+    CACHE_COMPRESSION: _cache_compression,
+    OFFLINE: _boolean,
+    HTTP_RETRIES: _non_negative_integer
 }
 
 
@@ -65,6 +116,40 @@ class set_options:
     - `mode`: User mode. This can be `standard` or `expert`.
       Default: `standard`
 
+    - `index_engine`: Engine used to search Argo index files. This can be `numpy` (vectorized search
+      on a columnar copy of the index) or `text` (line by line scan of the index file).
+      Default: `numpy`
+
+    - `index_workers`: Number of processes used to scan Argo index files with the `text` engine.
+      Default: `1`
+
+    - `cache_policy`: Order in which files are evicted from the cache when it is full. This can be `lru`
+      (least recently used first) or `lfu` (least frequently used first).
+      Default: `lru`
+
+    - `cache_max_bytes`: Maximum size of the cache directory, checked each time a file is cached. Use `0` for
+      no limit.
+      Default: `0`
+
+    - `cache_max_age`: Number of seconds after which a cached file is downloaded again. Use `0` to never expire
+      cached files.
+      Default: `86400`
+
+    - `http_concurrency`: Maximum number of simultaneous http requests sent by `httpstore.open_many`.
+      Default: `10`
+
+    - `cache_compression`: Codec used to compress new files in the cache. This can be `None`, `gzip`, `bz2`, `lzma`,
+      or `zstd` and `lz4` if the zstandard and lz4 packages are installed.
+      Default: `None`
+
+    - `offline`: Resolve all remote requests of stores from the cache only, without network access. Requests not in
+      the cache raise an `OfflineCacheMiss` error, and cached files never expire.
+      Default: `False`
+
+    - `http_retries`: Maximum number of retries of http requests failing with a server error or a reset
+      connection, after an exponential backoff delay. Use `0` to never retry.
+      Default: `3`
+
     You can use `set_options` either as a context manager:
     ```
         >>> import argopy
@@ -8,6 +8,7 @@
 #
 
 import numpy as np
+import pandas as pd
 import warnings
 from argopy.errors import InvalidDashboard
 
@@ -236,24 +237,32 @@ def plot_trajectory(idx):
 
 @warnUnless(with_matplotlib and with_cartopy and with_seaborn, "requires matplotlib, cartopy and seaborn installed")
 def plot_dac(idx):
-    """ Histogram of DAC for an index dataframe """
+    """ Histogram of DAC for an index dataframe, or for precomputed number of profiles per institution """
     if not with_seaborn:
         raise BaseException("This function requires seaborn")
     fig = plt.figure(figsize=(10, 5))
-    mind = idx.groupby('institution').size().sort_values(ascending=False).index
-    sns.countplot(y='institution', data=idx, order=mind)
+    if isinstance(idx, pd.Series):
+        counts = idx.sort_values(ascending=False)
+        sns.barplot(x=counts.values, y=counts.index.astype(str), orient='h')
+    else:
+        mind = idx.groupby('institution').size().sort_values(ascending=False).index
+        sns.countplot(y='institution', data=idx, order=mind)
     plt.ylabel('number of profiles')
     return fig
 
 
 @warnUnless(with_matplotlib and with_cartopy and with_seaborn, "requires matplotlib, cartopy and seaborn installed")
 def plot_profilerType(idx):
-    """ Histogram of profile types for an index dataframe """
+    """ Histogram of profile types for an index dataframe, or for precomputed number of profiles per profiler """
     if not with_seaborn:
         raise BaseException("This function requires seaborn")
     fig = plt.figure(figsize=(10, 5))
-    mind = idx.groupby('profiler_type').size().sort_values(ascending=False).index
-    sns.countplot(y='profiler_type', data=idx, order=mind)
+    if isinstance(idx, pd.Series):
+        counts = idx.sort_values(ascending=False)
+        sns.barplot(x=counts.values, y=counts.index.astype(str), orient='h')
+    else:
+        mind = idx.groupby('profiler_type').size().sort_values(ascending=False).index
+        sns.countplot(y='profiler_type', data=idx, order=mind)
     plt.xlabel('number of profiles')
     plt.ylabel('')
     return fig
@@ -0,0 +1,255 @@
+#!/bin/env python
+# -*coding: UTF-8 -*-
+"""
+Pre-warm the argopy cache
+
+Fetch a list of floats and/or regions ahead of time, in parallel, so that later requests are served from cache only.
+Each request is fetched with a cached data fetcher, hence both raw responses (stores cache) and post-processed datasets
+(results cache) are saved. A journal of completed requests is kept in the cache folder: running the same pre-warming
+again, for instance after an interruption, skips requests already done.
+
+From the command line:
+
+    argopy-prefetch --wmo 6902746 6902747 --src erddap --ds phy --workers 4
+    python -m argopy.prefetcher --box -75 -45 20 30 0 100 2011-01 2011-06 --cachedir /data/argopy
+
+"""
+import os
+import sys
+import json
+import hashlib
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from argopy.options import OPTIONS
+from argopy.fetchers import ArgoDataFetcher
+from argopy.errors import DataNotFound
+
+
+class prefetchjournal():
+    """ Journal of completed pre-warming requests
+
+    Requests are saved as json files named after the sha of the request, in the "prefetch" sub-folder of the cache
+    folder, so that concurrent pre-warming processes don't overwrite each others.
+
+    Examples
+    --------
+
+    journal = prefetchjournal("~/.cache/argopy")
+    sha = journal.key(request)
+    journal.record(sha, request, 'done')
+    journal.status(sha)
+
+    """
+
+    def __init__(self, cachedir: str = ""):
+        """ Create a journal of pre-warming requests
+
+            Parameters
+            ----------
+            cachedir: str
+                Cache folder, requests are saved in its "prefetch" sub-folder. Use the global OPTIONS['cachedir'] by
+                default.
+        """
+        self.cachedir = OPTIONS['cachedir'] if cachedir == '' else cachedir
+        self.path = os.path.join(os.path.abspath(os.path.expanduser(self.cachedir)), "prefetch")
+
+    @staticmethod
+    def key(request: dict):
+        """ Return the sha of a request """
+        return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _file(self, sha):
+        return os.path.join(self.path, "%s.json" % sha)
+
+    def status(self, sha: str):
+        """ Return the status of a request, or None if the request was never recorded """
+        try:
+            with open(self._file(sha), "r") as f:
+                return json.load(f)['status']
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    def record(self, sha: str, request: dict, status: str):
+        """ Save the status of a request """
+        os.makedirs(self.path, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({'request': request, 'status': status}, f, default=str)
+        os.replace(tmp, self._file(sha))
+
+    def clear(self):
+        """ Forget all requests """
+        if os.path.isdir(self.path):
+            for e in os.scandir(self.path):
+                if e.is_file():
+                    os.remove(e.path)
+
+
+def _print_progress(done: int, total: int, request: dict, status: str):
+    """ Default progress report: one line per request on stderr """
+    print("[%i/%i] %s %s: %s" % (done, total, request['access_point'], request['args'], status),
+          file=sys.stderr, flush=True)
+
+
+def prefetch(wmos: list = [],
+             boxes: list = [],
+             src: str = "",
+             ds: str = "",
+             mode: str = "",
+             cachedir: str = "",
+             max_workers: int = 4,
+             progress=True,
+             resume: bool = True,
+             **fetcher_kwargs):
+    """ Populate the cache with data from floats and/or regions
+
+        Requests are fetched in parallel by cached data fetchers, so that raw responses and post-processed datasets are
+        both saved in the cache folder. Requests already completed by a previous call, possibly interrupted, are skipped.
+
+        Parameters
+        ----------
+        wmos: list(int)
+            Floats to fetch, one request per float
+        boxes: list(list)
+            Regions to fetch, one request per box, see :meth:`argopy.DataFetcher.region`
+        src: str
+            Source of the data to use. Use the global OPTIONS['src'] by default.
+        ds: str
+            Name of the dataset to load. Use the global OPTIONS['dataset'] by default.
+        mode: str
+            User mode. Use the global OPTIONS['mode'] by default.
+        cachedir: str
+            Cache folder to populate. Use the global OPTIONS['cachedir'] by default.
+        max_workers: int (4)
+            Maximum number of requests fetched at the same time
+        progress: bool or callable (True)
+            Report progress on stderr. A callable is called with the number of completed requests, the total number
+            of requests, the request and its status, after each request.
+        resume: bool (True)
+            Skip requests completed by a previous call. Set to False to fetch all requests again.
+        **fetcher_kwargs
+            Used to pass arguments specific to a data source, like ``local_ftp``.
+
+        Returns
+        -------
+        :class:`pandas.DataFrame`
+            One row per request, with its ``access_point``, ``args``, ``status`` and ``error``. Status is one of
+            'done', 'empty' (no data found), 'skipped' (already done) or 'failed'. Failed requests are tried again
+            by the next call.
+    """
+    if int(max_workers) < 1:
+        raise ValueError("max_workers must be a positive integer")
+    if progress is True:
+        progress = _print_progress
+    cachedir = OPTIONS['cachedir'] if cachedir == '' else cachedir
+    src = OPTIONS['src'] if src == '' else src
+    ds = OPTIONS['dataset'] if ds == '' else ds
+    mode = OPTIONS['mode'] if mode == '' else mode
+    options = {k: v for k, v in fetcher_kwargs.items() if k not in ['cache', 'cachedir']}
+    if src == 'localftp' and not options.get('local_ftp', ''):
+        options['local_ftp'] = OPTIONS['local_ftp']
+
+    requests = [{'access_point': 'float', 'args': int(wmo)} for wmo in wmos]
+    requests += [{'access_point': 'region', 'args': list(box)} for box in boxes]
+    journal = prefetchjournal(cachedir)
+
+    def fetch(request):
+        loader = ArgoDataFetcher(mode=mode, src=src, ds=ds, cache=True, cachedir=cachedir, **options)
+        getattr(loader, request['access_point'])(request['args'])
+        try:
+            loader.to_xarray()
+            return 'done', ''
+        except DataNotFound:
+            return 'empty', ''
+
+    results = [None] * len(requests)
+    lock = threading.Lock()
+    completed = [0]
+
+    def report(i, request, status, error=""):
+        results[i] = {**request, 'status': status, 'error': error}
+        with lock:
+            completed[0] += 1
+            if progress:
+                progress(completed[0], len(requests), request, status)
+
+    todo = {}
+    for i, request in enumerate(requests):
+        sha = journal.key({'src': src, 'ds': ds, 'mode': mode, 'options': options, **request})
+        if resume and journal.status(sha) in ['done', 'empty']:
+            report(i, request, 'skipped')
+        else:
+            todo[i] = sha
+
+    with ThreadPoolExecutor(max_workers=int(max_workers)) as executor:
+        futures = {executor.submit(fetch, requests[i]): i for i in todo}
+        try:
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    status, error = future.result()
+                except Exception as e:
+                    status, error = 'failed', "%s: %s" % (type(e).__name__, e)
+                journal.record(todo[i], requests[i], status)
+                report(i, requests[i], status, error)
+        except KeyboardInterrupt:
+            # Completed requests are in the journal, drop the others and let the next call resume
+            for future in futures:
+                future.cancel()
+            raise
+
+    return pd.DataFrame(results, columns=['access_point', 'args', 'status', 'error'])
+
+
+def main(argv=None):
+    """ Command line entry point of :func:`argopy.prefetch`
+
+        Returns
+        -------
+        int
+            0 if all requests were completed, 1 otherwise
+    """
+    parser = argparse.ArgumentParser(prog="argopy-prefetch",
+                                     description="Populate the argopy cache with Argo data from floats and regions")
+    parser.add_argument("--wmo", nargs="+", type=int, default=[], help="Float WMOs to fetch")
+    parser.add_argument("--box", nargs="+", action="append", default=[],
+                        metavar="BOUND",
+                        help="Region to fetch: lon_min lon_max lat_min lat_max pres_min pres_max "
+                             "[date_min date_max]. Can be repeated.")
+    parser.add_argument("--src", default="", help="Data source, default to the 'src' option")
+    parser.add_argument("--ds", default="", help="Dataset, default to the 'dataset' option")
+    parser.add_argument("--mode", default="", help="User mode, default to the 'mode' option")
+    parser.add_argument("--cachedir", default="", help="Cache folder, default to the 'cachedir' option")
+    parser.add_argument("--local-ftp", default="", help="Local ftp copy, for the 'localftp' data source")
+    parser.add_argument("--workers", type=int, default=4, help="Maximum number of concurrent requests")
+    parser.add_argument("--force", action="store_true", help="Fetch again requests already done")
+    parser.add_argument("--quiet", action="store_true", help="Don't report progress")
+    args = parser.parse_args(argv)
+
+    boxes = []
+    for box in args.box:
+        if len(box) not in [6, 8]:
+            parser.error("--box requires 6 or 8 values, got %i" % len(box))
+        boxes.append([float(b) for b in box[0:6]] + box[6:])
+    if not args.wmo and not boxes:
+        parser.error("Nothing to fetch, use --wmo and/or --box")
+    if args.workers < 1:
+        parser.error("--workers must be a positive integer")
+
+    kwargs = {'local_ftp': args.local_ftp} if args.local_ftp else {}
+    report = prefetch(wmos=args.wmo, boxes=boxes, src=args.src, ds=args.ds, mode=args.mode,
+                      cachedir=args.cachedir, max_workers=args.workers, progress=not args.quiet,
+                      resume=not args.force, **kwargs)
+    failed = report[report['status'] == 'failed']
+    for _, row in failed.iterrows():
+        print("Failed %s %s: %s" % (row['access_point'], row['args'], row['error']), file=sys.stderr)
+    return 1 if len(failed) > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,10 @@
 from .argo_index import indexstore, indexfilter_wmo, indexfilter_box
+from .argo_index_sidecar import indexsidecar, indexwmotable
+from .argo_index_cache import indexsearchcache
+from .argo_cache_registry import cacheregistry
+from .argo_result_cache import resultcache
+from .argo_http_retry import retrypolicy
+from .argo_gdac_catalog import gdaccatalog
 from .fsspec_wrappers import filestore, httpstore, memorystore
 
 #
@@ -7,6 +13,13 @@ __all__ = (
     "indexstore",
     "indexfilter_wmo",
     "indexfilter_box",
+    "indexsidecar",
+    "indexwmotable",
+    "indexsearchcache",
+    "cacheregistry",
+    "resultcache",
+    "retrypolicy",
+    "gdaccatalog",
     "filestore",
     "httpstore",
     "memorystore"
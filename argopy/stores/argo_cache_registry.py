@@ -0,0 +1,537 @@
+#!/bin/env python
+# -*coding: UTF-8 -*-
+"""
+Registry of files cached by argopy stores
+
+fsspec keeps the registry of its file cache in a pickled dictionary, that is read and rewritten as a whole each time
+a file is cached or removed. Here, the registry is an indexed table of a SQLite database saved in the cache folder,
+so that lookups, inserts and deletes are small transactions, safe for concurrent processes sharing the same folder.
+The registry also records the size, last access time and number of hits of cached files, so that the cache can be
+bounded in size with a least recently or least frequently used eviction policy, and files expired after some time.
+The http validators of cached files (ETag and Last-Modified headers) are kept to revalidate expired files.
+Cached files can be compressed, with the codec used for each file recorded in the registry, and are decompressed on the
+fly when read.
+
+"""
+import os
+import bz2
+import gzip
+import lzma
+import time
+import pickle
+import sqlite3
+import tempfile
+import threading
+from collections.abc import MutableMapping
+
+from fsspec.implementations.cached import WholeFileCacheFileSystem, hash_name
+from fsspec.spec import AbstractBufferedFile
+from fsspec.caching import BaseCache
+from fsspec.compression import compr
+from fsspec.utils import infer_compression
+
+from argopy.options import OPTIONS
+from argopy.errors import OfflineCacheMiss
+
+try:
+    import zstandard
+    with_zstandard = True
+except ModuleNotFoundError:
+    with_zstandard = False
+
+try:
+    import lz4.frame
+    with_lz4 = True
+except ModuleNotFoundError:
+    with_lz4 = False
+
+
+_codecs = {'gzip': gzip.open, 'bz2': bz2.open, 'lzma': lzma.open}
+""" Functions opening a compressed file from its path and mode, by compression name """
+if with_zstandard:
+    _codecs['zstd'] = zstandard.open
+if with_lz4:
+    _codecs['lz4'] = lz4.frame.open
+
+
+def available_compressions():
+    """ Return the names of the codecs available to compress cached files """
+    return list(_codecs)
+
+
+def open_compressed(fn: str, mode: str = "rb", compression: str = None):
+    """ Open a file, compressed with a codec of the cache or not
+
+        Parameters
+        ----------
+        fn: str
+            Path to the file
+        mode: str ('rb')
+            'rb' to read the decompressed content as a stream, 'wb' to write content compressed on the fly
+        compression: str, optional
+            Name of the codec: ``gzip``, ``bz2``, ``lzma``, or ``zstd`` and ``lz4`` if their package is installed
+
+        Returns
+        -------
+        file-like object
+    """
+    if compression is None:
+        return open(fn, mode)
+    if compression not in _codecs:
+        raise ValueError("Compression '%s' is not available, must be one in: %s" % (compression, list(_codecs)))
+    return _codecs[compression](fn, mode)
+
+
+def _uid(detail):
+    return None if detail.get('uid') is None else str(detail['uid'])
+
+
+class cacheregistry(MutableMapping):
+    """ SQLite registry of cached files
+
+    The registry maps store paths to the fsspec details of their cached copy: the name of the cached file ``fn``,
+    the caching ``time`` and the ``uid`` of the original file. It also holds the ``size`` of the cached copy, the
+    time it was last accessed ``atime`` and its number of ``hits``, with the ``etag`` and ``modified`` http validators
+    of the original file and the ``compression`` of the cached copy, if any.
+
+    Examples
+    --------
+
+    registry = cacheregistry("~/.cache/argopy")
+    registry['file:///home/argo/ar_index_global_prof.txt']
+    registry.remove(['file:///home/argo/ar_index_global_prof.txt'])
+    registry.evict(max_bytes=2**30, policy='lfu')
+
+    """
+    db_name = "cache.sqlite"
+    """ Name of the registry database in the cache folder """
+
+    legacy_name = "cache"
+    """ Name of the fsspec pickled registry, imported when the database is created """
+
+    _schema = ["CREATE TABLE IF NOT EXISTS files ("
+               "path TEXT PRIMARY KEY, fn TEXT NOT NULL, time REAL NOT NULL, uid TEXT, "
+               "size INTEGER NOT NULL DEFAULT 0, atime REAL NOT NULL DEFAULT 0, hits INTEGER NOT NULL DEFAULT 0, "
+               "etag TEXT, modified TEXT, compression TEXT)",
+               "CREATE INDEX IF NOT EXISTS files_time ON files (time)",
+               "CREATE INDEX IF NOT EXISTS files_lru ON files (atime)",
+               "CREATE INDEX IF NOT EXISTS files_lfu ON files (hits, atime)"]
+
+    _policies = {'lru': "atime", 'lfu': "hits, atime"}
+    """ Eviction order of each cache policy """
+
+    def __init__(self, storage: str, timeout: float = 60):
+        """ Open the registry of a cache folder
+
+            Parameters
+            ----------
+            storage: str
+                Cache folder
+            timeout: float (60)
+                Number of seconds to wait for a lock on the database held by another process
+        """
+        self.storage = os.path.abspath(os.path.expanduser(storage))
+        self.db = os.path.join(self.storage, self.db_name)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def __repr__(self):
+        summary = ["<cacheregistry>"]
+        summary.append("Database: %s" % self.db)
+        summary.append("Files: %i" % len(self))
+        return "\n".join(summary)
+
+    def _connection(self):
+        """ Return a connection to the database for this process and thread
+
+            Connections are not shared across threads or forked processes. A new one is open, and the database created,
+            if the database file was removed or replaced.
+        """
+        con = getattr(self._local, 'con', None)
+        if con is not None and self._local.pid == os.getpid():
+            if self._inode() == self._local.inode:
+                return con
+            con.close()  # Database was removed with the cache folder
+        os.makedirs(self.storage, exist_ok=True)
+        con = sqlite3.connect(self.db, timeout=self.timeout)
+        with con:
+            self._migrate(con)
+            for statement in self._schema:
+                con.execute(statement)
+        self._local.con, self._local.pid, self._local.inode = con, os.getpid(), self._inode()
+        self._import_legacy(con)
+        return con
+
+    def _inode(self):
+        try:
+            return os.stat(self.db).st_ino
+        except FileNotFoundError:
+            return None
+
+    def _migrate(self, con):
+        """ Add columns missing from a registry created by a previous version """
+        columns = [row[1] for row in con.execute("PRAGMA table_info(files)")]
+        if len(columns) == 0:
+            return
+        if 'size' not in columns:
+            for column in ["size INTEGER", "atime REAL", "hits INTEGER"]:
+                con.execute("ALTER TABLE files ADD COLUMN %s NOT NULL DEFAULT 0" % column)
+            for path, fn, t in con.execute("SELECT path, fn, time FROM files").fetchall():
+                con.execute("UPDATE files SET size = ?, atime = ? WHERE path = ?", (self._size(fn), t, path))
+        for column in ["etag", "modified", "compression"]:
+            if column not in columns:
+                con.execute("ALTER TABLE files ADD COLUMN %s TEXT" % column)
+
+    def _size(self, fn):
+        try:
+            return os.path.getsize(os.path.join(self.storage, fn))
+        except OSError:
+            return 0
+
+    def _import_legacy(self, con):
+        """ Import entries of a fsspec pickled registry, and remove it """
+        fn = os.path.join(self.storage, self.legacy_name)
+        if not os.path.exists(fn):
+            return
+        try:
+            with open(fn, "rb") as f:
+                cached_files = pickle.load(f)
+        except (pickle.UnpicklingError, EOFError, OSError):
+            cached_files = {}
+        rows = [(k, v['fn'], v['time'], _uid(v), self._size(v['fn']), v['time'])
+                for k, v in cached_files.items() if v['blocks'] is True]
+        with con:
+            con.executemany("INSERT OR IGNORE INTO files VALUES (?, ?, ?, ?, ?, ?, 0, NULL, NULL, NULL)", rows)
+        try:
+            os.remove(fn)
+        except FileNotFoundError:  # Imported by another process
+            pass
+
+    def __getitem__(self, path):
+        row = self._connection().execute("SELECT fn, time, uid, size, atime, hits, etag, modified, compression "
+                                         "FROM files WHERE path = ?", (path,)).fetchone()
+        if row is None:
+            raise KeyError(path)
+        return {'fn': row[0], 'time': row[1], 'uid': row[2], 'blocks': True,
+                'size': row[3], 'atime': row[4], 'hits': row[5], 'etag': row[6], 'modified': row[7],
+                'compression': row[8]}
+
+    def __setitem__(self, path, detail):
+        size = detail['size'] if 'size' in detail else self._size(detail['fn'])
+        with self._connection() as con:
+            con.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?, ?)",
+                        (path, detail['fn'], detail['time'], _uid(detail), size, time.time(),
+                         detail.get('etag'), detail.get('modified'), detail.get('compression')))
+
+    def __delitem__(self, path):
+        if not self.remove([path]):
+            raise KeyError(path)
+
+    def __contains__(self, path):
+        return self._connection().execute("SELECT 1 FROM files WHERE path = ?", (path,)).fetchone() is not None
+
+    def __iter__(self):
+        return iter([row[0] for row in self._connection().execute("SELECT path FROM files")])
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def cachepath(self, path: str):
+        """ Return path to the cached copy of a store path, or None if not registered """
+        row = self._connection().execute("SELECT fn FROM files WHERE path = ?", (path,)).fetchone()
+        return None if row is None else os.path.join(self.storage, row[0])
+
+    def write(self, path: str, fn: str, data: bytes, uid: str = None, etag: str = None, modified: str = None,
+              compression: str = None):
+        """ Save data as the cached copy of a store path, and register it
+
+            Parameters
+            ----------
+            path: str
+                Store path
+            fn: str
+                Name of the cached file in the cache folder
+            data: bytes
+                Content of the cached file
+            uid: str, optional
+                Unique identifier of the original file
+            etag: str, optional
+                ETag http header of the original file
+            modified: str, optional
+                Last-Modified http header of the original file
+            compression: str, optional
+                Codec to compress the cached file with, see :func:`open_compressed`
+
+            Returns
+            -------
+            str
+                Path to the cached file
+        """
+        os.makedirs(self.storage, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.storage, suffix=".tmp")
+        os.close(fd)
+        try:
+            with open_compressed(tmp, "wb", compression) as f:
+                f.write(data)
+            os.replace(tmp, os.path.join(self.storage, fn))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self[path] = {'fn': fn, 'time': time.time(), 'uid': uid, 'etag': etag, 'modified': modified,
+                      'compression': compression}
+        return os.path.join(self.storage, fn)
+
+    def open(self, path: str):
+        """ Open the cached copy of a store path, decompressed on the fly
+
+            Raises KeyError if the path is not registered, and FileNotFoundError if its cached copy was removed.
+        """
+        detail = self[path]
+        return open_compressed(os.path.join(self.storage, detail['fn']), "rb", detail['compression'])
+
+    def nbytes(self):
+        """ Return the total size of cached files """
+        return self._connection().execute("SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0]
+
+    def touch(self, path: str, max_age: float = 0):
+        """ Record an access to the cached copy of a store path
+
+            Parameters
+            ----------
+            path: str
+                Store path
+            max_age: float (0)
+                Number of seconds after which cached copies are expired, 0 to never expire them
+
+            Returns
+            -------
+            dict or None
+                Details of the cached copy, or None if the path is not registered, its copy is expired or missing
+        """
+        try:
+            detail = self[path]
+        except KeyError:
+            return None
+        if max_age and time.time() - detail['time'] > max_age:
+            return None
+        if not os.path.exists(os.path.join(self.storage, detail['fn'])):
+            return None
+        with self._connection() as con:
+            con.execute("UPDATE files SET atime = ?, hits = hits + 1 WHERE path = ?", (time.time(), path))
+        return detail
+
+    def stale(self, path: str):
+        """ Return details of the cached copy of a store path, even if expired, or None if not registered or missing
+
+            Use it to revalidate expired copies with their http validators.
+        """
+        detail = self.get(path)
+        if detail is None or not os.path.exists(os.path.join(self.storage, detail['fn'])):
+            return None
+        return detail
+
+    def revalidate(self, path: str):
+        """ Record that the cached copy of a store path is still valid, as if it was just cached """
+        now = time.time()
+        with self._connection() as con:
+            con.execute("UPDATE files SET time = ?, atime = ?, hits = hits + 1 WHERE path = ?", (now, now, path))
+
+    def evict(self, max_bytes: int = 0, max_age: float = 0, policy: str = 'lru', keep: list = None):
+        """ Remove expired files without http validators, then files in the policy order until the cache fits in a size
+
+            Parameters
+            ----------
+            max_bytes: int (0)
+                Maximum total size of cached files, 0 for no limit
+            max_age: float (0)
+                Number of seconds after which cached copies are removed, 0 to never expire them. Expired copies with
+                http validators are kept, to be revalidated with a conditional request: only the size limit removes
+                them.
+            policy: str ('lru')
+                Eviction order of files: least recently used first (``lru``) or least frequently used first (``lfu``)
+            keep: list(str)
+                Store paths not to be evicted
+
+            Returns
+            -------
+            list(str)
+                The store paths removed
+        """
+        if policy not in self._policies:
+            raise ValueError("Invalid cache policy '%s', must be one in: %s" % (policy, list(self._policies)))
+        con = self._connection()
+        keep = set(keep or [])
+        evicted = []
+        if max_age:
+            query = "SELECT path FROM files WHERE time < ? AND COALESCE(etag, '') = '' AND COALESCE(modified, '') = ''"
+            expired = [row[0] for row in con.execute(query, (time.time() - max_age,))]
+            evicted += self.remove([path for path in expired if path not in keep])
+        if max_bytes:
+            total = self.nbytes()
+            if total > max_bytes:
+                candidates = []
+                for path, size in con.execute("SELECT path, size FROM files ORDER BY %s" % self._policies[policy]):
+                    if total <= max_bytes:
+                        break
+                    if path not in keep:
+                        candidates.append(path)
+                        total -= size
+                evicted += self.remove(candidates)
+        return evicted
+
+    def remove(self, paths: list):
+        """ Remove store paths from the registry, with their cached copy
+
+            All paths are removed in a single transaction.
+
+            Parameters
+            ----------
+            paths: list(str)
+
+            Returns
+            -------
+            list(str)
+                The store paths that were registered
+        """
+        paths = list(dict.fromkeys(paths))
+        removed = []
+        with self._connection() as con:
+            for i in range(0, len(paths), 500):  # Stay below the SQLite limit of host parameters
+                chunk = paths[i:i + 500]
+                marks = ",".join(["?"] * len(chunk))
+                rows = con.execute("SELECT path, fn FROM files WHERE path IN (%s)" % marks, chunk).fetchall()
+                con.execute("DELETE FROM files WHERE path IN (%s)" % marks, chunk)
+                removed += rows
+        for path, fn in removed:
+            try:
+                os.remove(os.path.join(self.storage, fn))
+            except FileNotFoundError:
+                pass
+        return [path for path, fn in removed]
+
+    def clear(self):
+        """ Remove all store paths from the registry, with their cached copy """
+        self.remove(list(self))
+
+    def close(self):
+        """ Close the connection of this thread to the database """
+        con = getattr(self._local, 'con', None)
+        if con is not None:
+            con.close()
+            self._local.con = None
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(storage: str):
+    """ Return the registry of a cache folder, shared by all file systems of the process """
+    key = os.path.abspath(os.path.expanduser(storage))
+    with _registries_lock:
+        if key not in _registries:
+            _registries[key] = cacheregistry(key)
+        return _registries[key]
+
+
+def is_offline(protocol: str):
+    """ Return True if the ``offline`` option forbids network access to a file system protocol """
+    return OPTIONS['offline'] and protocol not in ['file', 'memory']
+
+
+class sqlfilecache(WholeFileCacheFileSystem):
+    """ fsspec whole file cache with a :class:`cacheregistry`
+
+    The registry is read and written directly in the database, and not saved as a whole when a file is cached.
+    Files are downloaded to a temporary file moved in place when complete, so that other processes never read a
+    partially cached file.
+
+    The cache policy is read from the ``cache_policy``, ``cache_max_bytes`` and ``cache_max_age`` options each time a
+    file is open: expired files are downloaded again, and files are evicted each time a new one is cached. New files
+    are compressed with the ``cache_compression`` option codec.
+
+    With the ``offline`` option, cached files of remote file systems never expire, and files not in cache raise an
+    :class:`argopy.errors.OfflineCacheMiss` error instead of being downloaded.
+    """
+    protocol = "argopy_filecache"
+
+    def load_cache(self):
+        """ Bind the registry of the writable cache folder """
+        self.cached_files = [get_registry(self.storage[-1])]
+        self.last_cache = time.time()
+
+    def save_cache(self):
+        """ Nothing to do, entries are saved when registered """
+        pass
+
+    def _check_file(self, path):
+        """ Return details and path of a valid cached copy, recording the access """
+        max_age = 0 if is_offline(self.target_protocol) else OPTIONS['cache_max_age']
+        detail = self.cached_files[-1].touch(path, max_age=max_age)
+        if detail:
+            return detail, os.path.join(self.storage[-1], detail['fn'])
+        return False, None
+
+    def _open(self, path, mode="rb", **kwargs):
+        path = self._strip_protocol(path)
+
+        if not path.startswith(self.target_protocol):
+            store_path = self.target_protocol + "://" + path
+        else:
+            store_path = path
+        path = self.fs._strip_protocol(store_path)
+        if "r" not in mode:
+            return self.fs._open(path, mode=mode, **kwargs)
+        detail, fn = self._check_file(store_path)
+        if detail:
+            return open_compressed(fn, mode, detail['compression'])
+        if is_offline(self.target_protocol):
+            raise OfflineCacheMiss("Offline mode, no cached copy of %s in %s" % (store_path, self.storage[-1]))
+
+        hash = hash_name(path, self.same_names)
+        fn = os.path.join(self.storage[-1], hash)
+        detail = {
+            "fn": hash,
+            "blocks": True,
+            "time": time.time(),
+            "uid": self.fs.ukey(path),
+            "compression": OPTIONS['cache_compression'],
+        }
+        kwargs["mode"] = mode
+        f = self.fs._open(path, **kwargs)
+        if self.compression:
+            comp = (
+                infer_compression(path)
+                if self.compression == "infer"
+                else self.compression
+            )
+            f = compr[comp](f, mode="rb")
+        fd, tmp = tempfile.mkstemp(dir=self.storage[-1], suffix=".tmp")
+        os.close(fd)
+        try:
+            with open_compressed(tmp, "wb", detail['compression']) as f2:
+                if isinstance(f, AbstractBufferedFile):
+                    # want no type of caching if just downloading whole thing
+                    f.cache = BaseCache(0, f.cache.fetcher, f.size)
+                if getattr(f, "blocksize", 0) and f.size:
+                    data = True
+                    while data:
+                        data = f.read(f.blocksize)
+                        f2.write(data)
+                else:
+                    f2.write(f.read())
+            os.replace(tmp, fn)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        finally:
+            f.close()
+        detail["size"] = os.path.getsize(fn)
+        self.cached_files[-1][store_path] = detail
+        self.cached_files[-1].evict(max_bytes=OPTIONS['cache_max_bytes'],
+                                    max_age=OPTIONS['cache_max_age'],
+                                    policy=OPTIONS['cache_policy'],
+                                    keep=[store_path])
+        return open_compressed(fn, mode, detail['compression'])
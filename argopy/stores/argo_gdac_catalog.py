@@ -0,0 +1,255 @@
+#!/bin/env python
+# -*coding: UTF-8 -*-
+"""
+Catalog of a local copy of the GDAC ftp
+
+Files of a local GDAC copy are organised in dac/<dac>/<wmo> folders, with multi-profile files in the float folder and
+single profile files in its "profiles" sub-folder. Instead of matching a file name pattern against all dac folders for
+each file to load, the catalog lists folders with os.scandir once, and resolves file names with dict lookups.
+
+The catalog is refreshed incrementally with the modification time of folders, which changes when files are added or
+removed: dac folders are checked each time the catalog is refreshed, and float folders are checked at most once per
+refresh, when one of their files is requested. Float folders are listed the first time one of their files is requested,
+or all at once with :meth:`gdaccatalog.build`.
+With a cache folder, the catalog is saved on disk to be re-used by later sessions.
+
+"""
+import os
+import pickle
+import hashlib
+import tempfile
+import threading
+
+
+class gdaccatalog():
+    """ Catalog of the dac folders of a local GDAC ftp copy
+
+    Examples
+    --------
+
+    catalog = get_catalog("/home/ref-argo/gdac", cachedir="~/.cache/argopy")
+    catalog.refresh()
+    catalog.files(6901929)  # Multi-profile files of a float
+    catalog.files(6901929, 12)  # Single profile files of a float cycle
+    catalog.save()
+
+    """
+    version = 1
+    """ Version of the catalog structure, catalogs saved with another version are built again """
+
+    def __init__(self, local_ftp: str, cachedir: str = None):
+        """ Create a catalog of a local GDAC ftp copy
+
+            Parameters
+            ----------
+            local_ftp: str
+                Path to the local directory where the 'dac' folder is located
+            cachedir: str, optional
+                Cache folder where to save the catalog, in its "gdac" sub-folder. The catalog is not saved by default.
+        """
+        self.local_ftp = os.path.abspath(os.path.expanduser(local_ftp))
+        self.root = os.path.join(self.local_ftp, "dac")
+        self.path = None
+        if cachedir is not None:
+            sha = hashlib.sha256(self.local_ftp.encode()).hexdigest()
+            self.path = os.path.join(os.path.abspath(os.path.expanduser(cachedir)), "gdac", "%s.pickle" % sha)
+        self.dacs = {}  # dac name -> folder mtime
+        self.floats = {}  # wmo -> dict(dac, mtime, files, profiles_mtime, cycles)
+        self._checked = set()  # Floats checked since the last refresh
+        self._missing = set()  # Floats not found since the last refresh
+        self._dirty = False
+        self._lock = threading.RLock()
+        self._load()
+
+    def __repr__(self):
+        summary = ["<gdaccatalog>"]
+        summary.append("FTP: %s" % self.local_ftp)
+        summary.append("DACs: %i" % len(self.dacs))
+        summary.append("Floats: %i (%i listed)" % (len(self.floats),
+                                                   len([f for f in self.floats.values() if f['mtime'] is not None])))
+        return "\n".join(summary)
+
+    def _load(self):
+        if self.path is None:
+            return
+        try:
+            with open(self.path, "rb") as f:
+                saved = pickle.load(f)
+            if saved['version'] == self.version and saved['local_ftp'] == self.local_ftp:
+                self.dacs, self.floats = saved['dacs'], saved['floats']
+        except (FileNotFoundError, pickle.UnpicklingError, EOFError, KeyError, TypeError):
+            pass
+
+    def save(self):
+        """ Save the catalog in the cache folder, if any and if it changed """
+        with self._lock:
+            if self.path is None or not self._dirty:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump({'version': self.version, 'local_ftp': self.local_ftp,
+                             'dacs': self.dacs, 'floats': self.floats}, f)
+            os.replace(tmp, self.path)
+            self._dirty = False
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+
+    def refresh(self):
+        """ Update the list of floats of dac folders modified since the last refresh """
+        with self._lock:
+            self._checked, self._missing = set(), set()
+            try:
+                dacs = {e.name: e.stat().st_mtime_ns for e in os.scandir(self.root) if e.is_dir()}
+            except (FileNotFoundError, NotADirectoryError):
+                dacs = {}
+            for dac in set(self.dacs) - set(dacs):  # Removed dac folders
+                self._forget(dac, set())
+                self.dacs.pop(dac)
+                self._dirty = True
+            for dac, mtime in dacs.items():
+                if self.dacs.get(dac) != mtime:
+                    self._scan_dac(dac, mtime)
+        return self
+
+    def _forget(self, dac, keep):
+        for wmo in [wmo for wmo, f in self.floats.items() if f['dac'] == dac and wmo not in keep]:
+            self.floats.pop(wmo)
+
+    def _scan_dac(self, dac, mtime):
+        wmos = set()
+        for e in os.scandir(os.path.join(self.root, dac)):
+            if e.name.isdigit() and e.is_dir():
+                wmo = int(e.name)
+                wmos.add(wmo)
+                if wmo not in self.floats or self.floats[wmo]['dac'] != dac:
+                    self.floats[wmo] = {'dac': dac, 'mtime': None, 'files': [], 'profiles_mtime': None, 'cycles': {}}
+        self._forget(dac, wmos)
+        self.dacs[dac] = mtime
+        self._dirty = True
+
+    def _float_path(self, wmo):
+        return os.path.join(self.root, self.floats[wmo]['dac'], str(wmo))
+
+    def _scan_float(self, wmo):
+        """ List files of a float folder and of its profiles folder, if they changed """
+        entry = self.floats[wmo]
+        path = self._float_path(wmo)
+        mtime = self._mtime(path)
+        if mtime is None:  # Removed, or moved to another dac
+            self.floats.pop(wmo)
+            self._dirty = True
+            return
+        if mtime != entry['mtime']:
+            entry['files'] = sorted([e.name for e in os.scandir(path) if e.name.endswith(".nc")])
+            entry['mtime'] = mtime
+            self._dirty = True
+        profiles_mtime = self._mtime(os.path.join(path, "profiles"))
+        if profiles_mtime != entry['profiles_mtime']:
+            cycles = {}
+            if profiles_mtime is not None:
+                for e in os.scandir(os.path.join(path, "profiles")):
+                    cyc = self._cycle(e.name, wmo)
+                    if cyc is not None:
+                        cycles.setdefault(cyc, []).append(e.name)
+            entry['cycles'] = {cyc: sorted(names) for cyc, names in cycles.items()}
+            entry['profiles_mtime'] = profiles_mtime
+            self._dirty = True
+
+    @staticmethod
+    def _cycle(name, wmo):
+        """ Return the cycle number of a single profile file name, <B/M/S><R/D><wmo>_<cyc><D>.nc, or None """
+        if not name.endswith(".nc") or "_" not in name:
+            return None
+        left, right = name[:-3].rsplit("_", 1)
+        digits = right[:-1] if right.endswith("D") else right
+        if not left.endswith(str(wmo)) or not digits.isdigit():
+            return None
+        return int(digits)
+
+    def _float(self, wmo):
+        """ Return the up to date entry of a float, or None if not found """
+        with self._lock:
+            if wmo not in self.floats and wmo not in self._missing:
+                self.refresh()  # The float may have been added since the last refresh
+                self._missing.add(wmo)
+            if wmo in self.floats and wmo not in self._checked:
+                self._checked.add(wmo)
+                self._scan_float(wmo)
+                if wmo not in self.floats:  # Moved to another dac
+                    self.refresh()
+                    self._missing.add(wmo)
+                    self._checked.add(wmo)
+                    if wmo in self.floats:
+                        self._scan_float(wmo)
+            return self.floats.get(wmo)
+
+    def files(self, wmo: int, cyc: int = None):
+        """ Return the sorted absolute paths of the files of a float
+
+            Parameters
+            ----------
+            wmo: int
+                WMO float code
+            cyc: int, optional
+                Cycle number. Return the multi-profile files of the float if not set, or all the single profile files of
+                the cycle (real-time, delayed mode, BGC, merged or synthetic, ascent or descent).
+
+            Returns
+            -------
+            list(str)
+        """
+        entry = self._float(int(wmo))
+        if entry is None:
+            return []
+        path = os.path.join(self.root, entry['dac'], str(wmo))
+        if cyc is None:
+            return [os.path.join(path, name) for name in entry['files']]
+        return [os.path.join(path, "profiles", name) for name in entry['cycles'].get(int(cyc), [])]
+
+    def exists(self, path: str):
+        """ Return True if a float file path, absolute or relative to the 'dac' folder, is in the catalog """
+        path = os.path.normpath(os.path.join(self.root, path))
+        parts = os.path.relpath(path, self.root).split(os.path.sep)
+        if len(parts) not in [3, 4] or not parts[1].isdigit():
+            return False
+        wmo = int(parts[1])
+        cyc = self._cycle(parts[-1], wmo) if len(parts) == 4 else None
+        if len(parts) == 4 and cyc is None:
+            return False
+        return path in self.files(wmo, cyc)
+
+    def build(self):
+        """ List all dac and float folders at once """
+        with self._lock:
+            self.refresh()
+            for wmo in list(self.floats):
+                self._float(wmo)
+        return self
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(local_ftp: str, cachedir: str = None):
+    """ Return the catalog of a local GDAC ftp copy, shared by all fetchers of the process
+
+        Parameters
+        ----------
+        local_ftp: str
+            Path to the local directory where the 'dac' folder is located
+        cachedir: str, optional
+            Cache folder where to save the catalog. The catalog is not saved by default.
+    """
+    key = (os.path.abspath(os.path.expanduser(local_ftp)),
+           None if cachedir is None else os.path.abspath(os.path.expanduser(cachedir)))
+    with _catalogs_lock:
+        if key not in _catalogs:
+            _catalogs[key] = gdaccatalog(*key)
+        return _catalogs[key]
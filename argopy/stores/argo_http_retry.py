@@ -0,0 +1,228 @@
+#!/bin/env python
+# -*coding: UTF-8 -*-
+"""
+Retry policy and circuit breakers of http stores
+
+Transient server errors (5xx responses, too many requests) and reset connections are retried after a delay growing
+exponentially with the number of attempts, with random jitter so that concurrent clients don't retry all at once. A
+``Retry-After`` header sent by the server is honoured.
+A circuit breaker per host stops sending requests to a server failing repeatedly: requests are rejected without
+network access for some time, then a single trial request decides whether the server is back.
+
+"""
+import time
+import random
+import threading
+import email.utils
+from collections import Counter
+from urllib.parse import urlparse
+
+from argopy.options import OPTIONS
+from argopy.errors import ServerUnavailable
+
+
+class retrypolicy():
+    """ Retry policy of http requests
+
+    Examples
+    --------
+
+    policy = retrypolicy(total=5, backoff=1)
+    httpstore(retry=policy).open_json(url)
+
+    """
+
+    def __init__(self,
+                 total: int = None,
+                 backoff: float = 0.5,
+                 max_backoff: float = 60,
+                 jitter: bool = True,
+                 statuses: list = [429, 500, 502, 503, 504]):
+        """ Create a retry policy
+
+            Parameters
+            ----------
+            total: int, optional
+                Maximum number of retries of a request, ``http_retries`` option by default
+            backoff: float (0.5)
+                Delay in seconds before the first retry, doubled for each following retry
+            max_backoff: float (60)
+                Maximum delay in seconds before a retry. A request is not retried if the server asks to wait longer
+                with a ``Retry-After`` header.
+            jitter: bool (True)
+                Wait for a random delay between 0 and the backoff delay ("full jitter")
+            statuses: list(int)
+                Response status codes to retry
+        """
+        self.total = total
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.statuses = frozenset(statuses)
+
+    def __repr__(self):
+        return "<retrypolicy total=%s backoff=%s max_backoff=%s jitter=%s statuses=%s>" % (
+            self.total, self.backoff, self.max_backoff, self.jitter, sorted(self.statuses))
+
+    @property
+    def retries(self):
+        """ Maximum number of retries of a request """
+        return OPTIONS['http_retries'] if self.total is None else self.total
+
+    def delay(self, attempt: int, headers=None):
+        """ Return the delay in seconds before a retry, or None if the request should not be retried
+
+            Parameters
+            ----------
+            attempt: int
+                Number of the attempt that failed, starting from 0
+            headers: dict, optional
+                Headers of the failed response, possibly with a ``Retry-After`` delay
+        """
+        if attempt >= self.retries:
+            return None
+        retry_after = self.retry_after(headers)
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_backoff else None
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return random.uniform(0, delay) if self.jitter else delay
+
+    @staticmethod
+    def retry_after(headers):
+        """ Return the delay in seconds of a ``Retry-After`` header, or None """
+        value = (headers or {}).get('Retry-After')
+        if value is None:
+            return None
+        try:
+            return max(0., float(value))
+        except ValueError:
+            pass
+        try:  # An http date
+            return max(0., email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class circuitbreaker():
+    """ Circuit breaker of a host
+
+    The circuit opens after a number of consecutive failures: requests are then rejected until a cool down delay is
+    over. The next request is a trial: the circuit closes if it succeeds, and opens again if it fails.
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30):
+        """ Create a closed circuit breaker
+
+            Parameters
+            ----------
+            threshold: int (5)
+                Number of consecutive failures opening the circuit
+            cooldown: float (30)
+                Number of seconds requests are rejected when the circuit is open
+        """
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened = None
+        self.trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """ State of the circuit: 'closed', 'open' or 'half-open' """
+        with self._lock:
+            if self.opened is None:
+                return 'closed'
+            return 'half-open' if time.time() - self.opened >= self.cooldown else 'open'
+
+    def allow(self):
+        """ Return True if a request can be sent """
+        with self._lock:
+            if self.opened is None:
+                return True
+            if time.time() - self.opened < self.cooldown or self.trial:
+                return False
+            self.trial = True  # Only one trial request at a time
+            return True
+
+    def success(self):
+        """ Record a successful request, closing the circuit """
+        with self._lock:
+            self.failures = 0
+            self.opened = None
+            self.trial = False
+
+    def release(self):
+        """ Record a request interrupted before any outcome, allowing a new trial request """
+        with self._lock:
+            self.trial = False
+
+    def failure(self):
+        """ Record a failed request, opening the circuit after too many failures or a failed trial """
+        with self._lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.threshold:
+                self.opened = time.time()
+            self.trial = False
+
+
+class hostguard():
+    """ Circuit breakers and counters of http requests, by host, shared by all http stores of the process """
+
+    _breakers = {}
+    _stats = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def host(url: str):
+        return urlparse(url).netloc
+
+    @classmethod
+    def breaker(cls, url: str):
+        """ Return the circuit breaker of the host of an url """
+        host = cls.host(url)
+        with cls._lock:
+            if host not in cls._breakers:
+                cls._breakers[host] = circuitbreaker()
+            return cls._breakers[host]
+
+    @classmethod
+    def check(cls, url: str):
+        """ Raise a ServerUnavailable error if the circuit of the host of an url is open """
+        if not cls.breaker(url).allow():
+            cls.count(url, 'rejected')
+            raise ServerUnavailable("Too many failures of %s, requests are suspended for a while. Url was: %s"
+                                    % (cls.host(url), url))
+
+    @classmethod
+    def count(cls, url: str, name: str):
+        with cls._lock:
+            cls._stats.setdefault(cls.host(url), Counter())[name] += 1
+
+    @classmethod
+    def stats(cls):
+        """ Return counters of http requests
+
+            Returns
+            -------
+            dict
+                Number of ``requests`` sent, ``retries``, ``failures`` (requests failed after all retries) and
+                ``rejected`` requests (by open circuits), in total and for each host in ``hosts``, with the state of
+                its circuit.
+        """
+        names = ['requests', 'retries', 'failures', 'rejected']
+        with cls._lock:
+            hosts = {host: {k: counters[k] for k in names} for host, counters in cls._stats.items()}
+            breakers = dict(cls._breakers)
+        for host in hosts:
+            hosts[host]['circuit'] = breakers[host].state if host in breakers else 'closed'
+        stats = {k: sum([h[k] for h in hosts.values()]) for k in names}
+        stats['hosts'] = hosts
+        return stats
+
+    @classmethod
+    def reset(cls):
+        """ Reset counters and close all circuits """
+        with cls._lock:
+            cls._stats.clear()
+            cls._breakers.clear()
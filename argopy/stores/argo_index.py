@@ -1,11 +1,16 @@
+import os
+import io
 import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from abc import ABC, abstractmethod
 import hashlib
 
-from argopy.errors import DataNotFound
+from argopy.errors import DataNotFound, FileSystemHasNoCache
 from argopy.options import OPTIONS
-from .fsspec_wrappers import filestore, memorystore
+from .fsspec_wrappers import filestore
+from .argo_index_sidecar import indexsidecar, indexwmotable, _to_epoch, _source_signature
+from .argo_index_cache import indexsearchcache
 
 
 class indexfilter_proto(ABC):
@@ -15,6 +20,9 @@ class indexfilter_proto(ABC):
 
 
     """
+    chunkable = False
+    """ True if ``run`` returns rows in index file order, so that it can be run on chunks of the index file """
+
     def __init__(self):
         pass
 
@@ -25,6 +33,8 @@ class indexfilter_proto(ABC):
         Parameters
         ----------
         index_file: _io.TextIOWrapper
+        **kwargs:
+            Optional search helpers provided by the index store, eg: ``wmo_table``
 
         Returns
         -------
@@ -37,6 +47,19 @@ class indexfilter_proto(ABC):
         """ Return a name for one specific filter run """
         pass
 
+    def locate(self, sidecar):
+        """ Take an indexsidecar and return the position of rows matching the filter
+
+        Parameters
+        ----------
+        sidecar: :class:`argopy.stores.indexsidecar`
+
+        Returns
+        -------
+        :class:`numpy.ndarray` of integers
+        """
+        raise NotImplementedError("%s can't search a binary index sidecar" % type(self).__name__)
+
     @property
     def sha(self):
         """ Unique filter hash string """
@@ -90,6 +113,11 @@ class indexfilter_wmo(indexfilter_proto):
         self.WMO = sorted(WMO)
         self.CYC = CYC
 
+    @property
+    def chunkable(self):
+        # Without WMOs, the index file is scanned in order. Otherwise, rows are returned float by float.
+        return len(self.WMO) == 0
+
     def uri(self):
         """ Return a unique name for this filter instance """
         if len(self.WMO) > 1:
@@ -114,12 +142,15 @@ class indexfilter_wmo(indexfilter_proto):
             listname = hashlib.sha256(listname.encode()).hexdigest()
         return listname
 
-    def run(self, index_file):
+    def run(self, index_file, wmo_table=None, **kwargs):
         """ Run search on an Argo index file
 
         Parameters
         ----------
         index_file: _io.TextIOWrapper
+        wmo_table: :class:`argopy.stores.indexwmotable`, optional
+            Table of the blocks of rows of each float in the index file. If provided, floats are read directly from
+            their position in the index file, instead of scanning it.
 
         Returns
         -------
@@ -127,6 +158,28 @@ class indexfilter_wmo(indexfilter_proto):
         """
 
         # Define one-line search functions:
+        def read_one_wmo(index, wmo):
+            """ Read rows of a WMO in the argo index file, using the table of WMO blocks
+
+            Parameters
+            ----------
+            index_file: _io.TextIOWrapper
+            wmo: int
+
+            Returns
+            -------
+            csv chunk matching the request, as a string. Or None
+            """
+            results = []
+            offset, row, count = wmo_table.blocks(wmo)
+            for ib in range(0, len(offset)):
+                index.seek(offset[ib])
+                results += [index.readline() for i in range(count[ib])]
+            if len(results) > 0:
+                return "".join(results)
+            else:
+                return None
+
         def search_one_wmo(index, wmo):
             """ Search for a WMO in the argo index file
 
@@ -139,21 +192,23 @@ class indexfilter_wmo(indexfilter_proto):
             -------
             csv chunk matching the request, as a string. Or None
             """
+            if wmo_table is not None:
+                return read_one_wmo(index, wmo)
             index.seek(0)
-            results = ""
+            results = []
             il_read, il_loaded, il_this = 0, 0, 0
             for line in index:
                 il_this = il_loaded
                 # if re.search("/%i/" % wmo, line.split(',')[0]):
                 if "/%i/" % wmo in line:  # much faster than re
                     # Search for the wmo at the beginning of the file name under: /<dac>/<wmo>/profiles/
-                    results += line
+                    results.append(line)
                     il_loaded += 1
                 if il_this == il_loaded and il_this > 0:
                     break  # Since the index is sorted, once we found the float, we can stop reading the index !
                 il_read += 1
             if il_loaded > 0:
-                return results
+                return "".join(results)
             else:
                 return None
 
@@ -182,15 +237,15 @@ class indexfilter_wmo(indexfilter_proto):
             """
             search_this = define_search_this(cyc)
             index.seek(0)
-            results = ""
+            results = []
             il_read, il_loaded = 0, 0
             for line in index:
                 if search_this(line):
-                    results += line
+                    results.append(line)
                     il_loaded += 1
                 il_read += 1
             if il_loaded > 0:
-                return results
+                return "".join(results)
             else:
                 return None
 
@@ -207,31 +262,20 @@ class indexfilter_wmo(indexfilter_proto):
             -------
             csv chunk matching the request, as a string. Or None
             """
-            index.seek(0)
-            results = ""
-
             # Look for the float:
-            il_read, il_loaded, il_this = 0, 0, 0
-            for line in index:
-                il_this = il_loaded
-                # if re.search("/%i/" % wmo, line.split(',')[0]):
-                if "/%i/" % wmo in line:  # much faster than re
-                    results += line
-                    il_loaded += 1
-                if il_this == il_loaded and il_this > 0:
-                    break  # Since the index is sorted, once we found the float, we can stop reading the index !
-                il_read += 1
+            results = search_one_wmo(index, wmo)
+            il_loaded = 0
 
             # Then look for the profile:
             if results:
                 search_this = define_search_this(cyc)
-                il_loaded, cyc_results = 0, ""
+                il_loaded, cyc_results = 0, []
                 for line in results.split():
                     if search_this(line):
                         il_loaded += 1
-                        cyc_results += line + "\n"
+                        cyc_results.append(line + "\n")
             if il_loaded > 0:
-                return cyc_results
+                return "".join(cyc_results)
             else:
                 return None
 
@@ -270,6 +314,28 @@ class indexfilter_wmo(indexfilter_proto):
             else:
                 return search_one_wmo(index_file, self.WMO[0])
 
+    def locate(self, sidecar):
+        """ Search for WMOs and/or CYCs in a binary index sidecar
+
+        Parameters
+        ----------
+        sidecar: :class:`argopy.stores.indexsidecar`
+
+        Returns
+        -------
+        :class:`numpy.ndarray` of integers with the position of rows matching the request
+        """
+        def search_cyc(rows):
+            if isinstance(self.CYC, (np.ndarray)):
+                rows = rows[np.isin(sidecar['cyc'][rows], self.CYC)]
+            return rows
+
+        if len(self.WMO) == 0:
+            return search_cyc(np.arange(0, len(sidecar)))
+        else:
+            rows = [search_cyc(sidecar.wmo_rows(wmo)) for wmo in self.WMO]
+            return np.concatenate(rows).astype(np.int64)
+
 
 class indexfilter_box(indexfilter_proto):
     """ Index filter based on LATITUDE, LONGITUDE, DATE
@@ -295,6 +361,8 @@ class indexfilter_box(indexfilter_proto):
 
     """
 
+    chunkable = True
+
     def __init__(self, BOX: list = [], **kwargs):
         """ Create Argo index filter for LATITUDE, LONGITUDE, DATE
 
@@ -347,7 +415,7 @@ class indexfilter_box(indexfilter_proto):
         csv chunk matching the request, as a string. Or None
         """
         index.seek(0)
-        results = ""
+        results = []
         iv_lat, iv_lon = 2, 3
         il_loaded = 0
         for ii in range(0, 9):
@@ -359,10 +427,10 @@ class indexfilter_box(indexfilter_proto):
                 x = float(l[iv_lon])
                 y = float(l[iv_lat])
                 if x >= lon[0] and x <= lon[1] and y >= lat[0] and y <= lat[1]:
-                    results += line
+                    results.append(line)
                     il_loaded += 1
         if il_loaded > 0:
-            return results
+            return "".join(results)
         else:
             return None
 
@@ -374,47 +442,34 @@ class indexfilter_box(indexfilter_proto):
         index_file: _io.TextIOWrapper
         lon: [float, float]
         lat: [float, float]
+        tim: [pd.datetime, pd.datetime]
 
         Returns
         -------
         csv chunk matching the request, as a string. Or None
         """
+        # Index dates are YYYYMMDDHHMMSS strings, so they can be compared to the bounds without parsing them:
+        tim = [t.strftime('%Y%m%d%H%M%S') for t in pd.to_datetime(tim)]
+        index.seek(0)
+        results = []
+        iv_tim, iv_lat, iv_lon = 1, 2, 3
+        for ii in range(0, 9):
+            index.readline()
+        for line in index:
+            l = line.split(",")
+            # First search in time, since it's the cheapest test:
+            if len(l[iv_tim]) == 14 and l[iv_tim] >= tim[0] and l[iv_tim] <= tim[1] \
+                    and l[iv_lon] != "" and l[iv_lat] != "":
+                x = float(l[iv_lon])
+                y = float(l[iv_lat])
+                if x >= lon[0] and x <= lon[1] and y >= lat[0] and y <= lat[1]:
+                    results.append(line)
+        if len(results) > 0:
+            return "".join(results)
+        else:
+            return None
 
-        def search_tim(index, tim):
-            """ Search
-
-            Parameters
-            ----------
-            index_file: str csv like
-            tim: [pd.datetime, pd.datetime]
-
-            Returns
-            -------
-            csv chunk matching the request, as a string. Or None
-            """
-            results = ""
-            iv_tim = 1
-            il_loaded = 0
-            for line in index.split():
-                l = line.split(",")
-                if l[iv_tim] != "":
-                    t = pd.to_datetime(str(l[iv_tim]))
-                    if t >= tim[0] and t <= tim[1]:
-                        results += line + "\n"
-                        il_loaded += 1
-            if il_loaded > 0:
-                return results
-            else:
-                return None
-
-        # First search in space:
-        results = self.search_latlon(index, self.BOX[0:2], self.BOX[2:4])
-        # Then refine in time:
-        if results:
-            results = search_tim(results, pd.to_datetime(self.BOX[4:6]))
-        return results
-
-    def run(self, index_file):
+    def run(self, index_file, **kwargs):
         """ Run search on an Argo index file
 
         Parameters
@@ -432,14 +487,103 @@ class indexfilter_box(indexfilter_proto):
         else:
             return self.search_latlontim(index_file, self.BOX[0:2], self.BOX[2:4], pd.to_datetime(self.BOX[4:6]))
 
+    def locate(self, sidecar):
+        """ Search for a space/time domain in a binary index sidecar
+
+        Parameters
+        ----------
+        sidecar: :class:`argopy.stores.indexsidecar`
+
+        Returns
+        -------
+        :class:`numpy.ndarray` of integers with the position of rows matching the request
+        """
+        # Only test rows from the spatial grid cells overlapping the box:
+        slices = sidecar.grid_slices(self.BOX[0:2], self.BOX[2:4])
+        ncandidates = np.sum(slices[1] - slices[0])
+
+        if len(self.BOX) == 6:
+            # or from the time partitions overlapping the time range, if there are less of them:
+            tim = pd.to_datetime(self.BOX[4:6]).values.astype('datetime64[s]').view(np.int64)
+            lo, hi = sidecar.time_slice(tim)
+            if hi - lo <= ncandidates:
+                rows = sidecar.time_candidates(tim)
+                lon, lat = sidecar['longitude'][rows], sidecar['latitude'][rows]
+                mask = (lon >= self.BOX[0]) & (lon <= self.BOX[1]) & (lat >= self.BOX[2]) & (lat <= self.BOX[3])
+                return rows[mask]
+
+        if ncandidates > len(sidecar) / 4:
+            rows = slice(None)  # Large box, test all rows
+        else:
+            rows = sidecar.grid_candidates(self.BOX[0:2], self.BOX[2:4])
+        lon, lat = sidecar['longitude'][rows], sidecar['latitude'][rows]
+        mask = (lon >= self.BOX[0]) & (lon <= self.BOX[1]) & (lat >= self.BOX[2]) & (lat <= self.BOX[3])
+        if len(self.BOX) == 6:
+            dates = sidecar['date'][rows]
+            mask &= (dates != np.iinfo(np.int64).min) & (dates >= tim[0]) & (dates <= tim[1])
+        return np.flatnonzero(mask) if isinstance(rows, slice) else rows[mask]
+
+
+def index_chunks(index_file: str, nchunks: int):
+    """ Split the rows of an Argo index file into byte ranges aligned on new lines
+
+        Parameters
+        ----------
+        index_file: str
+            Path to an Argo index file
+        nchunks: int
+            Number of chunks to split the index into
+
+        Returns
+        -------
+        header: str
+            Header lines of the index file
+        bounds: list
+            List of (start, stop) byte ranges, in file order
+    """
+    with open(index_file, "rb") as f:
+        line = f.readline()
+        while line.startswith(b"#"):
+            line = f.readline()
+        start = f.tell()  # Rows start after the column names line
+        f.seek(0)
+        header = f.read(start).decode()
+        size = os.fstat(f.fileno()).st_size
+        edges = [start]
+        for edge in np.linspace(start, size, nchunks + 1)[1:-1]:
+            f.seek(int(edge))
+            f.readline()  # Move to the next new line
+            edges.append(max(f.tell(), edges[-1]))
+        edges.append(size)
+    return header, [(a, b) for a, b in zip(edges[:-1], edges[1:]) if b > a]
+
+
+def _run_chunk(search_cls, index_file, header, start, stop):
+    """ Run a search on a byte range of an Argo index file, as if it was the whole file """
+    with open(index_file, "rb") as f:
+        f.seek(start)
+        rows = f.read(stop - start).decode()
+    return search_cls.run(io.StringIO(header + rows))
+
 
 class indexstore():
-    """" Use to manage access to a local Argo index and searches """
+    """" Use to manage access to a local Argo index and searches
+
+    With the ``numpy`` engine (default), the index file is converted once into a binary sidecar
+    (see :class:`argopy.stores.indexsidecar`) and searches are vectorized on its columns. The sidecar is saved in the
+    cache folder when the cache is activated, and kept in memory otherwise.
+    With the ``text`` engine, searches are performed line by line on the index file.
+
+    When the cache is activated, search results are saved in a :class:`argopy.stores.indexsearchcache`.
+    """
 
     def __init__(self,
                  cache: bool = False,
                  cachedir: str = "",
                  index_file: str = "ar_index_global_prof.txt",
+                 engine: str = "",
+                 search_cache: indexsearchcache = None,
+                 workers: int = None,
                  **kw):
         """ Create a file storage system for Argo index file requests
 
@@ -448,6 +592,13 @@ class indexstore():
             cache : bool (False)
             cachedir : str (used value in global OPTIONS)
             index_file: str ("ar_index_global_prof.txt")
+            engine: str (used value in global OPTIONS)
+                Search engine, 'numpy' or 'text'
+            search_cache: :class:`argopy.stores.indexsearchcache`, optional
+                Cache of search results to use if the cache is activated. By default, a cache with default sizes is
+                created in ``cachedir`` for the index file.
+            workers: int (used value in global OPTIONS)
+                Number of processes used to scan the index file with the 'text' engine
 
         """
         self.index_file = index_file
@@ -455,28 +606,44 @@ class indexstore():
         self.cachedir = OPTIONS['cachedir'] if cachedir == '' else cachedir
         self.fs = {}
         self.fs['index'] = filestore(cache, cachedir)
-        self.fs['search'] = memorystore(cache, cachedir)
+        if cache:
+            if search_cache is None:
+                namespace = hashlib.sha256(os.path.abspath(index_file).encode()).hexdigest()
+                search_cache = indexsearchcache(self.cachedir, namespace)
+            self.search_cache = search_cache
+        else:
+            self.search_cache = None
+        self.search_registry = []  # Will hold sha of searches cached by this store instance
+        self.engine = OPTIONS['index_engine'] if engine == '' else engine
+        self.workers = OPTIONS['index_workers'] if workers is None else workers
+        if self.engine not in ['numpy', 'text']:
+            raise ValueError("Unknown index engine: '%s'" % self.engine)
+        sidecar_dir = self.cachedir if cache else None  # Without cache, sidecars are only kept in memory
+        if self.engine == 'numpy':
+            self.sidecar = indexsidecar(index_file, sidecar_dir)
+            self.wmo_table = self.sidecar.wmo_table
+        else:
+            self.sidecar = None
+            self.wmo_table = indexwmotable(index_file, sidecar_dir)
 
     def cachepath(self, uri: str, errors: str = 'raise'):
         """ Return path to cached file for a given URI """
-        return self.fs['search'].cachepath(uri, errors)
+        if not self.cache:
+            if errors == 'raise':
+                raise FileSystemHasNoCache("%s has no cache system" % type(self).__name__)
+        else:
+            return self.search_cache.cachepath(hashlib.sha256(uri.encode()).hexdigest(), errors)
 
     def clear_cache(self):
         self.fs['index'].clear_cache()
-        self.fs['search'].clear_cache()
-
-    def in_cache(self, fs, uri):
-        """ Return true if uri is cached """
-        if not uri.startswith(fs.target_protocol):
-            store_path = fs.target_protocol + "://" + uri
-        else:
-            store_path = uri
-        fs.load_cache()
-        return store_path in fs.cached_files[-1]
+        if self.cache:
+            for sha in self.search_registry:
+                self.search_cache.remove(sha)
 
-    def in_memory(self, fs, uri):
-        """ Return true if uri is in the memory store """
-        return uri in fs.store
+    def _cache_results(self, search_cls, results):
+        """ Save the results of a search in the search cache """
+        self.search_cache.put(search_cls.sha, results, search_cls)
+        self.search_registry.append(search_cls.sha)
 
     def open_index(self):
         return self.fs['index'].open(self.index_file, "r")
@@ -484,13 +651,19 @@ class indexstore():
     def res2dataframe(self, results):
         """ Convert a csv like string into a DataFrame
 
-            If one columns has a missing value, the row is skipped
+            Rows with missing values are kept: missing dates are NaT, missing positions and codes are NaN.
+            Ocean, profiler type and institution codes are categorical columns.
         """
         cols_name = ['file', 'date', 'latitude', 'longitude', 'ocean', 'profiler_type', 'institution', 'date_update']
-        cols_type = {'file': np.str, 'date': np.datetime64, 'latitude': np.float32, 'longitude': np.float32,
-                     'ocean': np.str, 'profiler_type': np.str, 'institution': np.str, 'date_update': np.datetime64}
-        data = [x.split(',') for x in results.split('\n') if ",," not in x]
-        return pd.DataFrame(data, columns=cols_name).astype(cols_type)[:-1]
+        cols_type = {'file': str, 'date': np.float64, 'latitude': np.float32, 'longitude': np.float32,
+                     'ocean': 'category', 'profiler_type': 'category', 'institution': 'category',
+                     'date_update': np.float64}
+        df = pd.read_csv(io.StringIO(results), sep=",", header=None, names=cols_name, dtype=cols_type,
+                         keep_default_na=False, na_values=[""], engine='c')
+        for col in ['date', 'date_update']:
+            # Dates are YYYYMMDDHHMMSS numbers:
+            df[col] = _to_epoch(df[col].values).astype('datetime64[s]').astype('datetime64[ns]')
+        return df
 
     def open_dataframe(self, search_cls):
         """ Run a search on an Argo index file and return a Pandas dataframe with results
@@ -504,21 +677,119 @@ class indexstore():
         :class:`pandas.DataFrame`
         """
         uri = search_cls.uri()
-        with self.open_index() as f:
-            if self.cache and (self.in_cache(self.fs['search'].fs, uri) or self.in_memory(self.fs['search'].fs, uri)):
-                # print('Search already in memory, loading:', uri)
-                with self.fs['search'].open(uri, "r") as of:
-                    df = self.res2dataframe(of.read())
-            else:
-                # print('Running search from scratch ...')
-                # Run search:
-                results = search_cls.run(f)
-                if not results:
-                    raise DataNotFound("No Argo data in the index correspond to your search criteria.\nSearch URI: %s" % uri)
+        if self.cache:
+            # Forget searches of a previous version of the index file:
+            self.search_cache.validate("%(mtime)r-%(size)i" % _source_signature(self.index_file))
+            results = self.search_cache.get(search_cls.sha)
+            if results is not None:
+                self.search_registry.append(search_cls.sha)
+                return self.res2dataframe(results)
+
+        if self.sidecar is not None:
+            # Run search on the binary sidecar:
+            sidecar = self.sidecar.open()
+            try:
+                rows = search_cls.locate(sidecar)
+            except NotImplementedError:
+                rows = None  # This filter can only scan the text file
+            if rows is not None:
+                if len(rows) == 0:
+                    raise DataNotFound("No Argo data in the index correspond to your search criteria."
+                                       "\nSearch URI: %s" % uri)
                 # and save results for caching:
                 if self.cache:
-                    with self.fs['search'].open(uri, "w") as of:
-                        of.write(results)  # This happens in memory
-                    self.fs['search'].fs.save_cache()
-                df = self.res2dataframe(results)
+                    self._cache_results(search_cls, sidecar.to_text(rows))
+                return sidecar.to_dataframe(rows)
+
+        # Scan the text index file:
+        if self.workers > 1 and search_cls.chunkable:
+            results = self.run_parallel(search_cls)
+        else:
+            with self.open_index() as f:
+                # print('Running search from scratch ...')
+                # Run search:
+                results = search_cls.run(f, wmo_table=self.wmo_table.open())
+        if not results:
+            raise DataNotFound("No Argo data in the index correspond to your search criteria.\nSearch URI: %s" % uri)
+        # and save results for caching:
+        if self.cache:
+            self._cache_results(search_cls, results)
+        df = self.res2dataframe(results)
         return df
+
+    def run_parallel(self, search_cls, nchunks: int = None):
+        """ Run a search on chunks of the index file, in a pool of processes
+
+            Parameters
+            ----------
+            search_cls: Class instance inhereting from index_filter_proto, with ``chunkable`` True
+            nchunks: int, optional
+                Number of chunks to split the index file into. Default to 4 times the number of workers.
+
+            Returns
+            -------
+            csv rows matching the request, as in-memory string, in the index file order. Or None.
+        """
+        nchunks = 4 * self.workers if nchunks is None else nchunks
+        header, bounds = index_chunks(self.index_file, nchunks)
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            parts = executor.map(_run_chunk,
+                                 [search_cls] * len(bounds),
+                                 [self.index_file] * len(bounds),
+                                 [header] * len(bounds),
+                                 [b[0] for b in bounds],
+                                 [b[1] for b in bounds])
+            results = "".join([p for p in parts if p])
+        return results if len(results) > 0 else None
+
+    def aggregate(self, by: str):
+        """ Return the precomputed number of profiles in the index per DAC, institution, profiler type, ocean, month
+            or float
+
+            See :meth:`argopy.stores.indexsidecar.aggregate`
+        """
+        if self.sidecar is None:
+            raise ValueError("Index aggregates require the 'numpy' index engine")
+        return self.sidecar.open().aggregate(by)
+
+    def update(self, delta_file: str):
+        """ Merge an Argo index delta file into the binary sidecar of the index
+
+            Rows are upserted by file path using ``date_update`` (see :meth:`argopy.stores.indexsidecar.merge`),
+            and cached searches overlapping the updated or added rows are removed from the search cache.
+
+            Parameters
+            ----------
+            delta_file: str
+                Path to an Argo profile index file with the latest profiles, like "ar_index_this_week_prof.txt"
+
+            Returns
+            -------
+            :class:`numpy.ndarray` of integers, sorted, with the position of updated and added rows
+        """
+        if self.sidecar is None:
+            raise ValueError("Index updates require the 'numpy' index engine")
+        rows = self.sidecar.merge(delta_file)
+        if len(rows) > 0 and self.cache:
+            self._invalidate(rows)
+        return rows
+
+    def _invalidate(self, rows):
+        """ Remove from the search cache the searches overlapping a list of sidecar rows """
+        sidecar = self.sidecar
+        files = set(sidecar['file'][rows].astype(str).tolist())
+        for sha in self.search_cache.keys():
+            results = self.search_cache.peek(sha)
+            if results is None:
+                continue
+            # Rows matching the search before the update:
+            overlap = any([line.split(",")[0] in files for line in results.split("\n")])
+            # or after the update:
+            if not overlap:
+                search_cls = self.search_cache.search(sha)
+                try:
+                    overlap = search_cls is None or np.any(np.isin(rows, search_cls.locate(sidecar)))
+                except NotImplementedError:
+                    overlap = True
+            if overlap:
+                self.search_cache.remove(sha)
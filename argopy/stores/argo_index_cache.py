@@ -0,0 +1,268 @@
+#!/bin/env python
+# -*coding: UTF-8 -*-
+"""
+Cache of Argo index search results
+
+Search results are csv like strings, saved under the sha of the index filter that produced them, possibly with the
+filter itself, so that saved searches can be tested against index updates. Results are saved with the signature of
+the index file, and all of them are removed when the index file changes.
+The cache has two tiers: an in-process tier, shared by all cache instances of the same folder, in front of an
+on-disk tier. Both tiers are bounded in number of entries and in bytes, and evict their least recently used entries.
+The in-process tier only holds copies of results saved on disk, so that removing a result file invalidates it.
+
+"""
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict, Counter
+
+from argopy.errors import CacheFileNotFound
+
+
+class indexsearchcache():
+    """ Two-tier LRU cache of Argo index search results
+
+    Examples
+    --------
+
+    cache = indexsearchcache("~/.cache/argopy", max_entries=128)
+    cache.put(filt.sha, results, filt)
+    cache.get(filt.sha)
+    cache.stats()
+
+    """
+    _memory = {}
+    """ In-process tiers, by cache folder """
+
+    _stats = {}
+    """ Cache counters, by cache folder """
+
+    _lock = threading.RLock()
+
+    def __init__(self,
+                 cachedir: str,
+                 namespace: str = "",
+                 max_entries: int = 256,
+                 max_bytes: int = 256 * 2**20,
+                 max_disk_entries: int = 4096,
+                 max_disk_bytes: int = 2**30):
+        """ Create a search results cache
+
+            Parameters
+            ----------
+            cachedir: str
+                Cache folder, results are saved in its "search" sub-folder
+            namespace: str, optional
+                Name of a sub-folder of the "search" folder, to separate results of different index files
+            max_entries: int (256)
+                Maximum number of results in the in-process tier
+            max_bytes: int (256Mb)
+                Maximum size of results in the in-process tier
+            max_disk_entries: int (4096)
+                Maximum number of results in the on-disk tier
+            max_disk_bytes: int (1Gb)
+                Maximum size of results in the on-disk tier
+        """
+        self.cachedir = cachedir
+        self.path = os.path.join(os.path.abspath(cachedir), "search", namespace)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_disk_entries = max_disk_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.signature = None  # Version of the searched source, see validate
+        with self._lock:
+            self.memory = self._memory.setdefault(self.path, OrderedDict())
+            self.counters = self._stats.setdefault(self.path, Counter())
+
+    def __repr__(self):
+        summary = ["<indexsearchcache>"]
+        summary.append("Folder: %s" % self.path)
+        summary.append("In memory: %i results, %i bytes" % (len(self.memory), self._memory_bytes()))
+        return "\n".join(summary)
+
+    def _file(self, sha, ext="csv"):
+        return os.path.join(self.path, "%s.%s" % (sha, ext))
+
+    def _memory_bytes(self):
+        return sum([len(v) for v in self.memory.values()])
+
+    def __contains__(self, sha):
+        return os.path.exists(self._file(sha))
+
+    def cachepath(self, sha: str, errors: str = 'raise'):
+        """ Return path to the cached file of a search result """
+        fn = self._file(sha)
+        if os.path.exists(fn):
+            return fn
+        elif errors == 'raise':
+            raise CacheFileNotFound("No cached file found in %s for: \n%s" % (self.path, sha))
+
+    def peek(self, sha: str):
+        """ Return a search result without updating counters and recency, or None if not cached """
+        with self._lock:
+            if sha in self.memory and os.path.exists(self._file(sha)):
+                return self.memory[sha]
+        try:
+            with open(self._file(sha), "r") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def validate(self, signature: str):
+        """ Remove all search results if they were saved for another version of the searched source
+
+            The signature is saved with the next search result, so that later caches find results of the same version.
+
+            Parameters
+            ----------
+            signature: str
+                Version of the searched source, like the modification time and size of an index file
+        """
+        self.signature = signature
+        try:
+            with open(self._file("signature", "txt"), "r") as f:
+                saved = f.read()
+        except FileNotFoundError:
+            saved = None
+        if saved != signature and (saved is not None or len(self.keys()) > 0):
+            self.clear()
+
+    def get(self, sha: str):
+        """ Return a search result, or None if not cached
+
+            Results found on disk are moved to the in-process tier.
+        """
+        fn = self._file(sha)
+        with self._lock:
+            if sha in self.memory:
+                if os.path.exists(fn):
+                    self.memory.move_to_end(sha)
+                    self.counters['hits'] += 1
+                    self.counters['memory_hits'] += 1
+                    return self.memory[sha]
+                self.memory.pop(sha)  # Removed from disk by someone else
+        try:
+            with open(fn, "r") as f:
+                results = f.read()
+            os.utime(fn)  # Mark as recently used
+        except FileNotFoundError:
+            with self._lock:
+                self.counters['misses'] += 1
+            return None
+        with self._lock:
+            self.counters['hits'] += 1
+            self.counters['disk_hits'] += 1
+            self._put_memory(sha, results)
+        return results
+
+    def keys(self):
+        """ Return the sha of all cached search results """
+        if not os.path.isdir(self.path):
+            return []
+        return sorted([e.name[:-4] for e in os.scandir(self.path) if e.name.endswith(".csv")])
+
+    def search(self, sha: str):
+        """ Return the filter saved with a search result, or None """
+        try:
+            with open(self._file(sha, "pkl"), "rb") as f:
+                return pickle.load(f)
+        except (FileNotFoundError, pickle.UnpicklingError, AttributeError, EOFError):
+            return None
+
+    def put(self, sha: str, results: str, search=None):
+        """ Save a search result in both tiers
+
+            Parameters
+            ----------
+            sha: str
+                Search key
+            results: str
+                Search result
+            search: optional
+                Filter of the search, saved on disk with the result
+        """
+        os.makedirs(self.path, exist_ok=True)
+        if self.signature is not None and not os.path.exists(self._file("signature", "txt")):
+            fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                f.write(self.signature)
+            os.replace(tmp, self._file("signature", "txt"))
+        if search is not None:
+            fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(search, f)
+            os.replace(tmp, self._file(sha, "pkl"))
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(results)
+        os.replace(tmp, self._file(sha))
+        with self._lock:
+            self._put_memory(sha, results)
+            self._evict_disk()
+
+    def _put_memory(self, sha, results):
+        self.memory[sha] = results
+        self.memory.move_to_end(sha)
+        size = self._memory_bytes()
+        while len(self.memory) > self.max_entries or (size > self.max_bytes and len(self.memory) > 0):
+            sha, results = self.memory.popitem(last=False)
+            size -= len(results)
+            self.counters['evictions'] += 1
+
+    def _evict_disk(self):
+        if not os.path.isdir(self.path):
+            return
+        entries = [e for e in os.scandir(self.path) if e.name.endswith(".csv")]
+        size = sum([e.stat().st_size for e in entries])
+        if len(entries) <= self.max_disk_entries and size <= self.max_disk_bytes:
+            return
+        entries = sorted(entries, key=lambda e: e.stat().st_mtime)  # Least recently used first
+        while entries and (len(entries) > self.max_disk_entries or size > self.max_disk_bytes):
+            e = entries.pop(0)
+            size -= e.stat().st_size
+            self._remove_files(e.name[:-4])
+            self.counters['disk_evictions'] += 1
+
+    def _remove_files(self, sha):
+        self.memory.pop(sha, None)
+        for ext in ["csv", "pkl"]:
+            try:
+                os.remove(self._file(sha, ext))
+            except FileNotFoundError:
+                pass
+
+    def remove(self, sha: str):
+        """ Remove a search result from both tiers """
+        with self._lock:
+            self._remove_files(sha)
+
+    def clear(self):
+        """ Remove all search results from both tiers """
+        with self._lock:
+            self.memory.clear()
+        if os.path.isdir(self.path):
+            for e in os.scandir(self.path):
+                if e.is_file():
+                    os.remove(e.path)
+
+    def stats(self):
+        """ Return cache counters
+
+            Returns
+            -------
+            dict
+                Number of ``hits`` (``memory_hits`` and ``disk_hits``), ``misses``, in-process tier ``evictions`` and
+                ``disk_evictions``, with the number of ``entries`` and ``bytes`` in the in-process tier.
+        """
+        with self._lock:
+            stats = {k: self.counters[k] for k in ['hits', 'memory_hits', 'disk_hits', 'misses',
+                                                   'evictions', 'disk_evictions']}
+            stats['entries'] = len(self.memory)
+            stats['bytes'] = self._memory_bytes()
+        return stats
+
+    def reset_stats(self):
+        """ Reset cache counters """
+        with self._lock:
+            self.counters.clear()
@@ -0,0 +1,842 @@
+#!/bin/env python
+# -*coding: UTF-8 -*-
+"""
+Columnar binary copy of an Argo index file
+
+The GDAC profile index "ar_index_global_prof.txt" is a ~200Mb csv file. Scanning it line by line for every search is
+slow, so we convert it once into a set of numpy arrays (one per column), saved in the argopy cache directory.
+Searches are then performed on memory-mapped arrays, without loading them fully in memory.
+Without a cache directory, arrays are kept in memory for the session.
+
+We also maintain a table of the index blocks of each float, sorted by WMO, so that float searches can seek straight
+to the relevant rows, a lat/lon bucket grid of profile positions, so that region searches only test rows from
+the grid cells overlapping the region, and the list of rows sorted by date in monthly partitions, so that date
+bounded searches can select rows with a binary search. Number of profiles per DAC, institution, profiler type, ocean,
+month and float are also precomputed.
+
+Binary files are rebuilt automatically whenever the modification time or the size of the source index file changes.
+Until then, GDAC delta files like "ar_index_this_week_prof.txt" can be merged into the sidecar, without a rebuild.
+
+"""
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+import pandas as pd
+
+
+def _fixed_width_strings(buf, start, stop):
+    """ Extract byte strings buf[start:stop] as a fixed width numpy array """
+    width = stop - start
+    maxlen = max(int(width.max()) if len(width) > 0 else 0, 1)
+    chars = np.zeros((len(start), maxlen), dtype=np.uint8)
+    for j in range(0, maxlen):
+        inside = j < width
+        chars[inside, j] = buf[start[inside] + j]
+    return chars.view("S%i" % maxlen).ravel()
+
+
+def _parse_digits(buf, start, stop):
+    """ Parse integers written with digits in buf[start:stop]
+
+        Returns
+        -------
+        values: :class:`numpy.ndarray`
+        ok: :class:`numpy.ndarray` of boolean, False where buf[start:stop] is not a valid integer
+    """
+    width = stop - start
+    ok = (width > 0) & (width <= 12)
+    values = np.zeros(len(start), dtype=np.int64)
+    for j in range(0, 12):
+        inside = ok & (j < width)
+        if not np.any(inside):
+            break
+        digit = buf[np.where(inside, start + j, 0)].astype(np.int64) - ord("0")
+        ok &= ~inside | ((digit >= 0) & (digit <= 9))
+        values = np.where(inside, values * 10 + digit, values)
+    return values, ok
+
+
+def _line_bounds(buf):
+    """ Return start and end positions of the data lines of an Argo index file
+
+        Comment lines, the column names line and empty lines are skipped.
+
+        Returns
+        -------
+        starts, ends: :class:`numpy.ndarray`
+            Position of the first character and of the end of line of each data line
+        nskip: int
+            Number of header lines
+    """
+    ends = np.flatnonzero(buf == ord("\n"))
+    if len(buf) > 0 and buf[-1] != ord("\n"):
+        ends = np.append(ends, len(buf))
+    starts = np.concatenate(([0], ends[:-1] + 1)).astype(np.int64)
+
+    # Skip comment lines and the column names line:
+    nskip = 0
+    while nskip < len(starts) and starts[nskip] < len(buf) and buf[starts[nskip]] == ord("#"):
+        nskip += 1
+    nskip += 1
+    starts, ends = starts[nskip:], ends[nskip:]
+    # Skip empty lines, like pandas does:
+    keep = ends > starts
+    return starts[keep], ends[keep], nskip
+
+
+def _first_comma(buf, starts, ends):
+    """ Return the position of the first comma of each line """
+    commas = np.append(np.flatnonzero(buf == ord(",")), len(buf))
+    return np.minimum(commas[np.searchsorted(commas, starts)], ends)
+
+
+def _parse_wmo(buf, starts, comma):
+    """ Return the float WMO of each line, from the <dac>/<wmo>/ file path prefix, -1 if not found """
+    slashes = np.append(np.flatnonzero(buf == ord("/")), [len(buf), len(buf)])
+    islash = np.searchsorted(slashes, starts)
+    wmo, ok = _parse_digits(buf, slashes[islash] + 1, slashes[islash + 1])
+    ok &= slashes[islash + 1] < comma
+    return np.where(ok, wmo, -1)
+
+
+def _parse_dac(buf, starts, comma):
+    """ Return the DAC of each line, from the <dac>/ file path prefix, as a fixed width byte string """
+    slashes = np.append(np.flatnonzero(buf == ord("/")), len(buf))
+    stop = slashes[np.searchsorted(slashes, starts)]
+    return _fixed_width_strings(buf, starts, np.where(stop < comma, stop, starts))
+
+
+def _to_epoch(values):
+    """ Convert YYYYMMDDHHMMSS numbers into seconds since 1970-01-01
+
+        Missing or invalid dates are set to NaT, ie the int64 minimum value
+    """
+    valid = np.isfinite(values)
+    v = np.where(valid, values, 19700101000000).astype(np.int64)
+    Y, v = np.divmod(v, 10**10)
+    M, v = np.divmod(v, 10**8)
+    D, v = np.divmod(v, 10**6)
+    h, v = np.divmod(v, 10**4)
+    m, s = np.divmod(v, 10**2)
+    valid &= (M >= 1) & (M <= 12) & (D >= 1) & (h <= 23) & (m <= 59) & (s <= 59)
+    month = ((Y - 1970) * 12 + np.clip(M - 1, 0, 11)).astype('datetime64[M]')
+    day = month.astype('datetime64[D]')
+    valid &= D <= ((month + 1).astype('datetime64[D]') - day).astype(np.int64)
+    t = (day + (D - 1)).astype('datetime64[s]').view(np.int64) + h * 3600 + m * 60 + s
+    t[~valid] = np.iinfo(np.int64).min
+    return t
+
+
+def _source_signature(index_file):
+    """ Return the modification time and size of an index file """
+    st = os.stat(index_file)
+    return {'mtime': st.st_mtime, 'size': st.st_size}
+
+
+class indexwmotable():
+    """ Table of the blocks of rows of each float in an Argo index file
+
+    The index file is sorted by DAC/WMO file path, not by WMO, so to retrieve all rows of a float we record, for each
+    contiguous block of rows of the same float, its first byte offset, its first row and its number of rows.
+    The table is sorted by WMO, hence a float lookup is a binary search.
+
+    If a cache folder is given, the table is saved next to the binary sidecar of the index, otherwise it is only kept
+    in memory for the current session.
+
+    Examples
+    --------
+
+    tbl = indexwmotable("/Volumes/Data/ARGO/ar_index_global_prof.txt").open()
+    offset, row, count = tbl.blocks(6901929)
+    tbl.rows(6901929)
+
+    """
+    _memory = {}
+    """ In memory tables, for tables without a cache folder """
+
+    def __init__(self, index_file: str, cachedir: str = None):
+        """ Create a WMO table manager for an Argo index file
+
+            Parameters
+            ----------
+            index_file: str
+                Path to the Argo index file
+            cachedir : str, optional
+                Directory where to save the table. If None (default), the table is not saved.
+        """
+        self.index_file = os.path.abspath(index_file)
+        self.cachedir = cachedir
+        if cachedir is not None:
+            sha = hashlib.sha256(self.index_file.encode()).hexdigest()
+            self.path = os.path.join(cachedir, "index", "%s_wmo.npz" % sha)
+        else:
+            self.path = None
+        self._table = None
+
+    def __repr__(self):
+        summary = ["<indexwmotable>"]
+        summary.append("Index: %s" % self.index_file)
+        summary.append("Table: %s" % (self.path if self.path is not None else "in memory"))
+        if self._table is not None:
+            summary.append("Floats: %i" % len(np.unique(self._table['wmo'])))
+        return "\n".join(summary)
+
+    def _load(self):
+        """ Return the last saved table, or None """
+        if self.path is None:
+            return self._memory.get(self.index_file, None)
+        elif os.path.exists(self.path):
+            with np.load(self.path) as data:
+                return {k: data[k] for k in data.files}
+        else:
+            return None
+
+    def is_stale(self):
+        """ Return True if the table does not exist or does not correspond to the source index file """
+        table = self._load()
+        if table is None:
+            return True
+        sig = _source_signature(self.index_file)
+        return table['mtime'] != sig['mtime'] or table['size'] != sig['size']
+
+    def build(self, wmo=None, offset=None):
+        """ Build the table in one pass over the index file
+
+            Parameters
+            ----------
+            wmo, offset: :class:`numpy.ndarray`, optional
+                WMO and byte offset of each row of the index file (with the end of the last row appended to offset),
+                if already known. Otherwise, they are read from the index file.
+        """
+        sig = _source_signature(self.index_file)
+        if wmo is None or offset is None:
+            with open(self.index_file, "rb") as f:
+                buf = np.frombuffer(f.read(), dtype=np.uint8)
+            starts, ends, nskip = _line_bounds(buf)
+            wmo = _parse_wmo(buf, starts, _first_comma(buf, starts, ends))
+            offset = np.append(starts, min(ends[-1] + 1, len(buf)) if len(ends) > 0 else len(buf))
+
+        # Contiguous blocks of rows with the same WMO:
+        wmo = np.asarray(wmo)
+        first = np.flatnonzero(np.concatenate(([True], wmo[1:] != wmo[:-1]))) if len(wmo) > 0 else np.array([], int)
+        count = np.diff(np.append(first, len(wmo)))
+        order = np.lexsort((first, wmo[first]))  # Sort blocks by WMO, then by position in the file
+        table = {'wmo': wmo[first][order].astype(np.int64),
+                 'row': first[order].astype(np.int64),
+                 'count': count[order].astype(np.int64),
+                 'offset': np.asarray(offset)[first][order].astype(np.int64),
+                 'mtime': sig['mtime'],
+                 'size': sig['size']}
+
+        if self.path is None:
+            self._memory[self.index_file] = table
+        else:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".npz")
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **table)
+            os.replace(tmp, self.path)
+        self._table = table
+        return self
+
+    def open(self):
+        """ Make sure the table is up to date with the source index file, rebuild it if necessary """
+        if self.is_stale():
+            self.build()
+        else:
+            self._table = self._load()
+        return self
+
+    def blocks(self, wmo: int):
+        """ Return blocks of rows of a float
+
+            Parameters
+            ----------
+            wmo: int
+
+            Returns
+            -------
+            offset, row, count: :class:`numpy.ndarray`
+                Byte offset, first row and number of rows of each block of the float (empty arrays if not found)
+        """
+        i0, i1 = np.searchsorted(self._table['wmo'], [wmo], side='left')[0], \
+            np.searchsorted(self._table['wmo'], [wmo], side='right')[0]
+        return self._table['offset'][i0:i1], self._table['row'][i0:i1], self._table['count'][i0:i1]
+
+    def rows(self, wmo: int):
+        """ Return the position of all rows of a float, as a :class:`numpy.ndarray` """
+        offset, row, count = self.blocks(wmo)
+        return np.concatenate([np.arange(r, r + c) for r, c in zip(row, count)] + [np.array([], dtype=np.int64)])
+
+
+class indexsidecar():
+    """ Columnar binary sidecar of an Argo index file
+
+    Examples
+    --------
+
+    sc = indexsidecar("/Volumes/Data/ARGO/ar_index_global_prof.txt", cachedir="~/.cache/argopy").open()
+    sc['latitude']  # A memory-mapped numpy array
+    sc.to_dataframe(np.arange(0, 10))
+
+    # Without a cache folder, the sidecar is only kept in memory:
+    sc = indexsidecar("/Volumes/Data/ARGO/ar_index_global_prof.txt").open()
+
+    """
+    _memory = {}
+    """ In memory sidecars, for sidecars without a cache folder """
+
+    version = 5
+    """ Layout version of the sidecar files, bump it to force a rebuild of existing sidecars """
+
+    cols_name = ['file', 'date', 'latitude', 'longitude', 'ocean', 'profiler_type', 'institution', 'date_update']
+    """ Name of the columns in the Argo index file """
+
+    cols_dict = ['ocean', 'profiler_type', 'institution']
+    """ Columns stored with a dictionary encoding """
+
+    cols_count = ['dac', 'ocean', 'profiler_type', 'institution']
+    """ Dictionary encoded columns with precomputed number of profiles per value """
+
+    grid_resolution = 1.
+    """ Size, in degrees, of the cells of the spatial grid """
+
+    def __init__(self, index_file: str, cachedir: str = None):
+        """ Create a binary sidecar manager for an Argo index file
+
+            Parameters
+            ----------
+            index_file: str
+                Path to the Argo index file
+            cachedir : str, optional
+                Directory where to save the sidecar. If None (default), the sidecar is not saved.
+        """
+        self.index_file = os.path.abspath(index_file)
+        self.cachedir = cachedir
+        if cachedir is not None:
+            sha = hashlib.sha256(self.index_file.encode()).hexdigest()
+            self.path = os.path.join(cachedir, "index", sha)
+        else:
+            self.path = None
+        self.wmo_table = indexwmotable(self.index_file, self.cachedir)
+        self._meta = None
+        self._columns = {}
+
+    def __repr__(self):
+        summary = ["<indexsidecar>"]
+        summary.append("Index: %s" % self.index_file)
+        summary.append("Sidecar: %s" % (self.path if self.path is not None else "in memory"))
+        if self._meta is not None:
+            summary.append("Rows: %i" % self._meta['nrows'])
+        return "\n".join(summary)
+
+    def _read_meta(self):
+        if self.path is None:
+            return self._memory[self.index_file]['meta'] if self.index_file in self._memory else None
+        fn = os.path.join(self.path, "meta.json")
+        if not os.path.exists(fn):
+            return None
+        with open(fn, "r") as f:
+            return json.load(f)
+
+    @property
+    def meta(self):
+        """ Sidecar meta-data: source file signature, number of rows and column dictionaries """
+        if self._meta is None:
+            self._meta = self._read_meta()
+        return self._meta
+
+    def is_stale(self):
+        """ Return True if the sidecar does not exist or does not correspond to the source index file """
+        meta = self._read_meta()
+        if meta is None or meta.get('version') != self.version:
+            return True
+        sig = _source_signature(self.index_file)
+        return meta['mtime'] != sig['mtime'] or meta['size'] != sig['size']
+
+    def _parse(self, index_file):
+        """ Parse an Argo index file into numpy columns
+
+            String manipulations are done on the raw bytes of the file with numpy, and numerical columns are
+            parsed with the pandas C engine, so that no Python object is created per row.
+
+            Parameters
+            ----------
+            index_file: str
+                Path to an Argo profile index file
+
+            Returns
+            -------
+            columns: dict
+                Dictionary of :class:`numpy.ndarray`, one per sidecar column
+            categories: dict
+                List of values of the dictionary encoded columns
+        """
+        with open(index_file, "rb") as f:
+            raw = f.read()
+        buf = np.frombuffer(raw, dtype=np.uint8)
+        starts, ends, nskip = _line_bounds(buf)
+
+        columns = {}
+        columns['offset'] = np.append(starts, min(ends[-1] + 1, len(buf)) if len(ends) > 0 else len(buf))
+
+        # File path, up to the first comma of each line:
+        comma = _first_comma(buf, starts, ends)
+        columns['file'] = _fixed_width_strings(buf, starts, comma)
+
+        # Float WMO and cycle number, from file names like: <dac>/<wmo>/profiles/<R/D><wmo>_<cyc><D>.nc
+        columns['wmo'] = _parse_wmo(buf, starts, comma)
+        dac, columns['dac'] = np.unique(_parse_dac(buf, starts, comma), return_inverse=True)
+        columns['dac'] = columns['dac'].astype(np.int16)
+        stop = comma - 3  # Remove the '.nc' extension
+        stop = np.where(buf[np.maximum(stop - 1, 0)] == ord("D"), stop - 1, stop)  # and the descending flag
+        underscores = np.append(-1, np.flatnonzero(buf == ord("_")))
+        under = underscores[np.searchsorted(underscores, stop) - 1]
+        cyc, ok = _parse_digits(buf, under + 1, stop)
+        ok &= under > starts
+        columns['cyc'] = np.where(ok, cyc, -1).astype(np.int32)
+
+        # Other columns:
+        dtypes = {'date': np.float64, 'latitude': np.float64, 'longitude': np.float64, 'date_update': np.float64}
+        for col in self.cols_dict:
+            dtypes[col] = 'category'
+        df = pd.read_csv(index_file, sep=",", skiprows=nskip, header=None, names=self.cols_name,
+                         usecols=self.cols_name[1:], dtype=dtypes, keep_default_na=False, na_values=[""])
+        if len(df) != len(starts):
+            raise ValueError("Unexpected structure of the Argo index file: %s" % index_file)
+        for col in ['date', 'date_update']:
+            columns[col] = _to_epoch(df[col].values)
+        for col in ['latitude', 'longitude']:
+            columns[col] = df[col].values
+        categories = {}
+        for col in self.cols_dict:
+            columns[col] = df[col].cat.codes.values.astype(np.int16)  # Missing values are coded with -1
+            categories[col] = [str(c) for c in df[col].cat.categories]
+        if len(dac) > 0 and dac[0] == b"":  # Lines without a DAC
+            columns['dac'] -= 1
+            dac = dac[1:]
+        categories['dac'] = [d.decode() for d in dac]
+
+        return columns, categories
+
+    def _grid_shape(self, resolution):
+        return int(np.ceil(180. / resolution)), int(np.ceil(360. / resolution))
+
+    def _grid_cell(self, lon, lat, resolution):
+        """ Return the grid cell row and column of positions """
+        nlat, nlon = self._grid_shape(resolution)
+        ilat = np.clip(np.floor((np.asarray(lat) + 90.) / resolution), 0, nlat - 1).astype(np.int64)
+        ilon = np.clip(np.floor((np.asarray(lon) + 180.) / resolution), 0, nlon - 1).astype(np.int64)
+        return ilat, ilon
+
+    def _grid(self, lon, lat):
+        """ Sort rows by cells of a lat/lon grid
+
+            Returns
+            -------
+            grid_rows: :class:`numpy.ndarray`
+                Position of rows with valid lat/lon, sorted by grid cells (and by position in the index in each cell)
+            grid_start: :class:`numpy.ndarray`
+                Position in grid_rows of the first row of each grid cell (with the total number of rows appended)
+        """
+        nlat, nlon = self._grid_shape(self.grid_resolution)
+        valid = np.flatnonzero(~np.isnan(lon) & ~np.isnan(lat))
+        ilat, ilon = self._grid_cell(lon[valid], lat[valid], self.grid_resolution)
+        cell = ilat * nlon + ilon
+        order = np.argsort(cell, kind='stable')
+        grid_start = np.searchsorted(cell[order], np.arange(0, nlat * nlon + 1))
+        return valid[order], grid_start.astype(np.int64)
+
+    def grid_slices(self, lon, lat):
+        """ Return slices of grid rows overlapping a lat/lon rectangle
+
+            Cells of a grid row are contiguous, so we have one slice of ``grid_rows`` per grid row.
+
+            Parameters
+            ----------
+            lon: [float, float]
+            lat: [float, float]
+
+            Returns
+            -------
+            i0, i1: :class:`numpy.ndarray`
+                Start and end positions in ``grid_rows`` of each slice
+        """
+        resolution = self.meta['grid_resolution']
+        nlat, nlon = self._grid_shape(resolution)
+        if lon[1] < lon[0] or lat[1] < lat[0]:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+        (ilat0, ilat1), (ilon0, ilon1) = self._grid_cell(lon, lat, resolution)
+        start = self['grid_start']
+        first = np.arange(ilat0, ilat1 + 1) * nlon + ilon0
+        last = np.arange(ilat0, ilat1 + 1) * nlon + ilon1 + 1
+        return start[first], start[last]
+
+    def grid_candidates(self, lon, lat):
+        """ Return rows with a position in the grid cells overlapping a lat/lon rectangle
+
+            Parameters
+            ----------
+            lon: [float, float]
+            lat: [float, float]
+
+            Returns
+            -------
+            :class:`numpy.ndarray` of integers, sorted, with the position of candidate rows. Or None if the rectangle
+            covers too large a fraction of the index for the grid to be useful.
+        """
+        i0, i1 = self.grid_slices(lon, lat)
+        if np.sum(i1 - i0) > len(self) / 4:
+            return None
+        rows = self['grid_rows']
+        return np.sort(np.concatenate([rows[a:b] for a, b in zip(i0, i1)] + [np.array([], dtype=np.int64)]))
+
+    def _time_partitions(self, dates):
+        """ Sort rows by date, in monthly partitions
+
+            Returns
+            -------
+            time_rows: :class:`numpy.ndarray`
+                Position of rows with a valid date, sorted by date
+            time_dates: :class:`numpy.ndarray`
+                Sorted dates, as seconds since 1970-01-01
+            time_month: :class:`numpy.ndarray`
+                Months with data, as months since 1970-01
+            time_start: :class:`numpy.ndarray`
+                Position in time_rows of the first row of each month (with the total number of rows appended)
+        """
+        valid = np.flatnonzero(dates != np.iinfo(np.int64).min)
+        order = np.argsort(dates[valid], kind='stable')
+        time_rows, time_dates = valid[order], dates[valid][order]
+        months = time_dates.astype('datetime64[s]').astype('datetime64[M]').view(np.int64)
+        time_month, time_start = np.unique(months, return_index=True)
+        return time_rows, time_dates, time_month, np.append(time_start, len(time_rows)).astype(np.int64)
+
+    def time_slice(self, tim):
+        """ Return the slice of ``time_rows`` in a time range
+
+            Monthly partitions overlapping the time range are first selected, and then refined with a binary search
+            on dates in the first and last partitions.
+
+            Parameters
+            ----------
+            tim: [int, int]
+                Time range, in seconds since 1970-01-01
+
+            Returns
+            -------
+            lo, hi: int
+        """
+        month = np.array(tim, dtype='datetime64[s]').astype('datetime64[M]').view(np.int64)
+        p0 = np.searchsorted(self['time_month'], month[0], side='left')
+        p1 = np.searchsorted(self['time_month'], month[1], side='right')
+        start, dates = self['time_start'], self['time_dates']
+        lo, hi = start[p0], start[p1]
+        lo = lo + np.searchsorted(dates[lo:start[min(p0 + 1, len(start) - 1)]], tim[0], side='left')
+        hi = start[max(p1 - 1, 0)] + np.searchsorted(dates[start[max(p1 - 1, 0)]:hi], tim[1], side='right')
+        return int(lo), int(max(hi, lo))
+
+    def time_candidates(self, tim):
+        """ Return rows with a date in a time range
+
+            Parameters
+            ----------
+            tim: [int, int]
+                Time range, in seconds since 1970-01-01
+
+            Returns
+            -------
+            :class:`numpy.ndarray` of integers, sorted, with the position of rows.
+        """
+        lo, hi = self.time_slice(tim)
+        return np.sort(self['time_rows'][lo:hi])
+
+    def _add_search_columns(self, columns):
+        """ Add the grid and time partitions to sidecar columns """
+        columns['grid_rows'], columns['grid_start'] = self._grid(columns['longitude'], columns['latitude'])
+        columns['time_rows'], columns['time_dates'], columns['time_month'], columns['time_start'] = \
+            self._time_partitions(columns['date'])
+        return columns
+
+    def _add_aggregates(self, columns, categories):
+        """ Add the number of profiles per DAC, institution, profiler type, ocean and float to sidecar columns
+
+            Number of profiles per month are given by the time partitions.
+        """
+        for col in self.cols_count:
+            codes = columns[col]
+            columns['agg_%s' % col] = np.bincount(codes[codes >= 0], minlength=len(categories[col])).astype(np.int64)
+
+        # Number of profiles and first/last date of each float:
+        nat = np.iinfo(np.int64).min
+        wmo, date = columns['wmo'], columns['date']
+        columns['agg_wmo'], inverse, count = np.unique(wmo[wmo >= 0], return_inverse=True, return_counts=True)
+        columns['agg_wmo_count'] = count.astype(np.int64)
+        date = date[wmo >= 0]
+        valid = date != nat
+        order = np.lexsort((date[valid], inverse[valid]))
+        group, date = inverse[valid][order], date[valid][order]
+        first = np.flatnonzero(np.concatenate(([True], group[1:] != group[:-1]))) if len(group) > 0 \
+            else np.array([], dtype=np.int64)
+        last = np.append(first[1:], len(group)) - 1
+        columns['agg_wmo_first'] = np.full(len(count), nat, dtype=np.int64)
+        columns['agg_wmo_last'] = np.full(len(count), nat, dtype=np.int64)
+        columns['agg_wmo_first'][group[first]] = date[first]
+        columns['agg_wmo_last'][group[last]] = date[last]
+        return columns
+
+    def build(self):
+        """ Convert the source index file into a binary sidecar """
+        sig = _source_signature(self.index_file)
+        columns, categories = self._parse(self.index_file)
+        columns = self._add_search_columns(columns)
+        columns = self._add_aggregates(columns, categories)
+
+        # Lines merged from delta files, none yet:
+        columns['delta_rows'] = np.array([], dtype=np.int64)
+        columns['delta_start'] = np.array([], dtype=np.int64)
+        columns['delta_end'] = np.array([], dtype=np.int64)
+        columns['delta_text'] = np.array([], dtype=np.uint8)
+
+        nrows = int(len(columns['offset']) - 1)
+        meta = {'version': self.version,
+                'index_file': self.index_file,
+                'mtime': sig['mtime'],
+                'size': sig['size'],
+                'nrows': nrows,
+                'nrows_source': nrows,
+                'categories': categories,
+                'grid_resolution': self.grid_resolution,
+                'updates': []}
+
+        self._save(meta, columns)
+        self.wmo_table.build(columns['wmo'], columns['offset'])
+        return self
+
+    def _save(self, meta, columns):
+        """ Save sidecar meta-data and columns """
+        if self.path is None:
+            self._memory[self.index_file] = {'meta': meta, 'columns': columns}
+        else:
+            # Write in a temporary folder and then move it to its final destination,
+            # so that concurrent readers never see a partially written sidecar:
+            parent = os.path.dirname(self.path)
+            os.makedirs(parent, exist_ok=True)
+            tmp = tempfile.mkdtemp(dir=parent)
+            for name, values in columns.items():
+                np.save(os.path.join(tmp, "%s.npy" % name), values)
+            with open(os.path.join(tmp, "meta.json"), "w") as f:
+                json.dump(meta, f)
+            if os.path.exists(self.path):
+                shutil.rmtree(self.path, ignore_errors=True)
+            os.replace(tmp, self.path)
+
+        self._meta = meta
+        self._columns = {}
+
+    def merge(self, delta_file: str):
+        """ Merge an Argo index delta file into the sidecar
+
+            Rows of the delta file are matched with sidecar rows by file path. Matching rows are replaced if their
+            ``date_update`` is more recent, and other rows are appended to the sidecar. The source index file is not
+            modified, and the sidecar is fully rebuilt from it whenever it changes.
+
+            Parameters
+            ----------
+            delta_file: str
+                Path to an Argo profile index file with the latest profiles, like "ar_index_this_week_prof.txt"
+
+            Returns
+            -------
+            :class:`numpy.ndarray` of integers, sorted, with the position of updated and added rows
+        """
+        self.open()
+        delta_file = os.path.abspath(delta_file)
+        sig = _source_signature(delta_file)
+        delta, delta_categories = self._parse(delta_file)
+        ndelta = len(delta['offset']) - 1
+        with open(delta_file, "rb") as f:
+            delta_buf = np.frombuffer(f.read(), dtype=np.uint8)
+
+        # Keep the last update of each file in the delta:
+        order = np.lexsort((np.arange(0, ndelta), delta['date_update'], delta['file']))
+        last = np.append(delta['file'][order][1:] != delta['file'][order][:-1], True) if ndelta > 0 \
+            else np.array([], dtype=bool)
+        drows = np.sort(order[last])
+
+        # Match delta rows with sidecar rows, through the rows of their floats:
+        known = {}
+        for wmo in np.unique(delta['wmo'][drows]):
+            rows = self.wmo_rows(wmo)
+            known.update(zip(self['file'][rows].tolist(), rows.tolist()))
+        target = np.array([known.get(f, -1) for f in delta['file'][drows].tolist()], dtype=np.int64)
+        matched = target >= 0
+        newer = np.ones(len(drows), dtype=bool)
+        newer[matched] = delta['date_update'][drows[matched]] > self['date_update'][target[matched]]
+        updated = matched & newer
+        added = ~matched
+        nrows = len(self)
+        target[added] = np.arange(nrows, nrows + np.count_nonzero(added))
+
+        # Dictionary codes of the delta in the sidecar dictionaries:
+        categories = {}
+        for col in self.cols_count:
+            cats = list(self.categories(col))
+            cats += [c for c in delta_categories[col] if c not in cats]
+            categories[col] = cats
+            remap = np.array([cats.index(c) for c in delta_categories[col]] + [-1], dtype=np.int16)
+            delta[col] = remap[delta[col]]  # Code -1 points to the last, missing, code
+
+        columns = {}
+        src, dst = drows[updated | added], target[updated | added]
+        for col in ['file', 'wmo', 'cyc', 'date', 'latitude', 'longitude', 'date_update'] + self.cols_count:
+            values = np.asarray(self[col])
+            if col == 'file':
+                dtype = "S%i" % max(values.dtype.itemsize, delta[col].dtype.itemsize)
+            else:
+                dtype = values.dtype
+            values = np.concatenate((values, np.zeros(np.count_nonzero(added), dtype=dtype))).astype(dtype)
+            values[dst] = delta[col][src]
+            columns[col] = values
+        columns['offset'] = np.asarray(self['offset'])
+        columns = self._add_search_columns(columns)
+        columns = self._add_aggregates(columns, categories)
+
+        # Raw lines of merged rows, that can't be read from the source index file:
+        delta_rows, delta_text = np.asarray(self['delta_rows']), np.asarray(self['delta_text'])
+        keep = np.flatnonzero(~np.isin(delta_rows, dst))
+        lines = {r: bytes(delta_text[self['delta_start'][i]:self['delta_end'][i]])
+                 for r, i in zip(delta_rows[keep].tolist(), keep)}
+        lines.update({r: bytes(delta_buf[delta['offset'][i]:delta['offset'][i + 1]]).rstrip(b"\n") + b"\n"
+                      for i, r in zip(src, dst.tolist())})
+        columns['delta_rows'] = np.array(sorted(lines), dtype=np.int64)
+        size = np.array([len(lines[r]) for r in columns['delta_rows']], dtype=np.int64)
+        columns['delta_end'] = np.cumsum(size)
+        columns['delta_start'] = columns['delta_end'] - size
+        columns['delta_text'] = np.frombuffer(b"".join([lines[r] for r in columns['delta_rows']]), dtype=np.uint8)
+
+        meta = dict(self.meta)
+        meta['nrows'] = int(len(columns['wmo']))
+        meta['categories'] = categories
+        meta['updates'] = list(meta['updates']) + [{'file': delta_file,
+                                                    'mtime': sig['mtime'],
+                                                    'size': sig['size'],
+                                                    'updated': int(np.count_nonzero(updated)),
+                                                    'added': int(np.count_nonzero(added))}]
+        self._save(meta, columns)
+        return np.sort(dst)
+
+    def wmo_rows(self, wmo: int):
+        """ Return the position of all rows of a float, as a :class:`numpy.ndarray` """
+        rows = self.wmo_table.rows(wmo)
+        nrows_source = self.meta['nrows_source']
+        if len(self) > nrows_source:  # Rows added by delta files are not in the WMO table
+            added = nrows_source + np.flatnonzero(self['wmo'][nrows_source:] == wmo)
+            rows = np.concatenate((rows, added))
+        return rows
+
+    def open(self):
+        """ Make sure the sidecar is up to date with the source index file, rebuild it if necessary """
+        if self.is_stale():
+            self.build()
+        else:
+            if self._meta is None or self._meta != self._read_meta():
+                self._meta = self._read_meta()
+                self._columns = {}
+            self.wmo_table.open()
+        return self
+
+    def __len__(self):
+        return self.meta['nrows']
+
+    def __getitem__(self, name):
+        """ Return a memory-mapped column of the sidecar """
+        if name not in self._columns:
+            if self.path is None:
+                self._columns[name] = self._memory[self.index_file]['columns'][name]
+            else:
+                self._columns[name] = np.load(os.path.join(self.path, "%s.npy" % name), mmap_mode='r')
+        return self._columns[name]
+
+    def categories(self, name):
+        """ Return the list of values of a dictionary encoded column """
+        return self.meta['categories'][name]
+
+    def code(self, name, value):
+        """ Return the dictionary code of a value in a column, or -1 if not found """
+        cats = self.categories(name)
+        return cats.index(value) if value in cats else -1
+
+    def decode(self, name, rows):
+        """ Return values of a dictionary encoded column for a list of rows """
+        codes = np.asarray(self[name][rows])
+        cats = np.array(self.categories(name) + [""], dtype=object)
+        return cats[codes]  # Code -1 points to the last, empty, category
+
+    def aggregate(self, by: str):
+        """ Return the precomputed number of profiles per DAC, institution, profiler type, ocean, month or float
+
+            Parameters
+            ----------
+            by: str
+                One of 'dac', 'institution', 'profiler_type', 'ocean', 'month' or 'wmo'
+
+            Returns
+            -------
+            :class:`pandas.Series` with the number of profiles, indexed by value of ``by``. For 'wmo', a
+            :class:`pandas.DataFrame` with the number of profiles and the first and last profile dates of each float.
+        """
+        if by in self.cols_count:
+            index = pd.Index(self.categories(by), name=by)
+            counts = pd.Series(np.asarray(self['agg_%s' % by]), index=index, name='count')
+            return counts[counts > 0]  # Values may no longer be used after merges
+        elif by == 'month':
+            index = pd.DatetimeIndex(np.asarray(self['time_month']).astype('datetime64[M]'), name='month')
+            return pd.Series(np.diff(self['time_start']), index=index, name='count')
+        elif by == 'wmo':
+            data = {'count': np.asarray(self['agg_wmo_count']),
+                    'first_date': self['agg_wmo_first'].astype('datetime64[s]').astype('datetime64[ns]'),
+                    'last_date': self['agg_wmo_last'].astype('datetime64[s]').astype('datetime64[ns]')}
+            return pd.DataFrame(data, index=pd.Index(np.asarray(self['agg_wmo']), name='wmo'))
+        else:
+            raise ValueError("Unknown aggregate: '%s'. Use one of: %s"
+                             % (by, ", ".join(self.cols_count + ['month', 'wmo'])))
+
+    def to_text(self, rows):
+        """ Return the source index lines of a list of rows, as a csv like string """
+        offset = self['offset']
+        delta_rows, delta_text = self['delta_rows'], self['delta_text']
+        rows = np.asarray(rows, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(delta_rows, rows), max(len(delta_rows) - 1, 0))
+        merged = delta_rows[pos] == rows if len(delta_rows) > 0 else np.zeros(len(rows), dtype=bool)
+        with open(self.index_file, "rb") as f:
+            mm = np.memmap(f, dtype=np.uint8, mode='r')
+            lines = []
+            for i, m, p in zip(rows, merged, pos):
+                if m:
+                    lines.append(bytes(delta_text[self['delta_start'][p]:self['delta_end'][p]]))
+                else:
+                    lines.append(bytes(mm[offset[i]:offset[i + 1]]).rstrip(b"\n") + b"\n")
+        return b"".join(lines).decode()
+
+    def to_dataframe(self, rows):
+        """ Return a :class:`pandas.DataFrame` for a list of rows
+
+            Like :meth:`argopy.stores.indexstore.res2dataframe`, missing dates are NaT, missing positions and codes
+            are NaN, and ocean, profiler type and institution codes are categorical columns.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        data = {}
+        data['file'] = self['file'][rows].astype(str).astype(object)
+        data['date'] = self['date'][rows].astype('datetime64[s]').astype('datetime64[ns]')
+        data['latitude'] = self['latitude'][rows].astype(np.float32)
+        data['longitude'] = self['longitude'][rows].astype(np.float32)
+        for col in self.cols_dict:
+            values = self.decode(col, rows)
+            values[values == ""] = np.nan
+            data[col] = pd.Categorical(values)
+        data['date_update'] = self['date_update'][rows].astype('datetime64[s]').astype('datetime64[ns]')
+        return pd.DataFrame(data, columns=self.cols_name)
@@ -0,0 +1,137 @@
+#!/bin/env python
+# -*coding: UTF-8 -*-
+"""
+Cache of post-processed Argo data
+
+The raw responses of data sources are cached by stores, but fetching data also requires to post-process them: cast
+types, filter data mode, QC and variables. Here, the final datasets returned by data fetchers are saved as compressed
+netcdf files, under a key made of everything that defines a request, so that repeated requests skip both the download
+and the post-processing.
+
+"""
+import os
+import json
+import time
+import hashlib
+import tempfile
+import warnings
+
+import numpy as np
+import xarray as xr
+
+from argopy.options import OPTIONS
+
+
+class resultcache():
+    """ Cache of post-processed Argo datasets
+
+    Examples
+    --------
+
+    cache = resultcache("~/.cache/argopy")
+    key = cache.key('erddap', 'phy', 'standard', 'float', 'phy_WMO6902746')
+    cache.put(key, ds)
+    cache.get(key)
+
+    """
+
+    def __init__(self, cachedir: str = ""):
+        """ Create a post-processed datasets cache
+
+            Parameters
+            ----------
+            cachedir: str
+                Cache folder, datasets are saved in its "results" sub-folder. Use the global OPTIONS['cachedir'] by
+                default.
+        """
+        self.cachedir = OPTIONS['cachedir'] if cachedir == '' else cachedir
+        self.path = os.path.join(os.path.abspath(os.path.expanduser(self.cachedir)), "results")
+
+    def __repr__(self):
+        summary = ["<resultcache>"]
+        summary.append("Folder: %s" % self.path)
+        summary.append("Datasets: %i" % len(self.keys()))
+        return "\n".join(summary)
+
+    @staticmethod
+    def key(*parts, **options):
+        """ Return the key of a request
+
+            Parameters
+            ----------
+            *parts: str
+                Definition of the request, like the data source, dataset, user mode, access point and constraints
+            **options:
+                Other options changing the result of the request
+
+            Returns
+            -------
+            str
+                Sha of the request definition and of the argopy version
+        """
+        from argopy import __version__
+        definition = json.dumps([__version__, [str(p) for p in parts], {k: str(v) for k, v in options.items()}],
+                                sort_keys=True)
+        return hashlib.sha256(definition.encode()).hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, "%s.nc" % key)
+
+    def __contains__(self, key):
+        return os.path.exists(self._file(key))
+
+    def keys(self):
+        """ Return the keys of all cached datasets """
+        if not os.path.isdir(self.path):
+            return []
+        return sorted([e.name[:-3] for e in os.scandir(self.path) if e.name.endswith(".nc")])
+
+    def get(self, key: str):
+        """ Return a cached dataset, or None if not cached or older than the ``cache_max_age`` option """
+        fn = self._file(key)
+        try:
+            if OPTIONS['cache_max_age'] and time.time() - os.path.getmtime(fn) > OPTIONS['cache_max_age']:
+                self.remove(key)
+                return None
+            with xr.open_dataset(fn) as ds:
+                return ds.load()
+        except (FileNotFoundError, OSError):
+            return None
+
+    def put(self, key: str, ds: xr.Dataset):
+        """ Save a dataset in the cache
+
+            Numeric variables are compressed. A dataset that can't be saved as netcdf is not cached, with a warning.
+
+            Returns
+            -------
+            bool
+                True if the dataset was saved
+        """
+        os.makedirs(self.path, exist_ok=True)
+        encoding = {v: {'zlib': True, 'complevel': 4} for v in ds.variables
+                    if np.issubdtype(ds[v].dtype, np.number) and ds[v].ndim > 0}
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        os.close(fd)
+        try:
+            ds.to_netcdf(tmp, engine='netcdf4', encoding=encoding)
+            os.replace(tmp, self._file(key))
+            return True
+        except Exception as e:
+            warnings.warn("Post-processed dataset not cached: %s" % e)
+            return False
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def remove(self, key: str):
+        """ Remove a dataset from the cache """
+        try:
+            os.remove(self._file(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        """ Remove all datasets from the cache """
+        for key in self.keys():
+            self.remove(key)
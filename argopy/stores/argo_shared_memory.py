@@ -0,0 +1,109 @@
+#!/bin/env python
+# -*coding: UTF-8 -*-
+"""
+Transfer of datasets between processes through shared memory
+
+Returning a :class:`xarray.Dataset` from a worker process pickles all its data, and unpickles it in the parent process:
+both cost more than reading small netcdf files. Instead, the worker copies the arrays of all variables with a fixed
+size data type (numbers, booleans, dates and fixed width strings) in a single shared memory block, and only returns a
+small description of the dataset: names, dimensions, attributes and offsets of variables in the block.
+The parent process copies the arrays out of the block with plain memory copies, and releases the block right away.
+Variables with python objects, if any, are pickled as usual.
+
+Worker processes must share the resource tracker of the parent process, which is the case of processes started after
+:func:`start_tracker` was called in the parent.
+
+Shared memory requires python 3.8 or later, check ``with_shared_memory`` before use.
+
+"""
+import numpy as np
+import xarray as xr
+
+try:
+    from multiprocessing import shared_memory, resource_tracker
+    with_shared_memory = True
+except ImportError:  # Python < 3.8
+    with_shared_memory = False
+
+ALIGNMENT = 64
+""" Byte alignment of arrays in a shared memory block """
+
+
+def _aligned(offset: int):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def start_tracker():
+    """ Start the resource tracker of this process, shared by worker processes started afterwards """
+    resource_tracker.ensure_running()
+
+
+def share_dataset(ds):
+    """ Copy a dataset in a shared memory block, and return its description
+
+        Parameters
+        ----------
+        ds: :class:`xarray.Dataset`
+
+        Returns
+        -------
+        dict
+            Picklable description of the dataset, with the name of the shared memory block, to be given to
+            :func:`attach_dataset` in another process.
+    """
+    variables, arrays, size = [], [], 0
+    for name, var in ds.variables.items():
+        data = np.ascontiguousarray(var.values)
+        entry = {'name': name, 'dims': var.dims, 'attrs': var.attrs, 'encoding': var.encoding}
+        if data.dtype.hasobject:
+            entry['data'] = data
+        else:
+            offset = _aligned(size)
+            entry.update({'dtype': data.dtype.str, 'shape': data.shape, 'offset': offset})
+            arrays.append((offset, data))
+            size = offset + data.nbytes
+        variables.append(entry)
+
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        for offset, data in arrays:
+            np.ndarray(data.shape, dtype=data.dtype, buffer=shm.buf, offset=offset)[...] = data
+    except Exception:
+        shm.close()
+        shm.unlink()
+        raise
+    shm.close()  # The block lives until the parent unlinks it
+    return {'block': shm.name, 'variables': variables, 'coords': list(ds.coords), 'attrs': ds.attrs}
+
+
+def attach_dataset(shared: dict):
+    """ Return the dataset described by :func:`share_dataset`, with arrays copied from its shared memory block
+
+        The block is released, so a dataset can only be attached once.
+
+        Parameters
+        ----------
+        shared: dict
+            Description of the dataset returned by :func:`share_dataset`
+
+        Returns
+        -------
+        :class:`xarray.Dataset`
+    """
+    shm = shared_memory.SharedMemory(name=shared['block'])
+    try:
+        variables = {}
+        for entry in shared['variables']:
+            if 'data' in entry:
+                data = entry['data']
+            elif int(np.prod(entry['shape'])) == 0:
+                data = np.empty(entry['shape'], dtype=entry['dtype'])
+            else:
+                data = np.ndarray(entry['shape'], dtype=entry['dtype'], buffer=shm.buf, offset=entry['offset']).copy()
+            variables[entry['name']] = xr.Variable(entry['dims'], data, attrs=entry['attrs'],
+                                                   encoding=entry['encoding'])
+    finally:
+        shm.close()
+        shm.unlink()
+    ds = xr.Dataset(variables, attrs=shared['attrs'])
+    return ds.set_coords([c for c in shared['coords'] if c in ds.data_vars])
@@ -4,16 +4,27 @@ import xarray as xr
 import pandas as pd
 import requests
 import fsspec
-import shutil
-import pickle
 import json
-import tempfile
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from requests.structures import CaseInsensitiveDict
+from fsspec.implementations.cached import hash_name
 from IPython.core.display import display, HTML
 
 from argopy.options import OPTIONS
-from argopy.errors import ErddapServerError, FileSystemHasNoCache, CacheFileNotFound
+from argopy.errors import ErddapServerError, FileSystemHasNoCache, CacheFileNotFound, OfflineCacheMiss
+from argopy.stores.argo_cache_registry import sqlfilecache, is_offline
+from argopy.stores.argo_http_retry import retrypolicy, hostguard
 from abc import ABC, abstractmethod
 
+try:
+    import aiohttp
+    with_aiohttp = True
+except ModuleNotFoundError:
+    with_aiohttp = False
+
 
 class argo_store_proto(ABC):  # Should this class inherits from fsspec.spec.AbstractFileSystem ?
     protocol = ''  # One in fsspec.registry.known_implementations
@@ -29,19 +40,22 @@ class argo_store_proto(ABC):  # Should this class inherits from fsspec.spec.Abst
         """
         self.cache = cache
         self.cachedir = OPTIONS['cachedir'] if cachedir == '' else cachedir
+        self.storage_options = kw
         if not self.cache:
             self.fs = fsspec.filesystem(self.protocol, **kw)
         else:
-            self.fs = fsspec.filesystem("filecache",
-                                        target_protocol=self.protocol,
-                                        target_options={'simple_links': True},
-                                        cache_storage=self.cachedir,
-                                        expiry_time=86400, cache_check=10, **kw)
-            # We use a refresh rate for cache of 1 day,
-            # since this is the update frequency of the Ifremer erddap
+            os.makedirs(self.cachedir, exist_ok=True)  # fsspec re-uses file systems, that may not create it again
+            self.fs = sqlfilecache(target_protocol=self.protocol,
+                                   target_options={'simple_links': True},
+                                   cache_storage=self.cachedir,
+                                   expiry_time=False, cache_check=10, **kw)
+            # Cache size and refresh rate are set with the 'cache_max_bytes' and 'cache_max_age' options.
+            # The default refresh rate is 1 day, since this is the update frequency of the Ifremer erddap
             self.cache_registry = []  # Will hold uri cached by this store instance
 
     def open(self, path, *args, **kwargs):
+        if not self.cache and is_offline(self.protocol):
+            raise self._offline_miss(path)
         self.register(path)
         return self.fs.open(path, *args, **kwargs)
 
@@ -49,8 +63,16 @@ class argo_store_proto(ABC):  # Should this class inherits from fsspec.spec.Abst
         return self.fs.glob(path, **kwargs)
 
     def exists(self, path, *args):
+        if is_offline(self.protocol):
+            return self.cachepath(path, errors='ignore') is not None
         return self.fs.exists(path, *args)
 
+    def _offline_miss(self, uri):
+        """ Return the error raised for an uri not in cache in offline mode """
+        if not self.cache:
+            return OfflineCacheMiss("Offline mode, %s can't be fetched by a store without cache" % uri)
+        return OfflineCacheMiss("Offline mode, no cached copy of %s in %s" % (uri, self.cachedir))
+
     def store_path(self, uri):
         if not uri.startswith(self.fs.target_protocol):
             path = self.fs.target_protocol + "://" + uri
@@ -69,40 +91,21 @@ class argo_store_proto(ABC):  # Should this class inherits from fsspec.spec.Abst
             if errors == 'raise':
                 raise FileSystemHasNoCache("%s has no cache system" % type(self.fs))
         else:
-            store_path = self.store_path(uri)
-            self.fs.load_cache()
-            if store_path in self.fs.cached_files[-1]:
-                return os.path.sep.join([self.cachedir, self.fs.cached_files[-1][store_path]['fn']])
+            fn = self.fs.cached_files[-1].cachepath(self.store_path(uri))
+            if fn is not None:
+                return fn
             elif errors == 'raise':
                 raise CacheFileNotFound("No cached file found in %s for: \n%s" % (self.fs.storage[-1], uri))
 
     def _clear_cache_item(self, uri):
-        """ Open fsspec cache registry (pickle file) and remove entry for an uri """
-        # See the "save_cache()" method in:
-        # https://filesystem-spec.readthedocs.io/en/latest/_modules/fsspec/implementations/cached.html#WholeFileCacheFileSystem
-        fn = os.path.join(self.fs.storage[-1], "cache")
-        cache = self.fs.cached_files[-1]
-        if os.path.exists(fn):
-            with open(fn, "rb") as f:
-                cached_files = pickle.load(f)
-        else:
-            cached_files = cache
-        cache = {}
-        for k, v in cached_files.items():
-            if k != uri:
-                cache[k] = v.copy()
-            else:
-                os.remove(os.path.join(self.fs.storage[-1], v['fn']))
-        fn2 = tempfile.mktemp()
-        with open(fn2, "wb") as f:
-            pickle.dump(cache, f)
-        shutil.move(fn2, fn)
+        """ Remove the cache file and registry entry of an uri """
+        self.fs.cached_files[-1].remove([uri])
 
     def clear_cache(self):
         """ Remove cache files and entry from uri open with this store instance """
         if self.cache:
-            for uri in self.cache_registry:
-                self._clear_cache_item(uri)
+            self.fs.cached_files[-1].remove(self.cache_registry)
+            self.cache_registry = []
 
     @abstractmethod
     def open_dataset(self):
@@ -156,14 +159,133 @@ class filestore(argo_store_proto):
         return df
 
 
+class singleflight():
+    """ Run a function once for all concurrent callers with the same key
+
+        The first caller of a key runs the function, others wait for it to complete and share its result or
+        exception. A key is released when the function returns, so that later callers run it again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, *args, **kwargs):
+        """ Return func(*args, **kwargs), or the result of the call in flight for the same key """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {'done': threading.Event(), 'result': None, 'error': None}
+                self._calls[key] = call
+        if leader:
+            try:
+                call['result'] = func(*args, **kwargs)
+            except BaseException as e:
+                call['error'] = e
+            finally:
+                with self._lock:
+                    self._calls.pop(key)
+                call['done'].set()
+        else:
+            call['done'].wait()
+        if call['error'] is not None:
+            raise call['error']
+        return call['result']
+
+    def __len__(self):
+        with self._lock:
+            return len(self._calls)
+
+
 class httpstore(argo_store_proto):
     """Wrapper around fsspec http file store
 
         This wrapper intend to make argopy safer to failures from http requests
         This wrapper is primarily used by the Erddap data/index fetchers
+        Threads asking for the same url at the same time share a single download
+        With cache, the ETag and Last-Modified headers of responses are saved, and expired files are revalidated with
+        a conditional request: the cached copy is kept if the server answers it was not modified
+        With the ``offline`` option, urls are only read from the cache, and urls not in cache fail immediately
+        Server errors, reset connections and timeouts are retried with an exponential backoff, and requests to a host
+        failing repeatedly are suspended for a while (see :class:`argopy.stores.argo_http_retry.retrypolicy`)
     """
     protocol = "http"
 
+    _flights = singleflight()
+    """ Downloads in flight, shared by all http stores of the process """
+
+    def __init__(self, cache: bool = False, cachedir: str = "", retry: retrypolicy = None, **kw):
+        """ Create a http file storage system
+
+            Parameters
+            ----------
+            cache : bool (False)
+            cachedir : str (from OPTIONS)
+            retry : :class:`argopy.stores.argo_http_retry.retrypolicy`, optional
+                Retry policy of requests, with ``http_retries`` option retries by default
+        """
+        super().__init__(cache=cache, cachedir=cachedir, **kw)
+        self.retry = retrypolicy() if retry is None else retry
+
+    @staticmethod
+    def stats():
+        """ Return counters of http requests sent by all http stores of the process, in total and by host
+
+            Returns
+            -------
+            dict
+                Number of ``requests`` sent, ``retries``, ``failures`` (requests failed after all retries) and
+                ``rejected`` requests (to a host suspended after too many failures), with the state of the
+                ``circuit`` of each host in ``hosts``.
+        """
+        return hostguard.stats()
+
+    @staticmethod
+    def reset_stats():
+        """ Reset counters of http requests, and resume requests to all hosts """
+        hostguard.reset()
+
+    def _fetch(self, url):
+        """ Return a file-like object with the content of an url
+
+            Concurrent calls for the same url, from any http store of the process with the same cache folder or without
+            cache, share a single download. With cache, the content is streamed from the cached copy, decompressed on
+            the fly. In offline mode, the cached copy is used whatever its age, and urls not in cache raise an
+            OfflineCacheMiss error without any network access.
+        """
+        if is_offline(self.protocol):
+            if not self.cache or not self.fs.cached_files[-1].touch(self.store_path(url)):
+                raise self._offline_miss(url)
+            return self.fs.cached_files[-1].open(self.store_path(url))
+        # Only stores of the same kind share downloads: without cache the content is returned, with cache it is saved
+        # in the cache folder
+        key = (url, self.cachedir if self.cache else None)
+        if not self.cache:
+            return io.BytesIO(self._flights.do(key, self._read, url))
+        registry = self.fs.cached_files[-1]
+        self._flights.do(key, self._cache, url)
+        try:
+            return registry.open(self.store_path(url))
+        except (KeyError, FileNotFoundError):  # Evicted by another process meanwhile
+            self._flights.do(key, self._cache, url)
+            return registry.open(self.store_path(url))
+
+    def _read(self, url):
+        """ Return the content of an url, without cache """
+        status, headers, data = self._download(url)
+        if status >= 400:
+            raise self._http_error(url, status, headers, data)
+        return data
+
+    def _cache(self, url):
+        """ Make sure the cached copy of an url is valid, downloading or revalidating it if necessary """
+        if self.fs.cached_files[-1].touch(self.store_path(url), max_age=OPTIONS['cache_max_age']):
+            return
+        if not self._keep_response(url, *self._download(url, self._conditional_headers(url))):
+            self._keep_response(url, *self._download(url))  # Not modified, but removed from the cache meanwhile
+        self._evict([url])
+
     def _verbose_exceptions(self, e):
         r = e.response  # https://requests.readthedocs.io/en/master/api/#requests.Response
         data = io.BytesIO(r.content)
@@ -227,11 +349,11 @@ class httpstore(argo_store_proto):
 
         """
         try:
-            with self.fs.open(url) as of:
+            with self._fetch(url) as of:
                 js = json.load(of, **kwargs)
             self.register(url)
             return js
-        except json.JSONDecodeError as e:
+        except json.JSONDecodeError:
             raise
         except requests.HTTPError as e:
             self._verbose_exceptions(e)
@@ -249,7 +371,9 @@ class httpstore(argo_store_proto):
 
         """
         try:
-            with self.fs.open(url) as of:
+            with self._fetch(url) as of:
+                if not of.seekable():  # Netcdf readers need to seek
+                    of = io.BytesIO(of.read())
                 ds = xr.open_dataset(of, **kwargs)
             self.register(url)
             return ds
@@ -269,13 +393,249 @@ class httpstore(argo_store_proto):
 
         """
         try:
-            with self.fs.open(url) as of:
+            with self._fetch(url) as of:
                 df = pd.read_csv(of, **kwargs)
             self.register(url)
             return df
         except requests.HTTPError as e:
             self._verbose_exceptions(e)
 
+    _parsers = {
+        'bytes': lambda data, **kwargs: data,
+        'json': lambda data, **kwargs: json.loads(data, **kwargs),
+        'dataset': lambda data, **kwargs: xr.open_dataset(io.BytesIO(data), **kwargs),
+        'dataframe': lambda data, **kwargs: pd.read_csv(io.BytesIO(data), **kwargs),
+    }
+
+    def open_many(self, urls: list, method: str = 'bytes', max_concurrent: int = None, errors: str = 'raise',
+                  **kwargs):
+        """ Download a list of urls concurrently, and return their content in the same order
+
+            Requests are sent with a pool of connections of a single ``aiohttp`` session, re-used by all requests to the
+            same host, with no more than ``max_concurrent`` requests at a time. Cached urls are read from the cache, and
+            downloaded ones are added to the cache. Without ``aiohttp`` installed, urls are downloaded one after the
+            other. In offline mode, urls are only read from the cache.
+
+            Parameters
+            ----------
+            urls: list(str)
+            method: str ('bytes')
+                How to return the content of each url: ``bytes``, or parsed as ``json``, ``dataset`` with
+                :func:`xarray.open_dataset` or ``dataframe`` with :func:`pandas.read_csv`.
+            max_concurrent: int, optional
+                Maximum number of simultaneous requests, ``http_concurrency`` option by default
+            errors: str ('raise')
+                Raise verbose errors for failed requests, or urls not in cache in offline mode (``raise``), or return
+                None for them (``ignore``). Failed requests include http errors, connection errors after all
+                retries, timeouts and hosts suspended by their circuit breaker.
+            **kwargs:
+                Passed to the parser of the ``method``
+
+            Returns
+            -------
+            list
+        """
+        if method not in self._parsers:
+            raise ValueError("Invalid method '%s', must be one in: %s" % (method, list(self._parsers)))
+        max_concurrent = OPTIONS['http_concurrency'] if max_concurrent is None else max_concurrent
+        urls = list(urls)
+        contents = [None] * len(urls)
+        failed = set()
+        offline = is_offline(self.protocol)
+        max_age = 0 if offline else OPTIONS['cache_max_age']
+        missing = [i for i, url in enumerate(urls)
+                   if not self.cache or not self.fs.cached_files[-1].touch(self.store_path(url), max_age=max_age)]
+
+        if offline and len(missing) > 0:
+            if errors == 'raise':
+                raise self._offline_miss(urls[missing[0]])
+            failed.update(missing)
+            missing = []
+
+        if len(missing) > 0:
+            queries = [(urls[i], self._conditional_headers(urls[i])) for i in missing]
+            if with_aiohttp:
+                responses = self._run(self._download_many(queries, max_concurrent))
+            else:
+                responses = []
+                for url, headers in queries:
+                    try:
+                        responses.append(self._download(url, headers))
+                    except Exception as e:
+                        responses.append(e)
+            for i, response in zip(missing, responses):
+                # Failed urls are None with errors='ignore', other urls of the batch are still returned
+                try:
+                    if isinstance(response, BaseException):
+                        raise response
+                    if not self._keep_response(urls[i], *response):  # Not modified, but removed meanwhile
+                        response = self._download(urls[i])
+                        self._keep_response(urls[i], *response)
+                    contents[i] = response[2]
+                except requests.HTTPError as e:
+                    failed.add(i)
+                    if errors == 'raise':
+                        self._verbose_exceptions(e)
+                except Exception:
+                    failed.add(i)
+                    if errors == 'raise':
+                        raise
+            self._evict(urls)
+
+        results = []
+        for i, url in enumerate(urls):
+            if i in failed:
+                results.append(None)
+                continue
+            if self.cache:
+                with self.fs.cached_files[-1].open(self.store_path(url)) as of:
+                    contents[i] = of.read()
+            results.append(self._parsers[method](contents[i], **kwargs))
+            self.register(url)
+        return results
+
+    def _conditional_headers(self, url):
+        """ Return headers of a conditional request for the expired cached copy of an url, if any """
+        headers = {}
+        if self.cache:
+            detail = self.fs.cached_files[-1].stale(self.store_path(url))
+            if detail is not None:
+                if detail['etag']:
+                    headers['If-None-Match'] = detail['etag']
+                if detail['modified']:
+                    headers['If-Modified-Since'] = detail['modified']
+        return headers
+
+    def _keep_response(self, url, status, headers, data):
+        """ Save an url response in the cache, with its validators
+
+            Return False for a 'Not modified' response if the cached copy was removed meanwhile, True otherwise.
+            Failed responses raise a requests.HTTPError.
+        """
+        if status >= 400:
+            raise self._http_error(url, status, headers, data)
+        if not self.cache:
+            return True
+        registry = self.fs.cached_files[-1]
+        if status == 304:
+            if registry.stale(self.store_path(url)) is None:
+                return False
+            registry.revalidate(self.store_path(url))
+            return True
+        registry.write(self.store_path(url), hash_name(url, self.fs.same_names), data,
+                       etag=headers.get('ETag'), modified=headers.get('Last-Modified'),
+                       compression=OPTIONS['cache_compression'])
+        return True
+
+    def _evict(self, urls):
+        """ Apply the cache policy, keeping the cached copy of urls """
+        if self.cache:
+            self.fs.cached_files[-1].evict(max_bytes=OPTIONS['cache_max_bytes'],
+                                           max_age=OPTIONS['cache_max_age'],
+                                           policy=OPTIONS['cache_policy'],
+                                           keep=[self.store_path(url) for url in urls])
+
+    def _download(self, url, headers=None):
+        """ Synchronous download of an url, with retries, return status, headers and content """
+        attempt = 0
+        while True:
+            hostguard.check(url)
+            hostguard.count(url, 'requests')
+            try:
+                r = requests.get(url, headers=headers, timeout=self.storage_options.get('timeout', None))
+                response, error = (r.status_code, r.headers, r.content), None
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout) as e:
+                response, error = None, e
+            except Exception:
+                hostguard.breaker(url).failure()  # Always record an outcome, to release a trial request
+                raise
+            except BaseException:
+                hostguard.breaker(url).release()
+                raise
+            delay = self._retry_delay(url, attempt, response)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+            time.sleep(delay)
+            attempt += 1
+
+    def _retry_delay(self, url, attempt, response):
+        """ Record the outcome of an attempt, and return the delay before retrying it, or None not to retry
+
+            A response is None for a reset connection.
+        """
+        breaker = hostguard.breaker(url)
+        if response is not None and response[0] not in self.retry.statuses:
+            breaker.success()
+            return None
+        breaker.failure()
+        delay = self.retry.delay(attempt, None if response is None else response[1])
+        hostguard.count(url, 'failures' if delay is None else 'retries')
+        return delay
+
+    async def _download_many(self, queries, max_concurrent):
+        """ Download (url, headers) queries with a pooled aiohttp session, with retries
+
+            Return status, headers and content of each response, in order, or the exception raised by a failed query.
+        """
+        semaphore = asyncio.Semaphore(max_concurrent)
+        connector = aiohttp.TCPConnector(limit=max_concurrent, limit_per_host=max_concurrent)
+        timeout = aiohttp.ClientTimeout(total=self.storage_options.get('timeout', None))
+
+        async def fetch(session, url, headers):
+            attempt = 0
+            while True:
+                async with semaphore:
+                    hostguard.check(url)
+                    hostguard.count(url, 'requests')
+                    try:
+                        async with session.get(url, headers=headers) as r:
+                            response, error = (r.status, CaseInsensitiveDict(r.headers), await r.read()), None
+                    except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                        response, error = None, e
+                    except Exception:
+                        hostguard.breaker(url).failure()  # Always record an outcome, to release a trial request
+                        raise
+                    except BaseException:  # Cancelled
+                        hostguard.breaker(url).release()
+                        raise
+                delay = self._retry_delay(url, attempt, response)
+                if delay is None:
+                    if error is not None:
+                        raise error
+                    return response
+                await asyncio.sleep(delay)  # Out of the semaphore, other requests can go on meanwhile
+                attempt += 1
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            return await asyncio.gather(*[fetch(session, url, headers) for url, headers in queries],
+                                        return_exceptions=True)
+
+    @staticmethod
+    def _run(coroutine):
+        """ Run a coroutine to completion, in a new thread if an event loop is already running (eg: in notebooks) """
+        def run():
+            loop = asyncio.new_event_loop()
+            try:
+                return loop.run_until_complete(coroutine)
+            finally:
+                loop.close()
+
+        if asyncio._get_running_loop() is None:  # asyncio.get_running_loop requires python 3.7
+            return run()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(run).result()
+
+    @staticmethod
+    def _http_error(url, status, headers, data):
+        """ Make a requests.HTTPError from a failed response, to be handled by _verbose_exceptions """
+        r = requests.Response()
+        r.url, r.status_code, r._content = url, status, data
+        r.headers = CaseInsensitiveDict(headers)
+        return requests.HTTPError("%i Error for url: %s" % (status, url), response=r)
+
 
 class memorystore(filestore):
     # Note that this inherits from filestore, not argo_store_proto
@@ -23,7 +23,7 @@ import argopy
 from argopy import DataFetcher as ArgoDataFetcher
 from argopy.errors import InvalidFetcherAccessPoint, InvalidFetcher, ErddapServerError, CacheFileNotFound, FileSystemHasNoCache
 
-from argopy.utilities import list_available_data_src, isconnected, erddap_ds_exists
+from argopy.utilities import list_available_data_src, isconnected, erddap_ds_exists, list_standard_variables
 AVAILABLE_SOURCES = list_available_data_src()
 CONNECTED = isconnected()
 if CONNECTED:
@@ -50,6 +50,14 @@ def test_invalid_fetcher():
         ArgoDataFetcher(src='invalid_fetcher').to_xarray()
 
 
+@unittest.skipUnless('argovis' in AVAILABLE_SOURCES, "requires argovis data fetcher")
+def test_unavailable_iter_xarray():
+    with pytest.raises(InvalidFetcherAccessPoint):
+        ArgoDataFetcher(src='argovis').iter_xarray()
+    with pytest.raises(InvalidFetcher):
+        ArgoDataFetcher(src='argovis').float(6902746).iter_xarray()  # Only with the localftp data fetcher
+
+
 # @unittest.skipUnless('localftp' in AVAILABLE_SOURCES, "requires localftp data fetcher")
 # def test_unavailable_accesspoint():
 #     with pytest.raises(InvalidFetcherAccessPoint):
@@ -352,6 +360,111 @@ class LocalFTP(TestCase):
             with pytest.raises(FileSystemHasNoCache):
                 loader.fetcher.cachepath
 
+    def test_result_cache(self):
+        with argopy.set_options(cachedir=self.testcachedir, local_ftp=self.local_ftp):
+            try:
+                loader = ArgoDataFetcher(src=self.src, cache=True).profile(2901623, 12)
+                ds = loader.to_xarray()
+                assert len(loader._results.keys()) == 1
+                xr.testing.assert_identical(loader.to_xarray(), ds)  # From the post-processed datasets cache
+                loader.clear_cache()
+                assert len(loader._results.keys()) == 0
+                shutil.rmtree(self.testcachedir)
+            except Exception:
+                shutil.rmtree(self.testcachedir)
+                raise
+
+    def test_result_key(self):
+        with argopy.set_options(cachedir=self.testcachedir, local_ftp=self.local_ftp):
+            try:
+                loader = ArgoDataFetcher(src=self.src, cache=True).profile(2901623, 12)
+                key = loader._result_key()
+                assert loader._result_key(errors='raise') == key  # Default values
+                assert loader._result_key(client='mp') == key  # The client doesn't change the data
+                assert loader._result_key(errors='ignore') != key
+                loader._results.put(loader._result_key(errors='ignore'), xr.Dataset())
+                loader._result_keys.append(loader._result_key(errors='ignore'))
+                loader.clear_cache()
+                assert len(loader._results.keys()) == 0
+                shutil.rmtree(self.testcachedir)
+            except Exception:
+                shutil.rmtree(self.testcachedir)
+                raise
+
+    def test_pressure_selection(self):
+        from argopy.data_fetchers.localftp_data import LocalFTPArgoDataFetcher
+        pres = np.array([[5., 10., 20., 30., np.nan],
+                         [50., 100., 150., np.nan, np.nan],
+                         [2., 4., 6., 8., 9.96]])
+        ds = xr.Dataset({'PRES': (('N_PROF', 'N_LEVELS'), pres)})
+        profiles, levels = LocalFTPArgoDataFetcher._pressure_selection(ds, 0, 10)
+        assert list(profiles) == [0, 2] and levels == slice(0, 5)
+        profiles, levels = LocalFTPArgoDataFetcher._pressure_selection(ds, 40, 120)
+        assert list(profiles) == [1] and levels == slice(0, 2)
+        assert LocalFTPArgoDataFetcher._pressure_selection(ds, 500, 1000) is None
+
+    def test_unused_variables(self):
+        with argopy.set_options(local_ftp=self.local_ftp):
+            fetcher = ArgoDataFetcher(src=self.src, mode='standard').float(2901623).fetcher
+            assert fetcher.mode == 'standard'
+            unused = fetcher._unused_variables()
+            assert 'HISTORY_ACTION' in unused and 'PLATFORM_TYPE' in unused
+            assert len(set(unused) & set(list_standard_variables())) == 0
+            fetcher = ArgoDataFetcher(src=self.src, mode='expert').float(2901623).fetcher
+            unused = fetcher._unused_variables()
+            assert 'HISTORY_ACTION' in unused and 'SCIENTIFIC_CALIB_COMMENT' in unused
+            assert 'PLATFORM_TYPE' not in unused and 'TEMP' not in unused
+
+    def test_variables_projection(self):
+        with argopy.set_options(local_ftp=self.local_ftp):
+            ds = ArgoDataFetcher(src=self.src, mode='expert').float(2901623).to_xarray()
+            assert 'PLATFORM_TYPE' in ds and 'TEMP_ADJUSTED' in ds
+            assert len([v for v in ds.data_vars if v.startswith('HISTORY_')]) == 0
+            ds = ArgoDataFetcher(src=self.src, mode='standard').float(2901623).to_xarray()
+            assert set(ds.data_vars) <= set(list_standard_variables())
+
+    def test_file_batches(self):
+        with argopy.set_options(local_ftp=self.local_ftp):
+            fetcher = ArgoDataFetcher(src=self.src).region([-60, -40, 40., 60., 0., 100.]).fetcher
+            fetcher._list_of_argo_files = [os.path.join("dac", "coriolis", "6901929", "profiles", "R6901929_001.nc"),
+                                           os.path.join("dac", "aoml", "2901623", "profiles", "D2901623_001.nc"),
+                                           os.path.join("dac", "coriolis", "6901929", "profiles", "R6901929_002.nc"),
+                                           os.path.join("dac", "coriolis", "3902131", "3902131_prof.nc")]
+            assert [len(b) for b in fetcher.file_batches()] == [2, 1, 1]
+            assert [len(b) for b in fetcher.file_batches(2)] == [3, 1]
+            assert [len(b) for b in fetcher.file_batches(10)] == [4]
+            with pytest.raises(ValueError):
+                fetcher.iter_xarray(batch_size=0)
+
+    def test_iter_xarray(self):
+        with argopy.set_options(local_ftp=self.local_ftp):
+            loader = ArgoDataFetcher(src=self.src).float([2901623, 6901929])
+            batches = list(loader.iter_xarray())
+            assert len(batches) == 2
+            assert all([isinstance(ds, xr.Dataset) for ds in batches])
+            assert sum([len(ds['N_POINTS']) for ds in batches]) == len(loader.to_xarray()['N_POINTS'])
+            assert len(list(loader.iter_xarray(batch_size=2))) == 1
+
+    def test_pool_load(self):
+        with argopy.set_options(local_ftp=self.local_ftp):
+            fetcher = ArgoDataFetcher(src=self.src).float([2901623, 6901929]).fetcher
+            ds = fetcher.to_xarray()
+            ds_pool = fetcher.to_xarray(client='mp')  # Loaded by workers, returned through shared memory
+            assert ds_pool.attrs['Fetched_constraints'] == ds.attrs['Fetched_constraints']
+            ds_pool.attrs, ds.attrs = {}, {}
+            xr.testing.assert_identical(ds_pool, ds)
+
+    def test_region_pressure(self):
+        with argopy.set_options(local_ftp=self.local_ftp):
+            box = [-60, -40, 40., 60., 0., 2000., '2007-08-01', '2007-09-01']
+            ds = ArgoDataFetcher(src=self.src).region(box).to_xarray()
+            box[4:6] = [10., 100.]
+            loader = ArgoDataFetcher(src=self.src).region(box)
+            assert "z=10.0/100.0" in loader.fetcher.cname()
+            ds_upper = loader.to_xarray()
+            assert ds_upper['PRES'].min() >= 10. and ds_upper['PRES'].max() <= 100.
+            assert len(ds_upper['N_POINTS']) < len(ds['N_POINTS'])
+
     def __testthis_profile(self, dataset):
         with argopy.set_options(local_ftp=self.local_ftp):
             for arg in self.args['profile']:
@@ -6,6 +6,7 @@
 
 import os
 import xarray as xr
+import pandas as pd
 import shutil
 
 import pytest
@@ -212,6 +213,21 @@ class LocalFTP(TestCase):
             with pytest.raises(DataNotFound):
                 ArgoIndexFetcher(src=self.src).region([-70, -65, 30., 35., '2030-01-01', '2030-06-30']).to_dataframe()
 
+    def test_aggregate(self):
+        with argopy.set_options(local_ftp=self.local_ftp):
+            df = ArgoIndexFetcher(src=self.src).float(6901929).to_dataframe()
+            counts = ArgoIndexFetcher(src=self.src).aggregate('wmo')
+            assert counts.loc[6901929, 'count'] == len(df)
+            assert counts.loc[6901929, 'first_date'] == df['date'].min()
+            nprof = ArgoIndexFetcher(src=self.src).aggregate('wmo')['count'].sum()
+            for by in ['dac', 'institution', 'profiler', 'ocean', 'month']:
+                counts = ArgoIndexFetcher(src=self.src).aggregate(by)
+                assert isinstance(counts, pd.Series)
+                assert counts.sum() <= nprof
+            assert ArgoIndexFetcher(src=self.src).aggregate('dac').sum() == nprof
+            with pytest.raises(ValueError):
+                ArgoIndexFetcher(src=self.src).aggregate('invalid')
+
     def __testthis(self, dataset):
         for access_point in self.args:
 
@@ -36,8 +36,68 @@ def test_usermode():
         assert OPTIONS["mode"]
 
 
+def test_index_engine():
+    with pytest.raises(ValueError):
+        argopy.set_options(index_engine="invalid_engine")
+    with argopy.set_options(index_engine="text"):
+        assert OPTIONS["index_engine"] == "text"
+    with argopy.set_options(index_engine="numpy"):
+        assert OPTIONS["index_engine"] == "numpy"
+
+
+def test_index_workers():
+    with pytest.raises(ValueError):
+        argopy.set_options(index_workers=0)
+    with argopy.set_options(index_workers=4):
+        assert OPTIONS["index_workers"] == 4
+
+
+def test_cache_policy():
+    with pytest.raises(ValueError):
+        argopy.set_options(cache_policy="invalid_policy")
+    with pytest.raises(ValueError):
+        argopy.set_options(cache_max_bytes=-1)
+    with pytest.raises(ValueError):
+        argopy.set_options(cache_max_age="1 day")
+    with argopy.set_options(cache_policy="lfu", cache_max_bytes=2**30, cache_max_age=0):
+        assert OPTIONS["cache_policy"] == "lfu"
+        assert OPTIONS["cache_max_bytes"] == 2**30
+        assert OPTIONS["cache_max_age"] == 0
+
+
+def test_http_concurrency():
+    with pytest.raises(ValueError):
+        argopy.set_options(http_concurrency=0)
+    with argopy.set_options(http_concurrency=32):
+        assert OPTIONS["http_concurrency"] == 32
+
+
+def test_cache_compression():
+    with pytest.raises(ValueError):
+        argopy.set_options(cache_compression="invalid_codec")
+    with argopy.set_options(cache_compression="gzip"):
+        assert OPTIONS["cache_compression"] == "gzip"
+    assert OPTIONS["cache_compression"] is None
+
+
 def test_local_ftp():
     with pytest.raises(ValueError):
         argopy.set_options(local_ftp="invalid_path")
     with argopy.set_options(local_ftp=os.path.expanduser("~")):
         assert OPTIONS["local_ftp"]
+
+
+def test_offline():
+    with pytest.raises(ValueError):
+        argopy.set_options(offline="yes")
+    with argopy.set_options(offline=True):
+        assert OPTIONS["offline"]
+    assert not OPTIONS["offline"]
+
+
+def test_http_retries():
+    for value in [-1, 1.5, True]:
+        with pytest.raises(ValueError):
+            argopy.set_options(http_retries=value)
+    with argopy.set_options(http_retries=0):
+        assert OPTIONS["http_retries"] == 0
@@ -0,0 +1,91 @@
+#!/bin/env python
+# -*coding: UTF-8 -*-
+#
+# Test cache pre-warming
+#
+
+import os
+import shutil
+import tempfile
+
+import pytest
+import unittest
+from unittest import TestCase
+
+import argopy
+from argopy.prefetcher import prefetch, prefetchjournal, main
+from argopy.utilities import list_available_data_src
+AVAILABLE_SOURCES = list_available_data_src()
+
+
+@unittest.skipUnless('localftp' in AVAILABLE_SOURCES, "requires localftp data fetcher")
+class Prefetch(TestCase):
+    src = 'localftp'
+    testcachedir = os.path.expanduser(os.path.join("~", ".argopytest_tmp"))
+    local_ftp = argopy.tutorial.open_dataset('localftp')[0]
+
+    def test_journal(self):
+        try:
+            journal = prefetchjournal(self.testcachedir)
+            request = {'access_point': 'float', 'args': 6901929}
+            sha = journal.key(request)
+            assert journal.status(sha) is None
+            journal.record(sha, request, 'done')
+            assert journal.status(sha) == 'done'
+            journal.clear()
+            assert journal.status(sha) is None
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+
+    def test_prefetch(self):
+        try:
+            report = prefetch(wmos=[2901623, 6901929], src=self.src, local_ftp=self.local_ftp,
+                              cachedir=self.testcachedir, max_workers=2, progress=False)
+            assert list(report['status']) == ['done', 'done']
+            assert len(argopy.stores.resultcache(self.testcachedir).keys()) == 2
+
+            # Resume: requests already done are skipped
+            calls = []
+            report = prefetch(wmos=[2901623, 6901929], src=self.src, local_ftp=self.local_ftp,
+                              cachedir=self.testcachedir, progress=lambda *args: calls.append(args))
+            assert list(report['status']) == ['skipped', 'skipped']
+            assert [c[0] for c in calls] == [1, 2]
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+
+    def test_failures_are_retried(self):
+        local_ftp = tempfile.mkdtemp()  # An empty ftp, where nothing can be found
+        try:
+            for i in range(2):
+                report = prefetch(wmos=[1234567], src=self.src, local_ftp=local_ftp,
+                                  cachedir=self.testcachedir, progress=False)
+                assert report['status'][0] == 'failed'
+                assert 'NetCDF4FileNotFoundError' in report['error'][0]
+            with pytest.raises(ValueError):
+                prefetch(wmos=[1234567], src=self.src, cachedir=self.testcachedir, max_workers=0)
+            shutil.rmtree(self.testcachedir)
+            shutil.rmtree(local_ftp)
+        except Exception:
+            shutil.rmtree(self.testcachedir, ignore_errors=True)
+            shutil.rmtree(local_ftp)
+            raise
+
+    def test_cli(self):
+        local_ftp = tempfile.mkdtemp()
+        try:
+            assert main(['--wmo', '1234567', '--src', self.src, '--local-ftp', local_ftp,
+                         '--cachedir', self.testcachedir, '--quiet']) == 1
+            with pytest.raises(SystemExit):
+                main(['--src', self.src])  # Nothing to fetch
+            with pytest.raises(SystemExit):
+                main(['--box', '-60', '-55', '40', '45', '--src', self.src])  # Incomplete box
+            shutil.rmtree(self.testcachedir)
+            shutil.rmtree(local_ftp)
+        except Exception:
+            shutil.rmtree(self.testcachedir, ignore_errors=True)
+            shutil.rmtree(local_ftp)
+            raise
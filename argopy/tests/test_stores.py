@@ -1,19 +1,145 @@
 import os
 import shutil
+import time
+import pickle
+import asyncio
+import multiprocessing
+import threading
+import json
+import email.utils
+import http.server
+import socketserver
+from concurrent.futures import ThreadPoolExecutor
 import pytest
 import unittest
 from unittest import TestCase
 
+import numpy as np
 import xarray as xr
 import pandas as pd
+import requests
 import fsspec
 import argopy
-from argopy.stores import filestore, httpstore, indexfilter_wmo, indexfilter_box, indexstore
-from argopy.errors import FileSystemHasNoCache, CacheFileNotFound
+from argopy.stores import filestore, httpstore, indexfilter_wmo, indexfilter_box, indexstore, indexsidecar, \
+    indexwmotable, indexsearchcache, cacheregistry, resultcache, gdaccatalog
+from argopy.stores.argo_index import index_chunks
+from argopy.data_fetchers.localftp_index import profiler_code
+from argopy.stores.argo_cache_registry import get_registry, available_compressions
+from argopy.stores import argo_http_retry
+from argopy.stores.argo_http_retry import retrypolicy
+from argopy.stores.argo_shared_memory import with_shared_memory, start_tracker, share_dataset, attach_dataset
+from argopy.errors import FileSystemHasNoCache, CacheFileNotFound, DataNotFound, OfflineCacheMiss, ServerUnavailable
 from argopy.utilities import isconnected
 CONNECTED = isconnected()
 
 
+def write_index_delta(index_file, delta_file):
+    """ Write an index delta file moving the 10th profile to 10N/20E, and adding a new profile """
+    with open(index_file, "r") as f:
+        lines = f.readlines()
+    header = [line for line in lines if line.startswith("#") or line.startswith("file,")]
+    body = lines[len(header):]
+    updated = body[10].strip().split(",")
+    updated[2], updated[3], updated[7] = "10.000", "20.000", "20300101000000"
+    added = body[30].strip().split(",")
+    added[0] = added[0].replace(".nc", "9.nc")
+    with open(delta_file, "w") as f:
+        f.write("".join(header) + ",".join(updated) + "\n" + ",".join(added) + "\n")
+    return body[:10] + [",".join(updated) + "\n"] + body[11:] + [",".join(added) + "\n"]
+
+
+class LocalHttpHandler(http.server.BaseHTTPRequestHandler):
+    """ Stand-in http server answering a json document with the requested path, or a 404 for '/missing'
+
+        Paths starting with '/slow' are answered after a longer delay. Responses have an ETag header, the version, and
+        are not modified for requests with the same ETag.
+        Paths starting with '/flaky' are answered with a 503 error, and paths starting with '/reset' have their
+        connection closed without response, as long as there are 'failures' to serve. Paths starting with '/down'
+        are always answered with a 503 error, with a long 'Retry-After' delay for '/down/later'.
+    """
+    active, peak, count, not_modified, failures = 0, 0, 0, 0, 0
+    version = "v1"
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            LocalHttpHandler.active += 1
+            LocalHttpHandler.count += 1
+            LocalHttpHandler.peak = max(LocalHttpHandler.peak, LocalHttpHandler.active)
+        time.sleep(0.5 if self.path.startswith("/slow") else 0.05)
+        with self.lock:
+            fail = LocalHttpHandler.failures > 0 and self.path.startswith(("/flaky", "/reset"))
+            LocalHttpHandler.failures -= 1 if fail else 0
+        if fail and self.path.startswith("/reset"):
+            self.close_connection = True
+            return self._done()
+        if fail or self.path.startswith("/down"):
+            body = b"Service unavailable"
+            self.send_response(503)
+            self.send_header("Retry-After", "3600" if self.path == "/down/later" else "0")
+        elif self.path == "/missing":
+            body = b"Not found"
+            self.send_response(404)
+        elif self.headers.get("If-None-Match") == self.version:
+            LocalHttpHandler.not_modified += 1
+            self.send_response(304)
+            self.end_headers()
+            return self._done()
+        else:
+            body = json.dumps({'path': self.path, 'version': self.version}).encode()
+            self.send_response(200)
+            self.send_header("ETag", self.version)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except ConnectionError:  # Client gone, after a timeout
+            pass
+        self._done()
+
+    def _done(self):
+        with self.lock:
+            LocalHttpHandler.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+class LocalHttpServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """ Stand-in http server answering each request in a thread """
+    daemon_threads = True
+
+
+def local_http_server():
+    """ Start a stand-in http server in a thread, and return it with its url """
+    server = LocalHttpServer(("127.0.0.1", 0), LocalHttpHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:%i" % server.server_port
+
+
+def _cache_file(args):
+    """ Cache a file with a new file store, to be run in another process """
+    cachedir, uri = args
+    with filestore(cache=1, cachedir=cachedir).open(uri) as of:
+        of.read()
+
+
+def _points(wmo):
+    """ Return a collection of points with variables of all kinds of data types """
+    return xr.Dataset({'TEMP': ('N_POINTS', np.arange(4.) + wmo),
+                       'TEMP_QC': ('N_POINTS', np.array([1, 1, 4, 1], dtype=np.int32)),
+                       'DATA_MODE': ('N_POINTS', np.array(['R', 'D', 'D', 'A'])),
+                       'COMMENT': ('N_POINTS', np.array(['a', None, 1, 2.], dtype=object))},
+                      coords={'TIME': ('N_POINTS', pd.date_range('2020-01-01', periods=4)),
+                              'N_POINTS': np.arange(4)},
+                      attrs={'Fetched_uri': str(wmo)})
+
+
+def _share_points(wmo):
+    """ Share a collection of points, to be run in another process """
+    return share_dataset(_points(wmo))
+
+
 class FileStore(TestCase):
     ftproot = argopy.tutorial.open_dataset('localftp')[0]
     csvfile = os.path.sep.join([ftproot, "ar_index_global_prof.txt"])
@@ -75,6 +201,8 @@ class FileStore(TestCase):
         os.remove(uri)
 
 class HttpStore(TestCase):
+    testcachedir = os.path.expanduser(os.path.join("~", ".argopytest_tmp"))
+
     def test_creation(self):
         fs = httpstore(cache=0)
         assert isinstance(fs.fs, fsspec.implementations.http.HTTPFileSystem)
@@ -128,6 +256,485 @@ class HttpStore(TestCase):
             shutil.rmtree(testcachedir)
             raise
 
+    def test_open_many(self):
+        server, url = local_http_server()
+        try:
+            urls = ["%s/%i" % (url, i) for i in range(12)]
+            fs = httpstore()
+            LocalHttpHandler.peak = 0
+            results = fs.open_many(urls, method='json', max_concurrent=4)
+            assert [r['path'] for r in results] == ["/%i" % i for i in range(12)]
+            assert LocalHttpHandler.peak <= 4
+            assert fs.open_many(["%s/missing" % url, urls[0]], method='json', errors='ignore')[0] is None
+            with argopy.set_options(http_retries=0):
+                refused = "http://127.0.0.1:1/refused"  # Connection errors don't abort the batch
+                results = fs.open_many([refused, urls[1]], method='json', errors='ignore')
+                assert results[0] is None and results[1]['path'] == "/1"
+                with pytest.raises(OSError):
+                    fs.open_many([refused, urls[1]], method='json')
+            with pytest.raises(requests.HTTPError):
+                fs.open_many(["%s/missing" % url])
+            with pytest.raises(ValueError):
+                fs.open_many(urls, method='invalid')
+        finally:
+            httpstore.reset_stats()
+            server.shutdown()
+
+    def test_open_many_cache(self):
+        server, url = local_http_server()
+        try:
+            urls = ["%s/%i" % (url, i) for i in range(3)]
+            fs = httpstore(cache=1, cachedir=self.testcachedir)
+            results = fs.open_many(urls, method='json')
+            count = LocalHttpHandler.count
+            assert fs.open_many(urls, method='json') == results  # From cache
+            assert fs.open_json(urls[1]) == results[1]
+            assert LocalHttpHandler.count == count
+            assert isinstance(fs.cachepath(urls[2]), str)
+            fs.clear_cache()
+            with pytest.raises(CacheFileNotFound):
+                fs.cachepath(urls[2])
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+        finally:
+            server.shutdown()
+
+    def test_single_flight(self):
+        server, url = local_http_server()
+        try:
+            fs = httpstore(cache=1, cachedir=self.testcachedir)
+            count = LocalHttpHandler.count
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                results = list(executor.map(lambda i: httpstore().open_json(url + "/slow"), range(8)))
+            assert results == [{'path': "/slow", 'version': "v1"}] * 8
+            assert LocalHttpHandler.count == count + 1
+            assert len(httpstore._flights) == 0
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                results = list(executor.map(lambda i: fs.open_json(url + "/slow"), range(4)))
+            assert LocalHttpHandler.count == count + 2  # Released, then cached
+            assert isinstance(fs.cachepath(url + "/slow"), str)
+            # Stores with and without cache don't share downloads, each gets the content:
+            stores = [fs, httpstore()] * 4
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                results = list(executor.map(lambda store: store.open_json(url + "/slow/mixed"), stores))
+            assert results == [{'path': "/slow/mixed", 'version': "v1"}] * 8
+            assert LocalHttpHandler.count == count + 4
+            with pytest.raises(requests.HTTPError):
+                fs.open_json(url + "/missing")
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+        finally:
+            server.shutdown()
+
+    def test_compression(self):
+        server, url = local_http_server()
+        try:
+            fs = httpstore(cache=1, cachedir=self.testcachedir)
+            with argopy.set_options(cache_compression='lzma'):
+                js = fs.open_json(url + "/lzma")
+                assert fs.open_many([url + "/lzma/many"], method='json')[0]['path'] == "/lzma/many"
+            assert get_registry(self.testcachedir)[url + "/lzma"]['compression'] == 'lzma'
+            with open(fs.cachepath(url + "/lzma"), "rb") as f:
+                assert f.read(6) == b"\xfd7zXZ\x00"  # xz magic number
+            assert fs.open_json(url + "/lzma") == js
+            assert fs.open_many([url + "/lzma"], method='json') == [js]
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+        finally:
+            server.shutdown()
+
+    def test_revalidate(self):
+        server, url = local_http_server()
+        try:
+            fs = httpstore(cache=1, cachedir=self.testcachedir)
+            assert fs.open_json(url + "/etag") == {'path': "/etag", 'version': "v1"}
+            assert get_registry(self.testcachedir)[url + "/etag"]['etag'] == "v1"
+            count, not_modified = LocalHttpHandler.count, LocalHttpHandler.not_modified
+            with argopy.set_options(cache_max_age=1e-6):
+                assert fs.open_json(url + "/etag") == {'path': "/etag", 'version': "v1"}  # Revalidated
+                assert fs.open_many([url + "/etag"], method='json') == [{'path': "/etag", 'version': "v1"}]
+                assert LocalHttpHandler.not_modified == not_modified + 2
+                LocalHttpHandler.version = "v2"
+                assert fs.open_json(url + "/etag")['version'] == "v2"  # Modified, so downloaded again
+            assert get_registry(self.testcachedir)[url + "/etag"]['etag'] == "v2"
+            assert fs.open_json(url + "/etag")['version'] == "v2"  # Not expired
+            assert LocalHttpHandler.count == count + 3
+
+            # Expired copies are not evicted by age, so that all of them are revalidated:
+            urls = [url + "/etag/%i" % i for i in range(3)]
+            fs.open_many(urls, method='json')
+            not_modified = LocalHttpHandler.not_modified
+            with argopy.set_options(cache_max_age=1e-6):
+                for u in urls:
+                    assert fs.open_json(u)['version'] == "v2"
+            assert LocalHttpHandler.not_modified == not_modified + 3
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+        finally:
+            LocalHttpHandler.version = "v1"
+            server.shutdown()
+
+    def test_offline(self):
+        server, url = local_http_server()
+        try:
+            fs = httpstore(cache=1, cachedir=self.testcachedir)
+            assert fs.open_json(url + "/cached") == {'path': "/cached", 'version': "v1"}
+            count = LocalHttpHandler.count
+            with argopy.set_options(offline=True, cache_max_age=1e-6):
+                assert fs.open_json(url + "/cached")['path'] == "/cached"  # Expired, but served from cache
+                assert fs.open_many([url + "/cached"], method='json')[0]['path'] == "/cached"
+                assert fs.exists(url + "/cached") and not fs.exists(url + "/dummy")
+                with pytest.raises(OfflineCacheMiss):
+                    fs.open_json(url + "/dummy")
+                with pytest.raises(OfflineCacheMiss):
+                    fs.open(url + "/dummy")
+                with pytest.raises(OfflineCacheMiss):
+                    fs.open_many([url + "/cached", url + "/dummy"])
+                assert fs.open_many([url + "/cached", url + "/dummy"], errors='ignore')[1] is None
+                with pytest.raises(OfflineCacheMiss):
+                    httpstore(cache=0).open_json(url + "/cached")
+            assert LocalHttpHandler.count == count  # No request sent
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+        finally:
+            server.shutdown()
+
+    def test_retry(self):
+        server, url = local_http_server()
+        try:
+            httpstore.reset_stats()
+            host = url.split("//")[1]
+            for cache in [0, 1]:
+                fs = httpstore(cache=cache, cachedir=self.testcachedir, retry=retrypolicy(total=3, backoff=0.01))
+                LocalHttpHandler.failures = 2
+                assert fs.open_json(url + "/flaky/%i" % cache)['path'] == "/flaky/%i" % cache
+                LocalHttpHandler.failures = 2
+                assert fs.open_json(url + "/reset/%i" % cache)['path'] == "/reset/%i" % cache
+            LocalHttpHandler.failures = 2
+            assert fs.open_many([url + "/flaky/many", url + "/ok"], method='json')[0]['path'] == "/flaky/many"
+            assert httpstore.stats()['retries'] == 10
+            assert httpstore.stats()['hosts'][host]['requests'] == 16
+
+            fs = httpstore(retry=retrypolicy(total=1, backoff=0.01))
+            with pytest.raises(requests.HTTPError):
+                fs.open_json(url + "/down")
+            with pytest.raises(requests.HTTPError):
+                fs.open_json(url + "/down/later")  # Not retried, the server asks to wait too long
+            assert httpstore.stats()['failures'] == 2
+            assert httpstore.stats()['requests'] == 19
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+        finally:
+            LocalHttpHandler.failures = 0
+            httpstore.reset_stats()
+            server.shutdown()
+
+    def test_circuit_breaker(self):
+        server, url = local_http_server()
+        try:
+            host = url.split("//")[1]
+            fs = httpstore(retry=retrypolicy(total=0))
+            for i in range(5):
+                with pytest.raises(requests.HTTPError):
+                    fs.open_json(url + "/down")
+            count = LocalHttpHandler.count
+            with pytest.raises(ServerUnavailable):
+                fs.open_json(url + "/ok")
+            with pytest.raises(ServerUnavailable):
+                fs.open_many([url + "/ok"])
+            assert LocalHttpHandler.count == count  # No request sent to the host
+            assert httpstore.stats()['hosts'][host]['rejected'] == 2
+            assert httpstore.stats()['hosts'][host]['circuit'] == 'open'
+
+            breaker = argo_http_retry.hostguard.breaker(url)
+            breaker.cooldown = 0  # Half-open: a trial request closes the circuit
+            assert fs.open_json(url + "/ok")['path'] == "/ok"
+            assert breaker.state == 'closed'
+        finally:
+            httpstore.reset_stats()
+            server.shutdown()
+
+    def test_circuit_breaker_trial_timeout(self):
+        server, url = local_http_server()
+        try:
+            fs = httpstore(retry=retrypolicy(total=0), timeout=0.2)
+            for use_many in [False, True]:
+                for i in range(5):
+                    with pytest.raises(requests.HTTPError):
+                        fs.open_json(url + "/down")
+                breaker = argo_http_retry.hostguard.breaker(url)
+                breaker.cooldown = 0
+                with pytest.raises((requests.exceptions.Timeout, asyncio.TimeoutError)):  # The trial request times out
+                    if use_many:
+                        fs.open_many([url + "/slow"])
+                    else:
+                        fs.open_json(url + "/slow")
+                assert not breaker.trial  # Released, the next trial request can go
+                assert fs.open_json(url + "/ok")['path'] == "/ok"
+                assert breaker.state == 'closed'
+        finally:
+            httpstore.reset_stats()
+            time.sleep(0.5)  # Let the server answer timed out requests, not to count them in other tests
+            server.shutdown()
+
+    def test_retry_policy(self):
+        policy = retrypolicy(total=3, backoff=1, max_backoff=3, jitter=False)
+        assert [policy.delay(i) for i in range(4)] == [1, 2, 3, None]
+        assert policy.delay(0, {'Retry-After': "2"}) == 2
+        assert policy.delay(0, {'Retry-After': "120"}) is None
+        assert 0 < policy.delay(0, {'Retry-After': email.utils.formatdate(time.time() + 2, usegmt=True)}) <= 2
+        assert all([0 <= retrypolicy(backoff=1).delay(1) <= 2 for i in range(10)])
+        with argopy.set_options(http_retries=0):
+            assert retrypolicy().delay(0) is None
+
+
+class CacheRegistry(TestCase):
+    testcachedir = os.path.expanduser(os.path.join("~", ".argopytest_tmp"))
+
+    def test_registry(self):
+        try:
+            registry = cacheregistry(self.testcachedir)
+            os.makedirs(self.testcachedir, exist_ok=True)
+            for i in range(3):
+                with open(os.path.join(self.testcachedir, "f%i" % i), "w") as f:
+                    f.write("cached")
+                registry["file:///f%i" % i] = {'fn': "f%i" % i, 'time': 0., 'uid': None, 'blocks': True}
+            assert len(registry) == 3
+            assert registry["file:///f0"]['fn'] == "f0"
+            assert cacheregistry(self.testcachedir).cachepath("file:///f1") == os.path.join(self.testcachedir, "f1")
+            assert registry.remove(["file:///f0", "file:///f2", "file:///dummy"]) == ["file:///f0", "file:///f2"]
+            assert list(registry) == ["file:///f1"]
+            assert not os.path.exists(os.path.join(self.testcachedir, "f0"))
+            registry.close()
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+
+    def test_evict(self):
+        try:
+            registry = cacheregistry(self.testcachedir)
+            os.makedirs(self.testcachedir, exist_ok=True)
+            for i in range(4):
+                with open(os.path.join(self.testcachedir, "f%i" % i), "w") as f:
+                    f.write("x" * 10)
+                registry["file:///f%i" % i] = {'fn': "f%i" % i, 'time': time.time() - 10 * i, 'uid': None}
+            assert registry.nbytes() == 40
+            assert registry.evict(max_age=25) == ["file:///f3"]
+            registry["file:///f2"] = {**registry["file:///f2"], 'etag': "v1"}
+            assert registry.evict(max_age=5) == ["file:///f1"]  # f2 is kept to be revalidated
+            registry.write("file:///f1", "f1", b"x" * 10)
+            for path in ["file:///f0", "file:///f0", "file:///f1"]:
+                registry.touch(path)
+            assert registry["file:///f0"]['hits'] == 2
+            assert registry.evict(max_bytes=20, policy='lru', keep=["file:///f2"]) == ["file:///f0"]  # f2 is kept
+            assert registry.evict(max_bytes=10, policy='lfu') == ["file:///f2"]
+            assert list(registry) == ["file:///f1"]
+            with pytest.raises(ValueError):
+                registry.evict(policy='invalid')
+            registry.close()
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+
+    def test_policy(self):
+        ftproot = argopy.tutorial.open_dataset('localftp')[0]
+        flist = [os.path.sep.join([ftproot, f]) for f in ["ar_index_global_prof.txt", "ar_index_this_week_prof.txt"]]
+        try:
+            fs = filestore(cache=1, cachedir=self.testcachedir)
+            with argopy.set_options(cache_max_bytes=os.path.getsize(flist[0]) + 1):
+                for f in flist:
+                    with fs.open(f) as of:
+                        of.read()
+                with pytest.raises(CacheFileNotFound):
+                    fs.cachepath(flist[0])  # Evicted to cache the 2nd file
+                assert isinstance(fs.cachepath(flist[1]), str)
+            registry = get_registry(self.testcachedir)
+            detail = registry[fs.store_path(flist[1])]
+            with fs.open(flist[1]) as of:
+                of.read()
+            assert registry[fs.store_path(flist[1])]['hits'] == detail['hits'] + 1
+            with argopy.set_options(cache_max_age=1e-6):
+                with fs.open(flist[1]) as of:  # Expired, so cached again
+                    of.read()
+            assert registry[fs.store_path(flist[1])]['time'] > detail['time']
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+
+    def test_compression(self):
+        ftproot = argopy.tutorial.open_dataset('localftp')[0]
+        csvfile = os.path.sep.join([ftproot, "ar_index_global_prof.txt"])
+        try:
+            registry = cacheregistry(self.testcachedir)
+            for compression in available_compressions():
+                registry.write("file:///%s" % compression, compression, b"x" * 1000, compression=compression)
+                assert registry["file:///%s" % compression]['size'] < 1000
+                with registry.open("file:///%s" % compression) as f:
+                    assert f.read() == b"x" * 1000
+            with pytest.raises(ValueError):
+                registry.write("file:///invalid", "invalid", b"x", compression="invalid")
+            registry.close()
+            fs = filestore(cache=1, cachedir=self.testcachedir)
+            with argopy.set_options(cache_compression='gzip'):
+                df = fs.open_dataframe(csvfile, skiprows=8, header=0)
+            assert os.path.getsize(fs.cachepath(csvfile)) < os.path.getsize(csvfile) / 2
+            assert fs.open_dataframe(csvfile, skiprows=8, header=0).equals(df)  # Read from the compressed cache
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+
+    def test_legacy(self):
+        try:
+            os.makedirs(self.testcachedir)
+            with open(os.path.join(self.testcachedir, "cache"), "wb") as f:
+                pickle.dump({"file:///f0": {'fn': "f0", 'time': 0., 'uid': None, 'blocks': True}}, f)
+            registry = cacheregistry(self.testcachedir)
+            assert "file:///f0" in registry
+            assert not os.path.exists(os.path.join(self.testcachedir, "cache"))
+            registry.close()
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+
+    def test_filestore(self):
+        ftproot = argopy.tutorial.open_dataset('localftp')[0]
+        flist = [os.path.sep.join([ftproot, f]) for f in ["ar_index_global_prof.txt", "ar_index_this_week_prof.txt"]]
+        try:
+            fs = filestore(cache=1, cachedir=self.testcachedir)
+            with multiprocessing.Pool(2) as pool:
+                pool.map(_cache_file, [(self.testcachedir, f) for f in flist])
+            assert len(get_registry(self.testcachedir)) == 2  # Files cached by other processes
+            for f in flist:
+                with fs.open(f) as of:
+                    of.read()
+            assert isinstance(fs.cachepath(flist[0]), str)
+            fs.clear_cache()
+            assert len(get_registry(self.testcachedir)) == 0
+            shutil.rmtree(self.testcachedir)
+            with fs.open(flist[0]) as of:  # Registry is created again
+                of.read()
+            assert isinstance(fs.cachepath(flist[0]), str)
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+
+
+class ResultCache(TestCase):
+    testcachedir = os.path.expanduser(os.path.join("~", ".argopytest_tmp"))
+    n = 50
+    ds = xr.Dataset({'PRES': ('N_POINTS', np.linspace(0, 1000, n).astype('float32'), {'units': 'decibar'}),
+                     'PLATFORM_NUMBER': ('N_POINTS', np.full(n, 6901929)),
+                     'DATA_MODE': ('N_POINTS', np.array(['R', 'D'] * (n // 2)))},
+                    coords={'N_POINTS': np.arange(n), 'TIME': ('N_POINTS', pd.date_range('2010-01-01', periods=n))},
+                    attrs={'DATA_ID': 'ARGO'})
+
+    def test_key(self):
+        key = resultcache.key('localftp', 'phy', 'standard', 'float', 'phy_WMO6901929', local_ftp='.')
+        assert key == resultcache.key('localftp', 'phy', 'standard', 'float', 'phy_WMO6901929', local_ftp='.')
+        assert key != resultcache.key('localftp', 'phy', 'expert', 'float', 'phy_WMO6901929', local_ftp='.')
+        assert key != resultcache.key('localftp', 'phy', 'standard', 'float', 'phy_WMO6901929', local_ftp='/ftp')
+
+    def test_put_get(self):
+        try:
+            cache = resultcache(self.testcachedir)
+            key = resultcache.key('localftp', 'phy', 'standard', 'float', 'phy_WMO6901929')
+            assert cache.get(key) is None
+            assert cache.put(key, self.ds)
+            xr.testing.assert_identical(cache.get(key), self.ds)
+            assert cache.keys() == [key]
+            with argopy.set_options(cache_max_age=1e-6):
+                time.sleep(0.01)
+                assert cache.get(key) is None  # Expired
+            assert key not in cache
+            with pytest.warns(UserWarning):
+                assert not cache.put(key, self.ds.assign_attrs(invalid={'not': 'serializable'}))
+            assert key not in cache
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+
+
+class GdacCatalog(TestCase):
+    testcachedir = os.path.expanduser(os.path.join("~", ".argopytest_tmp"))
+
+    def make_ftp(self):
+        """ Create a small GDAC tree in the test folder, and return its path """
+        ftp = os.path.join(self.testcachedir, "ftp")
+        for dac, wmo in [("coriolis", 6901929), ("aoml", 1901393)]:
+            os.makedirs(os.path.join(ftp, "dac", dac, str(wmo), "profiles"))
+            open(os.path.join(ftp, "dac", dac, str(wmo), "%i_prof.nc" % wmo), "w").close()
+            open(os.path.join(ftp, "dac", dac, str(wmo), "%i_meta.nc" % wmo), "w").close()
+            for name in ["R%i_001.nc", "D%i_002.nc", "D%i_002D.nc", "BR%i_002.nc", "R%i_1000.nc"]:
+                open(os.path.join(ftp, "dac", dac, str(wmo), "profiles", name % wmo), "w").close()
+        return ftp
+
+    def test_files(self):
+        try:
+            ftp = self.make_ftp()
+            root = os.path.join(ftp, "dac", "coriolis", "6901929")
+            catalog = gdaccatalog(ftp).refresh()
+            assert catalog.files(6901929) == [os.path.join(root, "6901929_meta.nc"),
+                                              os.path.join(root, "6901929_prof.nc")]
+            assert [os.path.basename(f) for f in catalog.files(6901929, 2)] == \
+                ["BR6901929_002.nc", "D6901929_002.nc", "D6901929_002D.nc"]
+            assert len(catalog.files(6901929, 1000)) == 1
+            assert catalog.files(6901929, 3) == [] and catalog.files(1234567) == []
+            assert catalog.exists("aoml/1901393/profiles/R1901393_001.nc")
+            assert catalog.exists(os.path.join(ftp, "dac", "aoml", "1901393", "1901393_prof.nc"))
+            assert not catalog.exists("coriolis/1901393/1901393_prof.nc")  # Wrong dac
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+
+    def test_refresh(self):
+        try:
+            ftp = self.make_ftp()
+            catalog = gdaccatalog(ftp, cachedir=self.testcachedir).build()
+            assert len(catalog.floats) == 2
+            catalog.save()
+
+            # New files and floats are found after a refresh
+            profiles = os.path.join(ftp, "dac", "coriolis", "6901929", "profiles")
+            time.sleep(0.01)
+            open(os.path.join(profiles, "R6901929_003.nc"), "w").close()
+            os.remove(os.path.join(profiles, "R6901929_001.nc"))
+            os.makedirs(os.path.join(ftp, "dac", "bodc", "3901000"))
+            open(os.path.join(ftp, "dac", "bodc", "3901000", "3901000_prof.nc"), "w").close()
+            catalog.refresh()
+            assert len(catalog.files(6901929, 3)) == 1 and catalog.files(6901929, 1) == []
+            assert len(catalog.files(3901000)) == 1
+            shutil.rmtree(os.path.join(ftp, "dac", "aoml"))
+            assert catalog.refresh().files(1901393) == []
+
+            # Saved catalog is re-used
+            saved = gdaccatalog(ftp, cachedir=self.testcachedir)
+            assert 1901393 in saved.floats and saved.floats[6901929]['mtime'] is not None
+            assert saved.refresh().files(1901393) == []
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+
 
 class IndexFilter_WMO(TestCase):
     kwargs = [{'WMO': 6901929},
@@ -167,6 +774,43 @@ class IndexFilter_WMO(TestCase):
                 else:
                     assert results is None
 
+    def test_filters_run_wmotable(self):
+        ftproot, flist = argopy.tutorial.open_dataset('localftp')
+        index_file = os.path.sep.join([ftproot, "ar_index_global_prof.txt"])
+        wmo_table = indexwmotable(index_file).open()
+        for kw in self.kwargs:
+            filt = indexfilter_wmo(**kw)
+            with open(index_file, "r") as f:
+                assert filt.run(f) == filt.run(f, wmo_table=wmo_table)
+
+
+class IndexWmoTable(TestCase):
+    ftproot, flist = argopy.tutorial.open_dataset('localftp')
+    index_file = os.path.sep.join([ftproot, "ar_index_global_prof.txt"])
+    testcachedir = os.path.expanduser(os.path.join("~", ".argopytest_tmp"))
+
+    def test_blocks(self):
+        tbl = indexwmotable(self.index_file).open()
+        offset, row, count = tbl.blocks(6901929)
+        assert len(offset) == 1 and count[0] > 0
+        with open(self.index_file, "r") as f:
+            f.seek(offset[0])
+            assert "/6901929/" in f.readline()
+        assert len(tbl.rows(6901929)) == count[0]
+        assert len(tbl.rows(0)) == 0
+
+    def test_persistence(self):
+        try:
+            tbl = indexwmotable(self.index_file, cachedir=self.testcachedir)
+            assert tbl.is_stale()
+            tbl.open()
+            assert os.path.exists(tbl.path)
+            assert not indexwmotable(self.index_file, cachedir=self.testcachedir).is_stale()
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+
 
 class IndexStore(TestCase):
     ftproot, flist = argopy.tutorial.open_dataset('localftp')
@@ -201,3 +845,313 @@ class IndexStore(TestCase):
         for kw in self.kwargs_box:
             df = indexstore(cache=0, index_file=self.index_file).open_dataframe(indexfilter_box(**kw))
             assert isinstance(df, pd.core.frame.DataFrame)
+
+    def test_search_sidecar(self):
+        try:
+            for kw in self.kwargs_wmo:
+                filt = indexfilter_wmo(**kw)
+                df_txt = indexstore(cache=0, index_file=self.index_file, engine='text').open_dataframe(filt)
+                df_bin = indexstore(cache=1, cachedir=self.testcachedir, index_file=self.index_file).open_dataframe(filt)
+                assert df_txt.equals(df_bin)
+            for kw in self.kwargs_box:
+                filt = indexfilter_box(**kw)
+                df_txt = indexstore(cache=0, index_file=self.index_file, engine='text').open_dataframe(filt)
+                df_bin = indexstore(cache=1, cachedir=self.testcachedir, index_file=self.index_file).open_dataframe(filt)
+                assert df_txt.equals(df_bin)
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+
+    def test_update(self):
+        index_file = os.path.join(self.testcachedir, "ar_index_global_prof.txt")
+        delta_file = os.path.join(self.testcachedir, "ar_index_this_week_prof.txt")
+        try:
+            os.makedirs(self.testcachedir)
+            shutil.copy(self.index_file, index_file)
+            write_index_delta(index_file, delta_file)
+            fs = indexstore(cache=1, cachedir=self.testcachedir, index_file=index_file)
+            wmo = int(fs.sidecar.open().to_dataframe([10])['file'][0].split("/")[1])
+            with pytest.raises(DataNotFound):
+                fs.open_dataframe(indexfilter_box(BOX=[19.5, 20.5, 9.5, 10.5]))
+            nprof = len(fs.open_dataframe(indexfilter_wmo(WMO=wmo)))
+            fs.open_dataframe(indexfilter_wmo(WMO=6901929))
+            rows = fs.update(delta_file)
+            assert len(rows) == 2
+            assert indexfilter_wmo(WMO=wmo).sha not in fs.search_cache  # Invalidated
+            assert indexfilter_wmo(WMO=6901929).sha in fs.search_cache  # Preserved
+            assert len(fs.open_dataframe(indexfilter_box(BOX=[19.5, 20.5, 9.5, 10.5]))) == 1
+            assert len(fs.open_dataframe(indexfilter_wmo(WMO=wmo))) == nprof + 1
+            with pytest.raises(ValueError):
+                indexstore(index_file=index_file, engine='text').update(delta_file)
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+
+    def test_index_file_replaced(self):
+        index_file = os.path.join(self.testcachedir, "ar_index_global_prof.txt")
+        try:
+            os.makedirs(self.testcachedir)
+            shutil.copy(self.index_file, index_file)
+            filt = indexfilter_wmo(WMO=6901929)
+            assert len(indexstore(cache=1, cachedir=self.testcachedir, index_file=index_file).open_dataframe(filt)) > 0
+            with open(index_file, "r") as f:
+                lines = [line for line in f.readlines() if "/6901929/" not in line]
+            with open(index_file, "w") as f:
+                f.write("".join(lines))
+            fs = indexstore(cache=1, cachedir=self.testcachedir, index_file=index_file)
+            with pytest.raises(DataNotFound):
+                fs.open_dataframe(filt)  # Cached results of the previous index file are not used
+            assert filt.sha not in fs.search_cache
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+
+    def test_res2dataframe(self):
+        results = "aoml/13857/profiles/R13857_001.nc,19970729200300,0.267,-16.032,A,845,AO,20080918131927\n" \
+                  "aoml/13857/profiles/R13857_002.nc,,,,,,,\n" \
+                  "aoml/13857/profiles/R13857_003.nc,19970818103600,0.072,-17.659,A,,AO,20080918131929\n"
+        df = indexstore(index_file=self.index_file).res2dataframe(results)
+        assert len(df) == 3  # Rows with missing values are kept
+        assert pd.isnull(df['profiler_type'][2])
+        assert [profiler_code(x) for x in df['profiler_type']] == [845, "?", "?"]
+        assert df['date'].dtype == np.dtype('datetime64[ns]')
+        assert df['date'][0] == pd.Timestamp('1997-07-29 20:03:00')
+        assert pd.isnull(df['date'][1]) and np.isnan(df['latitude'][1]) and pd.isnull(df['ocean'][1])
+        for col in ['ocean', 'profiler_type', 'institution']:
+            assert df[col].dtype == 'category'
+
+    def test_search_parallel(self):
+        header, bounds = index_chunks(self.index_file, 7)
+        with open(self.index_file, "rb") as f:
+            raw = f.read()
+        assert b"".join([raw[a:b] for a, b in bounds]) == raw[len(header):]
+        assert all([raw[b - 1:b] == b"\n" for a, b in bounds])
+        for kw in [{'CYC': [1, 6]}, {}]:
+            filt = indexfilter_wmo(**kw)
+            df = indexstore(cache=0, index_file=self.index_file, engine='text').open_dataframe(filt)
+            with argopy.set_options(index_workers=2):
+                assert df.equals(indexstore(cache=0, index_file=self.index_file, engine='text').open_dataframe(filt))
+        for kw in self.kwargs_box:
+            filt = indexfilter_box(**kw)
+            fs = indexstore(cache=0, index_file=self.index_file, engine='text', workers=2)
+            with fs.open_index() as f:
+                assert fs.run_parallel(filt, nchunks=5) == filt.run(f)
+
+    def test_engines(self):
+        with pytest.raises(ValueError):
+            indexstore(index_file=self.index_file, engine='invalid')
+        for kw in self.kwargs_box:
+            filt = indexfilter_box(**kw)
+            with argopy.set_options(index_engine='text'):
+                fs = indexstore(cache=0, index_file=self.index_file)
+                assert fs.sidecar is None
+                df_txt = fs.open_dataframe(filt)
+            with argopy.set_options(index_engine='numpy'):
+                fs = indexstore(cache=0, index_file=self.index_file)
+                assert fs.sidecar.path is None  # In memory
+                df_bin = fs.open_dataframe(filt)
+            assert df_txt.equals(df_bin)
+
+
+class IndexSidecar(TestCase):
+    ftproot, flist = argopy.tutorial.open_dataset('localftp')
+    index_file = os.path.sep.join([ftproot, "ar_index_global_prof.txt"])
+    testcachedir = os.path.expanduser(os.path.join("~", ".argopytest_tmp"))
+
+    def test_build(self):
+        try:
+            sc = indexsidecar(self.index_file, cachedir=self.testcachedir)
+            assert sc.is_stale()
+            sc.open()
+            assert not sc.is_stale()
+            assert isinstance(sc['latitude'], np.memmap)
+            df = sc.to_dataframe(np.arange(0, len(sc)))
+            assert isinstance(df, pd.core.frame.DataFrame)
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+
+    def test_grid(self):
+        try:
+            sc = indexsidecar(self.index_file, cachedir=self.testcachedir).open()
+            lon, lat = np.asarray(sc['longitude']), np.asarray(sc['latitude'])
+            for box in [[-60, -40, 40., 60.], [-55.5, -55.2, 41.1, 42.3], [170, 180, -90, -80]]:
+                rows = sc.grid_candidates(box[0:2], box[2:4])
+                inside = np.flatnonzero((lon >= box[0]) & (lon <= box[1]) & (lat >= box[2]) & (lat <= box[3]))
+                assert np.all(np.isin(inside, rows))
+            assert sc.grid_candidates([-180, 180], [-90, 90]) is None
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+
+    def test_time_partitions(self):
+        try:
+            sc = indexsidecar(self.index_file, cachedir=self.testcachedir).open()
+            dates = np.asarray(sc['date'])
+            for tim in [['2007-08-01', '2007-09-01'], ['2007-08-01 12:00', '2007-08-01 18:00'], ['2030-01-01', '2031-01-01']]:
+                tim = pd.to_datetime(tim).values.astype('datetime64[s]').view(np.int64)
+                inside = np.flatnonzero((dates != np.iinfo(np.int64).min) & (dates >= tim[0]) & (dates <= tim[1]))
+                assert np.array_equal(sc.time_candidates(tim), inside)
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+
+    def test_rebuild(self):
+        index_file = os.path.join(self.testcachedir, "ar_index_global_prof.txt")
+        try:
+            os.makedirs(self.testcachedir)
+            shutil.copy(self.index_file, index_file)
+            sc = indexsidecar(index_file, cachedir=self.testcachedir).open()
+            nrows = len(sc)
+            with open(index_file, "a") as f:
+                f.write(sc.to_text([0]))
+            assert sc.is_stale()
+            assert len(sc.open()) == nrows + 1
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+
+    def test_in_memory(self):
+        sc = indexsidecar(self.index_file).open()
+        assert sc.path is None
+        assert not sc.is_stale()
+        assert indexsidecar(self.index_file)['latitude'] is sc['latitude']  # Shared by all instances
+
+    def test_merge(self):
+        index_file = os.path.join(self.testcachedir, "ar_index_global_prof.txt")
+        delta_file = os.path.join(self.testcachedir, "ar_index_this_week_prof.txt")
+        merged_file = os.path.join(self.testcachedir, "merged.txt")
+        try:
+            os.makedirs(self.testcachedir)
+            shutil.copy(self.index_file, index_file)
+            lines = write_index_delta(index_file, delta_file)
+            with open(index_file, "r") as f:
+                header = [line for line in f.readlines() if line.startswith("#") or line.startswith("file,")]
+            with open(merged_file, "w") as f:
+                f.write("".join(header + lines))
+            sc = indexsidecar(index_file, cachedir=self.testcachedir).open()
+            nrows = len(sc)
+            assert np.array_equal(sc.merge(delta_file), [10, nrows])
+            assert not sc.is_stale()
+            assert len(sc.merge(delta_file)) == 0  # Nothing more recent
+            ref = indexsidecar(merged_file).open()
+            sc = indexsidecar(index_file, cachedir=self.testcachedir).open()
+            rows = np.arange(0, len(ref))
+            assert sc.to_text(rows) == ref.to_text(rows)
+            assert sc.to_dataframe(rows).equals(ref.to_dataframe(rows))
+            for col in ['wmo', 'cyc', 'grid_rows', 'grid_start', 'time_rows', 'time_start']:
+                assert np.array_equal(sc[col], ref[col])
+            wmo = sc['wmo'][nrows]
+            assert np.array_equal(sc.wmo_rows(wmo), ref.wmo_rows(wmo))
+            for by in ['dac', 'ocean', 'profiler_type', 'institution', 'month', 'wmo']:
+                assert sc.aggregate(by).equals(ref.aggregate(by))
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+
+    def test_aggregate(self):
+        sc = indexsidecar(self.index_file).open()
+        df = sc.to_dataframe(np.arange(0, len(sc)))
+        df['dac'] = df['file'].apply(lambda x: x.split("/")[0])
+        df['wmo'] = df['file'].apply(lambda x: int(x.split("/")[1]))
+        for by in ['dac', 'ocean', 'profiler_type', 'institution']:
+            counts = df.groupby(by).size()
+            assert np.array_equal(sc.aggregate(by).values, counts[counts > 0].values)
+        assert np.array_equal(sc.aggregate('month').values, df.groupby(df['date'].dt.to_period('M')).size().values)
+        floats = df.groupby('wmo').agg(count=('file', 'size'), first_date=('date', 'min'), last_date=('date', 'max'))
+        assert sc.aggregate('wmo').equals(floats)
+        with pytest.raises(ValueError):
+            sc.aggregate('invalid')
+
+
+class IndexSearchCache(TestCase):
+    testcachedir = os.path.expanduser(os.path.join("~", ".argopytest_tmp"))
+
+    def test_lru(self):
+        try:
+            cache = indexsearchcache(self.testcachedir, max_entries=2, max_disk_entries=3)
+            cache.reset_stats()
+            assert cache.get("a") is None
+            for t, sha in enumerate(["a", "b", "c"]):
+                cache.put(sha, "results of %s\n" % sha, indexfilter_wmo(WMO=6901929))
+                os.utime(cache.cachepath(sha), (t, t))
+            assert "a" not in cache.memory  # Evicted from the in-process tier
+            assert cache.get("a") == "results of a\n"  # but found on disk
+            assert "b" not in cache.memory  # "b" is now the least recently used
+            cache.put("d", "results of d\n")
+            assert "b" not in cache  # Evicted from both tiers
+            assert isinstance(cache.search("c"), indexfilter_wmo)
+            assert cache.search("d") is None
+            assert cache.stats() == {'hits': 1, 'memory_hits': 0, 'disk_hits': 1, 'misses': 1,
+                                     'evictions': 3, 'disk_evictions': 1, 'entries': 2, 'bytes': 26}
+            cache.remove("c")
+            assert "c" not in cache
+            with pytest.raises(CacheFileNotFound):
+                cache.cachepath("c")
+            cache.clear()
+            assert len(cache.keys()) == 0
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+
+    def test_max_bytes(self):
+        try:
+            cache = indexsearchcache(self.testcachedir, max_bytes=10, max_disk_bytes=20)
+            cache.put("a", "x" * 8)
+            cache.put("b", "x" * 8)
+            assert list(cache.memory.keys()) == ["b"]
+            os.utime(cache.cachepath("a"), (0, 0))  # Make sure "a" is the least recently used on disk
+            cache.put("c", "x" * 8)
+            assert cache.keys() == ["b", "c"]
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+
+    def test_indexstore(self):
+        ftproot, flist = argopy.tutorial.open_dataset('localftp')
+        index_file = os.path.sep.join([ftproot, "ar_index_global_prof.txt"])
+        try:
+            fs = indexstore(cache=1, cachedir=self.testcachedir, index_file=index_file)
+            filt = indexfilter_wmo(WMO=6901929)
+            df = fs.open_dataframe(filt)
+            stats = fs.search_cache.stats()
+            assert df.equals(fs.open_dataframe(filt))
+            assert fs.search_cache.stats()['memory_hits'] == stats['memory_hits'] + 1
+            assert isinstance(fs.cachepath(filt.uri()), str)
+            fs.clear_cache()
+            assert filt.sha not in fs.search_cache
+            shutil.rmtree(self.testcachedir)
+        except Exception:
+            shutil.rmtree(self.testcachedir)
+            raise
+
+
+@unittest.skipUnless(with_shared_memory, "requires python 3.8 or later")
+class SharedMemory(TestCase):
+
+    def test_attach_dataset(self):
+        shared = _share_points(6901929)
+        assert 'data' in [e for e in shared['variables'] if e['name'] == 'COMMENT'][0]  # Pickled
+        ds = attach_dataset(shared)
+        xr.testing.assert_identical(ds, _points(6901929))
+        with pytest.raises(FileNotFoundError):
+            attach_dataset(shared)  # Already unlinked
+        ds = attach_dataset(share_dataset(_points(1).isel(N_POINTS=slice(0, 0))))
+        assert len(ds['N_POINTS']) == 0
+
+    def test_attach_from_workers(self):
+        start_tracker()
+        with multiprocessing.Pool(2) as pool:
+            results = [attach_dataset(shared) for shared in pool.imap(_share_points, [1, 2, 3])]
+        for wmo, ds in zip([1, 2, 3], results):
+            xr.testing.assert_identical(ds, _points(wmo))
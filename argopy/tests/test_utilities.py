@@ -1,5 +1,6 @@
 import os
 import io
+import time
 import pytest
 import unittest
 import argopy
@@ -42,6 +43,15 @@ def test_show_versions():
 def test_isconnected():
     assert isinstance(isconnected(), bool)
     assert isconnected(host="http://dummyhost") is False
+    with argopy.set_options(offline=True):
+        assert isconnected() is False
+
+
+def test_isconnected_memoized():
+    assert isconnected(host="http://dummyhost") is False
+    argopy.utilities._connections["http://dummyhost"] = (time.time(), True)
+    assert isconnected(host="http://dummyhost") is True  # Memoized
+    assert isconnected(host="http://dummyhost", ttl=0) is False
 
 
 def test_erddap_ds_exists():
@@ -8,6 +8,7 @@
 
 import os
 import sys
+import time
 import warnings
 import urllib.request
 import json
@@ -336,23 +337,41 @@ def show_versions(file=sys.stdout):
         print(f"{k}: {stat}", file=file)
 
 
-def isconnected(host='http://www.ifremer.fr'):
+_connections = {}
+""" Last connection tests, by host: time and result """
+
+
+def isconnected(host='http://www.ifremer.fr', ttl: float = 30, timeout: float = 10):
     """ Determine if we have a live internet connection
 
+        The result is memoized for a short time, so that repeated calls don't wait for the network. In offline mode,
+        there is no connection.
+
         Parameters
         ----------
         host: str
             URL to use, 'http://www.ifremer.fr' by default
+        ttl: float (30)
+            Number of seconds the result of a test is re-used, 0 to always test the connection
+        timeout: float (10)
+            Number of seconds to wait for the host
 
         Returns
         -------
         bool
     """
+    if OPTIONS['offline']:
+        return False
+    last = _connections.get(host)
+    if last is not None and time.time() - last[0] < ttl:
+        return last[1]
     try:
-        urllib.request.urlopen(host)  # Python 3.x
-        return True
+        urllib.request.urlopen(host, timeout=timeout)  # Python 3.x
+        connected = True
     except Exception:
-        return False
+        connected = False
+    _connections[host] = (time.time(), connected)
+    return connected
 
 
 def erddap_ds_exists(ds="ArgoFloats"):
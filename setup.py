@@ -21,6 +21,9 @@ setuptools.setup(
     package_dir={'argopy': 'argopy'},
     package_data={'argopy': ['assets/*.pickle']},
     install_requires=requirements,
+    entry_points={
+        'console_scripts': ['argopy-prefetch=argopy.prefetcher:main'],
+    },
     classifiers=[
         "Programming Language :: Python :: 3.6",
         "Programming Language :: Python :: 3.7",